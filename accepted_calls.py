@@ -9,25 +9,35 @@ This script processes accepted calls from RingCentral and creates/updates leads
 import os
 import sys
 import json
+import time
 import logging
 import argparse
 import datetime
-import itertools
 from common import (
     RingCentralClient, 
     ZohoClient, 
     SecureStorage, 
     LogExporter,
+    RunCheckpoint,
+    RunInstrumentation,
+    RunProfiler,
+    bind_instrumentation,
+    stage_timer,
+    record_call_to_lead,
     normalize_phone_number,
     format_call_time,
     setup_logging,
+    get_call_logger,
     parse_arguments,
     get_date_range,
     check_and_install_dependencies
 )
-
-# Check dependencies before importing other modules
-check_and_install_dependencies()
+from outbox import ZohoOutbox
+from lead_assignment import LeadOwnerAllocator
+from call_queue import CallQueue, DeferredCalls, DEFAULT_PRIORITY_RULES, drain_queue, parse_priority_rules
+from coordination import state_db_path
+from metrics import write_textfile_metrics
+from run_history import record_run
 
 class CallQualifier:
     """Class to determine if a call should be processed as a lead."""
@@ -36,18 +46,315 @@ class CallQualifier:
         self.lead_owners = lead_owners
         self.debug = debug
         self.logger = logging.getLogger("CallQualifier")
+        self.owner_names = {owner.get("name", "").strip().lower() for owner in lead_owners if owner.get("name")}
+        self.owner_extension_ids = {str(owner["extension_id"]) for owner in lead_owners if owner.get("extension_id")}
+    
+    def _accepted_by_owner(self, party):
+        if party.get("result") != "Accepted":
+            return False
+        
+        recipient = party.get("to", {})
+        extension_id = str(party.get("extension", {}).get("id") or recipient.get("extensionId") or "")
         
+        if recipient.get("name", "").strip().lower() in self.owner_names:
+            return True
+        return bool(extension_id) and extension_id in self.owner_extension_ids
+    
     def qualify_call(self, call):
         """
         Determine if a call qualifies for lead creation/update.
         A call is qualified if:
         1. It has at least one leg with a result of 'Accepted'
         2. The recipient of the accepted leg matches a configured lead owner by name or extension ID.
+        Simple view records have no legs, so the call's own result and recipient are checked instead.
+        """
+        legs = call.get("legs")
+        if legs is None:
+            return self._accepted_by_owner(call)
+        return any(self._accepted_by_owner(leg) for leg in legs)
+    
+    def summary_view_suffices(self, extension):
         """
-        # Implementation for call qualification
-        return True
+        Whether calls of an extension can be qualified from the Simple view.
+        
+        Calls in a lead owner's own call log qualify without their legs, so only
+        the other extensions need the larger Detailed records.
+        """
+        if str(extension.get("id")) in self.owner_extension_ids:
+            return True
+        return extension.get("name", "").strip().lower() in self.owner_names
+
+def _build_call_note(call, caller_number, call_time, has_recording):
+    """
+    Build the note title and body recorded on a lead for an accepted call.
+    
+    Returns:
+        tuple: (note_title, note_content)
+    """
+    note_title = f"Accepted Call - {call_time}"
+    note_content = f"Accepted call at {call_time}\n"
+    note_content += f"Caller: {call.get('from', {}).get('name', 'Unknown')} <{caller_number}>\n"
+    note_content += f"Call ID: {call.get('id', 'unknown')}\n"
+    
+    if has_recording:
+        note_content += "Call recording attached"
+    
+    return note_title, note_content
+
+def _get_recording_id(call):
+    """Return the recording ID of a call, checking the call and then its legs."""
+    recording = call.get("recording") or {}
+    if recording.get("id"):
+        return recording["id"]
+    
+    for leg in call.get("legs", []):
+        recording = leg.get("recording") or {}
+        if recording.get("id"):
+            return recording["id"]
+    
+    return None
+
+# Undecided calls fetched in their own narrow windows; more than this refetch the page's span instead
+DETAIL_WINDOW_LIMIT = 5
+
+def _add_call_details(rc_client, qualifier, extension_id, call_logs):
+    """
+    Swap Simple view records that do not qualify on their own for their Detailed records.
+    
+    Each undecided call is fetched in a one-second window around its start
+    time, so only those calls are downloaded again. When that would take more
+    than DETAIL_WINDOW_LIMIT requests, the page's own time span is fetched in
+    Detailed instead, which costs no more than fetching it in Detailed to begin with.
+    
+    Returns:
+        tuple: (call records, number of records swapped)
+    """
+    def start_second(call):
+        return datetime.datetime.fromisoformat(call["startTime"].replace("Z", "+00:00")).replace(microsecond=0)
+    
+    undecided = [call for call in call_logs if not qualifier.qualify_call(call)]
+    seconds = sorted({start_second(call) for call in undecided if call.get("startTime")})
+    if not seconds:
+        return call_logs, 0
+    
+    # dateTo is exclusive, so each window ends one second after the calls it covers
+    one_second = datetime.timedelta(seconds=1)
+    if len(seconds) <= DETAIL_WINDOW_LIMIT:
+        windows = [(second, second + one_second) for second in seconds]
+    else:
+        page_seconds = [start_second(call) for call in call_logs if call.get("startTime")]
+        windows = [(min(page_seconds), max(page_seconds) + one_second)]
+    
+    detailed = {}
+    with stage_timer("fetch"):
+        for window_start, window_end in windows:
+            for call in rc_client.get_call_logs(
+                extension_id,
+                window_start.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                window_end.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                direction="Inbound",
+                type="Voice",
+                result="Accepted",
+                view="Detailed"
+            ):
+                detailed[call.get("id")] = call
+    
+    swapped = sum(1 for call in undecided if call.get("id") in detailed)
+    return [detailed.get(call.get("id"), call) for call in call_logs], swapped
+
+def _log_call_to_lead(zoho_client, rc_client, outbox, office_id, lead_id, call, caller_number, call_time,
+                      recording_id, stats):
+    """
+    Add the call note and recording to a lead, queueing anything Zoho rejects.
+    
+    Args:
+        zoho_client (ZohoClient): Zoho client
+        rc_client (RingCentralClient): RingCentral client
+        outbox (ZohoOutbox): Outbox for failed Zoho writes
+        office_id (str): Office identifier
+        lead_id (str): Zoho lead ID
+        call (dict): RingCentral call log record
+        caller_number (str): Normalized caller number
+        call_time (str): Formatted call time
+        recording_id (str): RingCentral recording ID or None
+        stats (dict): Processing statistics
+    """
+    call_id = call.get("id", "unknown")
+    
+    # Add note with call details
+    with stage_timer("note"):
+        note_title, note_content = _build_call_note(call, caller_number, call_time, bool(recording_id))
+        note = outbox.submit(
+            zoho_client,
+            ZohoOutbox.make_key("accepted_calls", call_id, "add_note"),
+            "add_note",
+            {"lead_id": lead_id, "content": note_content, "title": note_title, "call_id": call_id},
+            office_id
+        )
+    if note:
+        record_call_to_lead(call)
+    else:
+        stats["queued_for_retry"] += 1
+    
+    # Attach recording if available
+    if recording_id:
+        with stage_timer("media"):
+            recording_content = rc_client.get_recording_content(recording_id)
+            if recording_content:
+                attachment = outbox.submit(
+                    zoho_client,
+                    ZohoOutbox.make_key("accepted_calls", call_id, "attach_audio"),
+                    "attach_audio",
+                    {
+                        "lead_id": lead_id,
+                        "call": call,
+                        "content_type": "audio/mpeg",
+                        "call_time": call_time,
+                        "file_type": "recording"
+                    },
+                    office_id,
+                    recording_content
+                )
+                if attachment and attachment.get("duplicate"):
+                    stats["duplicate_attachments_skipped"] += 1
+                elif attachment:
+                    stats["call_recording_attachments"] += 1
+                else:
+                    stats["queued_for_retry"] += 1
+
+def process_call(call, rc_client, zoho_client, outbox, qualifier, office_id, lead_owner_cycle, stats, dry_run=False,
+                 lead_templates=None):
+    """
+    Process a single accepted call into Zoho CRM.
+    
+    Args:
+        call (dict): RingCentral call log record
+        rc_client (RingCentralClient): RingCentral client
+        zoho_client (ZohoClient): Zoho client
+        outbox (ZohoOutbox): Outbox for failed Zoho writes
+        qualifier (CallQualifier): Decides whether the call becomes a lead
+        office_id (str): Office identifier
+        lead_owner_cycle (iterator): Lead owners for weighted round-robin assignment, e.g. a LeadOwnerAllocator
+        stats (dict): Processing statistics
+        dry_run (bool): Run without making changes to Zoho
+        lead_templates (LeadTemplates): Compiled field mappings; loaded from the configuration when omitted
+    """
+    logger = logging.getLogger("accepted_calls")
+    call_logger = get_call_logger("accepted_calls")
+    
+    stats["total_calls_processed"] += 1
+    
+    if not qualifier.qualify_call(call):
+        return
+    stats["qualified_calls"] += 1
+    
+    # Extract caller information
+    with stage_timer("normalize"):
+        caller_number = normalize_phone_number(call.get("from", {}).get("phoneNumber", ""))
+        call_time = format_call_time(call.get("startTime", ""))
+    
+    if not caller_number:
+        logger.warning("Skipping call %s with no caller number", call['id'])
+        return
+    
+    call_id = call.get("id", "unknown")
+    recording_id = _get_recording_id(call)
+    
+    # Calls with queued operations are finished by the outbox drain
+    with stage_timer("dedupe"):
+        has_pending = outbox.has_pending("accepted_calls", call_id)
+    if has_pending:
+        call_logger.debug(call_id, "Skipping call %s with operations pending in the outbox", call_id)
+        return
+    
+    # Skip processing if in dry-run mode
+    if dry_run:
+        call_logger.debug(call_id, "DRY RUN: Would process accepted call %s", call_id)
+        return
+    
+    # Search for existing lead by phone number
+    with stage_timer("resolve"):
+        existing_lead = zoho_client.search_by_phone(caller_number)
+    
+    if existing_lead:
+        lead_id = existing_lead.get("id")
+        call_logger.debug(call_id, "Found existing lead %s for caller %s", lead_id, caller_number)
+        stats["existing_leads_updated"] += 1
+        
+        # Check for existing notes for this call to prevent duplicates
+        with stage_timer("dedupe"):
+            existing_notes = zoho_client.get_lead_notes(lead_id)
+        
+        if existing_notes:
+            has_note_for_call = any(f"Call ID: {call_id}" in note.get("Note_Content", "") for note in existing_notes)
+            if has_note_for_call:
+                call_logger.debug(call_id, "Skipping note creation for call %s as it already exists", call_id)
+                return
+        
+        _log_call_to_lead(
+            zoho_client, rc_client, outbox, office_id, lead_id, call,
+            caller_number, call_time, recording_id, stats
+        )
+    
+    else:
+        # Create new lead
+        lead_owner = next(lead_owner_cycle)
+        
+        build_lead = (lead_templates or SecureStorage().load_lead_templates()).builder("accepted_calls", "accepted_call")
+        lead_data = build_lead({
+            "Company": call.get("from", {}).get("name", "Unknown Caller"),
+            "First_Name": "",
+            "Last_Name": "Unknown Caller",
+            "Phone": caller_number
+        }, lead_owner_id=lead_owner["id"])
+        
+        with stage_timer("create"):
+            new_lead = zoho_client.create_lead(lead_data)
+        
+        if new_lead:
+            lead_id = new_lead["id"]
+            call_logger.debug(call_id, "Created new lead %s for caller %s", lead_id, caller_number)
+            stats["new_leads_created"] += 1
+            
+            _log_call_to_lead(
+                zoho_client, rc_client, outbox, office_id, lead_id, call,
+                caller_number, call_time, recording_id, stats
+            )
+        else:
+            # Zoho did not accept the lead; park the whole chain in the outbox
+            recording_content = rc_client.get_recording_content(recording_id) if recording_id else None
+            note_title, note_content = _build_call_note(call, caller_number, call_time, bool(recording_id))
+            
+            followups = [{
+                "key": ZohoOutbox.make_key("accepted_calls", call_id, "add_note"),
+                "operation": "add_note",
+                "payload": {"content": note_content, "title": note_title, "call_id": call_id}
+            }]
+            if recording_content:
+                followups.append({
+                    "key": ZohoOutbox.make_key("accepted_calls", call_id, "attach_audio"),
+                    "operation": "attach_audio",
+                    "payload": {
+                        "call": call,
+                        "content_type": "audio/mpeg",
+                        "call_time": call_time,
+                        "file_type": "recording"
+                    }
+                })
+            
+            outbox.enqueue(
+                ZohoOutbox.make_key("accepted_calls", call_id, "create_lead"),
+                "create_lead",
+                {"lead_data": lead_data, "caller_number": caller_number, "call_id": call_id, "followups": followups},
+                office_id,
+                recording_content,
+                "Lead creation failed"
+            )
+            stats["queued_for_retry"] += 1
 
-def process_office(office_id, hours_back=24, debug=False, dry_run=False):
+def process_office(office_id, hours_back=24, debug=False, dry_run=False, resume=False, slices=1,
+                   profile=False, profile_top=25, rc_client=None, zoho_client=None, deadline=None,
+                   priority_rules=None, lease=None, progress=None):
     """
     Process accepted calls for a specific office.
     
@@ -56,14 +363,27 @@ def process_office(office_id, hours_back=24, debug=False, dry_run=False):
         hours_back (int): Hours to look back for calls
         debug (bool): Enable debug logging
         dry_run (bool): Run without making changes to Zoho
-        
+        resume (bool): Continue from the last checkpoint of an interrupted run
+        slices (int): Number of time slices the call log window is fetched in concurrently
+        profile (bool): Write cProfile and tracemalloc reports next to the stats
+        profile_top (int): Entries in the profile summaries
+        rc_client (RingCentralClient): Existing client to reuse, e.g. from the daemon
+        zoho_client (ZohoClient): Existing client to reuse, e.g. from the daemon
+        deadline (float): time.time() after which no further call is started; the rest are deferred
+        priority_rules (iterable): Order calls are processed in, e.g. ("voicemail", "newest");
+            defaults to global_config processing.priority_rules
+        lease (Lease): Office lease held when offices are shared between nodes; processing
+            stops, and outbox and deferred call writes are refused, once it is lost
+        progress (callable): Called with the statistics dict as soon as it is created; the dict
+            is updated as each call is processed, e.g. for showing a job's progress
+    
     Returns:
         dict: Processing statistics
     """
     # Set up logging
     logger = setup_logging("accepted_calls", debug)
-    logger.info(f"Starting accepted calls processing for office: {office_id}")
-    logger.info(f"Looking back {hours_back} hours")
+    logger.info("Starting accepted calls processing for office: %s", office_id)
+    logger.info("Looking back %s hours", hours_back)
     
     if dry_run:
         logger.info("DRY RUN MODE: No changes will be made to Zoho")
@@ -75,46 +395,262 @@ def process_office(office_id, hours_back=24, debug=False, dry_run=False):
         "new_leads_created": 0,
         "existing_leads_updated": 0,
         "call_recording_attachments": 0,
+        "duplicate_attachments_skipped": 0,
+        "queued_for_retry": 0,
+        "deferred_calls": 0,
+        "dead_calls": 0,
+        "detailed_refetches": 0,
         "errors": 0,
         "start_time": datetime.datetime.now().isoformat(),
         "office_id": office_id,
         "hours_back": hours_back
     }
+    if progress is not None:
+        progress(stats)
     
-    try:
-        # Implementation for processing calls for an office
-        # ...
+    # Time stages and account API requests made while processing this office
+    instrumentation = RunInstrumentation()
+    profiler = RunProfiler(profile, profile_top)
+    profiler.start()
+    
+    outbox = None
+    lead_owner_cycle = None
+    with bind_instrumentation(instrumentation):
+        try:
+            # Initialize services
+            storage = SecureStorage(debug)
+            
+            # Load configuration
+            extensions = storage.load_extensions(office_id)
+            lead_owners = storage.load_lead_owners(office_id)
+            lead_templates = storage.load_lead_templates()
+            
+            # Initialize clients unless warm ones were handed in
+            if rc_client is None or zoho_client is None:
+                credentials = storage.load_credentials()
+                rc_client = rc_client or RingCentralClient(credentials["ringcentral"], debug)
+                zoho_client = zoho_client or ZohoClient(
+                    credentials["zoho"], debug,
+                    seed_attachments=storage.load_global_config().get("attachments", {}).get("seed_existing", False)
+                )
+            qualifier = CallQualifier(lead_owners, debug)
+            
+            # Retry Zoho writes that failed on previous runs before fetching new calls
+            coordination_config = storage.load_global_config().get("coordination")
+            outbox = ZohoOutbox(state_db_path("outbox.db", coordination_config), debug=debug, lease=lease)
+            if not dry_run:
+                stats["outbox_drain"] = outbox.drain(zoho_client, office_id)
+            
+            # Weighted rotation of lead owners, continued from the office's previous runs and
+            # reserved in blocks, so new leads do not each write to the rotation database
+            lead_owner_cycle = LeadOwnerAllocator(office_id, lead_owners, storage.load_assignment_rules(office_id),
+                                                  persist=not dry_run)
+            
+            # Get date range for call logs
+            start_date, end_date = get_date_range(hours_back)
+            
+            # Create log exporter
+            date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+            log_exporter = LogExporter("accepted_calls", office_id, date_str, debug)
+            
+            # Checkpoint progress so an interrupted run can resume at the last committed page
+            checkpoint = RunCheckpoint("accepted_calls", office_id, enabled=not dry_run)
+            state = checkpoint.start(start_date, end_date, hours_back, resume)
+            start_date, end_date = state["start_date"], state["end_date"]
+            
+            # Calls are queued as they are fetched and processed by priority afterwards; calls
+            # left over by an earlier run whose time budget ran out go first in line
+            if priority_rules is None:
+                priority_rules = storage.load_global_config().get("processing", {}).get(
+                    "priority_rules", DEFAULT_PRIORITY_RULES)
+            queue = CallQueue(priority_rules)
+            deferred = DeferredCalls("accepted_calls", office_id, state_db_path("deferred_calls.db", coordination_config),
+                                     enabled=not dry_run, lease=lease)
+            for call in deferred.load():
+                queue.push(call)
+            stats["deferred_loaded"] = len(queue)
+            if queue:
+                logger.info("Picked up %d calls deferred by an earlier run", len(queue))
+            
+            profiler.mark("setup")
+            
+            # Process each extension
+            for extension in extensions:
+                if lease is not None:
+                    lease.check()
+                
+                page = checkpoint.resume_point(extension['id'])
+                if page is None:
+                    logger.info("Extension %s already completed, skipping", extension['id'])
+                    continue
+                
+                logger.info("Processing extension: %s (ID: %s)", extension['name'], extension['id'])
+                
+                # Lead owners' own calls qualify from the lighter Simple view; other extensions'
+                # calls need their legs, and undecided Simple records are fetched again in Detailed
+                view = "Simple" if qualifier.summary_view_suffices(extension) else "Detailed"
+                
+                # Get accepted calls for this extension a page at a time
+                found_calls = False
+                if slices > 1:
+                    # The merged slices are treated as a single page for checkpointing
+                    with stage_timer("fetch"):
+                        pages = [(1, rc_client.get_call_logs_sliced(
+                            extension['id'],
+                            start_date,
+                            end_date,
+                            slices=slices,
+                            direction="Inbound",
+                            type="Voice",
+                            result="Accepted",
+                            view=view
+                        ))]
+                else:
+                    pages = rc_client.iter_call_log_pages(
+                        extension['id'], 
+                        start_date=start_date, 
+                        end_date=end_date, 
+                        direction="Inbound",
+                        type="Voice",
+                        result="Accepted",
+                        page=page,
+                        view=view
+                    )
+                    pages = instrumentation.iter_stage("fetch", pages)
+                
+                for page, call_logs in pages:
+                    if not call_logs:
+                        checkpoint.commit_page(extension['id'], page + 1)
+                        continue
+                    found_calls = True
+                    
+                    # Export raw call logs
+                    log_exporter.export_raw_logs(call_logs, "raw_call_logs")
+                    
+                    if view == "Simple":
+                        call_logs, swapped = _add_call_details(rc_client, qualifier, extension['id'], call_logs)
+                        stats["detailed_refetches"] += swapped
+                    
+                    # Save the page's calls before committing it, so none are lost if the run stops
+                    for call in deferred.add(call_logs):
+                        queue.push(call)
+                    
+                    checkpoint.commit_page(extension['id'], page + 1)
+                
+                if not found_calls:
+                    logger.info("No accepted calls found for extension %s", extension['id'])
+                
+                checkpoint.complete_extension(extension['id'])
+                profiler.mark(f"extension {extension['id']}")
+            
+            # Process queued calls by priority until the time budget runs out
+            logger.info("Processing %d queued calls by priority: %s", len(queue), ", ".join(queue.rules) or "fetch order")
+            stats["deferred_calls"] = drain_queue(
+                queue,
+                lambda call: process_call(call, rc_client, zoho_client, outbox, qualifier, office_id, lead_owner_cycle, stats,
+                                          dry_run, lead_templates),
+                deferred,
+                deadline,
+                stats,
+                lease
+            )
+            deferred.close()
+            profiler.mark("process")
+            if stats["deferred_calls"]:
+                logger.warning("Time budget ran out; %d calls deferred to the next run", stats["deferred_calls"])
+            
+            checkpoint.complete()
+            
+            # Capture backlog, rate limit, concurrency and cache state for the metrics exporter
+            stats["outbox_depth"] = outbox.depth(office_id)
+            stats["rate_limits"] = dict(rc_client.rate_limit_status(), **zoho_client.rate_limit_status())
+            stats["concurrency"] = dict(rc_client.concurrency_status(), **zoho_client.concurrency_status())
+            stats["cache"] = zoho_client.cache.stats()
+            
+            # Log completion
+            stats["end_time"] = datetime.datetime.now().isoformat()
+            stats["success"] = True
+            logger.info("Accepted calls processing completed for office: %s", office_id)
+            logger.info("Stats: %s", json.dumps(stats, indent=2))
         
-        # Log completion
-        stats["end_time"] = datetime.datetime.now().isoformat()
-        stats["success"] = True
-        logger.info(f"Accepted calls processing completed for office: {office_id}")
-        logger.info(f"Stats: {json.dumps(stats, indent=2)}")
+        except Exception as e:
+            logger.error("Error processing office %s: %s", office_id, e, exc_info=True)
+            stats["success"] = False
+            stats["error"] = str(e)
+            stats["end_time"] = datetime.datetime.now().isoformat()
         
-    except Exception as e:
-        logger.error(f"Error processing office {office_id}: {str(e)}", exc_info=True)
-        stats["success"] = False
-        stats["error"] = str(e)
-        stats["end_time"] = datetime.datetime.now().isoformat()
+        finally:
+            if outbox is not None:
+                outbox.close()
+            # Hands the unused owners of the reserved block back to the rotation
+            if lead_owner_cycle is not None:
+                lead_owner_cycle.close()
+    
+    stats["instrumentation"] = instrumentation.snapshot()
+    profiler.stop()
+    
+    # Export processing statistics
+    stats_path = None
+    if 'log_exporter' in locals():
+        stats["raw_logs"] = log_exporter.close()
+        if profile:
+            stats["profile"] = profiler.export(log_exporter)
+        stats_path = log_exporter.export_stats(stats, "processing_stats")
+    
+    # Index the run for the admin Reports tab and HTML reports
+    record_run("accepted_calls", office_id, stats, stats_path, dry_run)
+    
+    # Publish the run for the Prometheus textfile collector
+    write_textfile_metrics("accepted_calls", office_id, stats)
     
     return stats
 
 if __name__ == "__main__":
     # Parse command line arguments
     args = parse_arguments()
+    setup_logging("accepted_calls", args.debug, args.log_sample_rate)
+    
+    # Verified once per environment; later runs only read a marker file
+    if not check_and_install_dependencies(args.check_dependencies):
+        sys.exit(1)
+    
+    if args.record or args.replay:
+        from traffic import configure_traffic
+        configure_traffic(args.record, args.replay, args.replay_services.split(","), args.replay_speed)
     
     # Process single office or multiple offices based on arguments
     if args.office:
-        process_office(args.office, args.hours_back, args.debug, args.dry_run)
+        office_ids = [args.office]
     elif args.office_order:
-        offices = [o.strip() for o in args.office_order.split(',')]
-        for office in offices:
-            process_office(office, args.hours_back, args.debug, args.dry_run)
+        office_ids = [o.strip() for o in args.office_order.split(',')]
     elif args.all_offices:
         storage = SecureStorage(args.debug)
         offices = storage.load_office_list()
-        for office in sorted(offices, key=lambda o: o.get('processing_order', 999)):
-            process_office(office['id'], args.hours_back, args.debug, args.dry_run)
+        office_ids = [office['id'] for office in sorted(offices, key=lambda o: o.get('processing_order', 999))]
     else:
         print("Error: Must specify --office, --office-order, or --all-offices")
         sys.exit(1)
+    
+    try:
+        priority_rules = parse_priority_rules(args.priority) if args.priority is not None else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    # The budget is shared by all offices of the run, so offices later in processing_order
+    # are the ones whose calls are deferred when it runs out
+    deadline = time.time() + args.time_budget if args.time_budget else None
+    
+    def run_office(office_id, lease=None):
+        return process_office(office_id, args.hours_back, args.debug, args.dry_run, args.resume, args.slices,
+                              args.profile, args.profile_top, deadline=deadline, priority_rules=priority_rules,
+                              lease=lease)
+    
+    # With a shared lease store, offices are split between the nodes running this script
+    from coordination import OfficeCoordinator
+    coordinator = OfficeCoordinator.from_arguments(args, SecureStorage(args.debug).load_global_config().get("coordination"))
+    if coordinator:
+        coordinator.run("accepted_calls", office_ids, run_office)
+    else:
+        for office_id in office_ids:
+            run_office(office_id)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Attachment Index
+This module remembers the SHA-256 of every voicemail and recording
+uploaded to a Zoho lead, so a call processed again, by an overlapping
+window, a retry or the other processor, does not upload the same audio to
+the same lead twice. Leads can optionally be seeded once from the
+attachments they already had before the index existed.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import contextlib
+
+def content_hash(content):
+    """Return the hex SHA-256 of attachment content."""
+    return hashlib.sha256(content).hexdigest()
+
+class AttachmentIndex:
+    """SQLite index of the attachment content hashes known per Zoho lead."""
+    
+    def __init__(self, db_path="data/attachment_index.db"):
+        """
+        Initialize the index.
+        
+        Args:
+            db_path (str): Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self.logger = logging.getLogger("AttachmentIndex")
+        self.lock = threading.Lock()
+        # (lead_id, sha256) -> [lock, holders], for the uploads in progress in this process
+        self.upload_locks = {}
+        
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS attachments (
+                lead_id TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                attachment_id TEXT,
+                file_name TEXT,
+                source TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (lead_id, sha256)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seeded_leads (
+                lead_id TEXT PRIMARY KEY,
+                attachments INTEGER NOT NULL,
+                seeded_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+    
+    def lookup(self, lead_id, sha256):
+        """
+        Find an attachment with the same content on a lead.
+        
+        Returns:
+            tuple: (attachment_id, file_name) of the existing attachment, or None
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT attachment_id, file_name FROM attachments WHERE lead_id = ? AND sha256 = ?",
+                (str(lead_id), sha256)
+            ).fetchone()
+    
+    def record(self, lead_id, sha256, attachment_id=None, file_name=None, source="upload"):
+        """
+        Remember an attachment on a lead; the first attachment recorded for a content hash is kept.
+        
+        Args:
+            lead_id (str): Zoho lead ID
+            sha256 (str): Hex SHA-256 of the content
+            attachment_id (str): Zoho attachment ID
+            file_name (str): Attachment file name
+            source (str): "upload" for uploads made by the integration, "seed" for existing attachments
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO attachments (lead_id, sha256, attachment_id, file_name, source, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(lead_id), sha256, attachment_id, file_name, source, time.time())
+            )
+            self.conn.commit()
+    
+    @contextlib.contextmanager
+    def hold(self, lead_id, sha256):
+        """
+        Hold one content hash of one lead for a lookup, upload and record.
+        
+        Two threads attaching the same audio to the same lead would otherwise
+        both miss the lookup and both upload; the second now waits and then
+        finds the first one's record.
+        """
+        key = (str(lead_id), sha256)
+        with self.lock:
+            entry = self.upload_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.upload_locks[key]
+    
+    def is_seeded(self, lead_id):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM seeded_leads WHERE lead_id = ?", (str(lead_id),)
+            ).fetchone() is not None
+    
+    def mark_seeded(self, lead_id, attachments):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO seeded_leads (lead_id, attachments, seeded_at) VALUES (?, ?, ?)",
+                (str(lead_id), attachments, time.time())
+            )
+            self.conn.commit()
+    
+    def seed_lead(self, zoho_client, lead_id):
+        """
+        Hash the attachments a lead already has, once per lead.
+        
+        Each attachment is downloaded to hash it, so seeding costs one listing
+        and one download per existing attachment the first time a lead is seen.
+        
+        Args:
+            zoho_client (ZohoClient): Zoho client
+            lead_id (str): Zoho lead ID
+        
+        Returns:
+            int: Attachments hashed, or None if the lead was seeded before or could not be listed
+        """
+        if self.is_seeded(lead_id):
+            return None
+        
+        attachments = zoho_client.get_lead_attachments(lead_id)
+        if attachments is None:
+            return None
+        
+        hashed = 0
+        for attachment in attachments:
+            content = zoho_client.download_attachment(lead_id, attachment["id"])
+            if content is None:
+                # Leave the lead unseeded so the next upload tries again
+                self.logger.warning(f"Could not download attachment {attachment['id']} of lead {lead_id}")
+                return None
+            self.record(lead_id, content_hash(content), attachment["id"], attachment.get("File_Name"), "seed")
+            hashed += 1
+        
+        self.mark_seeded(lead_id, hashed)
+        return hashed
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_attachment_index = None
+_attachment_index_lock = threading.Lock()
+
+def get_attachment_index():
+    """Return the process-wide AttachmentIndex, or None if the database cannot be opened."""
+    global _attachment_index
+    with _attachment_index_lock:
+        if _attachment_index is None:
+            try:
+                _attachment_index = AttachmentIndex()
+            except sqlite3.Error as e:
+                logging.getLogger("AttachmentIndex").warning(f"Attachments will not be deduplicated: {str(e)}")
+                _attachment_index = False
+        return _attachment_index or None
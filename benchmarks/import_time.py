@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Import Time Benchmark
+This script measures how long the integration's modules take to import in a
+fresh interpreter, using Python's -X importtime, and can compare the working
+tree against an earlier git revision to show the cold-start difference.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_MODULES = ["common", "missed_calls", "accepted_calls", "daemon", "webhooks"]
+
+def parse_importtime(output):
+    """
+    Parse -X importtime output.
+    
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth) tuples in report order
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def measure(source_dir, module, runs):
+    """
+    Import a module in fresh interpreters and collect the timings.
+    
+    Args:
+        source_dir (str): Directory the module is imported from
+        module (str): Module name
+        runs (int): Number of timed imports
+    
+    Returns:
+        dict: Median cumulative import time in ms and the heaviest direct imports of the last run
+    """
+    command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    env = dict(os.environ, PYTHONPATH=source_dir)
+    
+    # The first import compiles .pyc files; it is not timed
+    subprocess.run(command, cwd=source_dir, env=env, capture_output=True)
+    
+    totals = []
+    children = []
+    for _ in range(runs):
+        completed = subprocess.run(command, cwd=source_dir, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+        entries = parse_importtime(completed.stderr)
+        index = max(i for i, (name, _, _, depth) in enumerate(entries) if name == module and depth == 0)
+        totals.append(entries[index][2])
+        
+        # A module's direct imports are listed one level deeper, just before it; anything
+        # earlier at depth 0 was loaded by interpreter startup
+        children = []
+        for name, _, cumulative, depth in reversed(entries[:index]):
+            if depth == 0:
+                break
+            if depth == 1:
+                children.append((name, cumulative))
+    
+    return {
+        "median_ms": statistics.median(totals) / 1000.0,
+        "min_ms": min(totals) / 1000.0,
+        "heaviest": sorted(children, key=lambda child: child[1], reverse=True)
+    }
+
+def export_revision(revision, target_dir):
+    """Write the files of a git revision to a directory."""
+    archive = subprocess.run(["git", "archive", revision], cwd=REPO_ROOT, capture_output=True, check=True)
+    subprocess.run(["tar", "-x", "-C", target_dir], input=archive.stdout, check=True)
+
+def parse_import_time_arguments():
+    """Parse command line arguments for the import time benchmark."""
+    parser = argparse.ArgumentParser(description="Import time benchmark for the RingCentral-Zoho modules")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES,
+                        help=f"Modules to import (default: {' '.join(DEFAULT_MODULES)})")
+    parser.add_argument("--runs", type=int, default=7, help="Timed imports per module (default: 7)")
+    parser.add_argument("--baseline", metavar="REVISION",
+                        help="Also measure this git revision, e.g. HEAD~1, and report the difference")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest direct imports listed per module (default: 5)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_import_time_arguments()
+    
+    baseline_dir = None
+    if args.baseline:
+        baseline_dir = tempfile.mkdtemp(prefix="rc_zoho_import_")
+        export_revision(args.baseline, baseline_dir)
+    
+    results = {}
+    try:
+        for module in args.modules:
+            current = measure(REPO_ROOT, module, args.runs)
+            results[module] = {"current": current}
+            line = f"{module:<16} {current['median_ms']:>9.1f} ms (min {current['min_ms']:.1f})"
+            
+            if baseline_dir:
+                baseline = measure(baseline_dir, module, args.runs)
+                results[module]["baseline"] = baseline
+                change = (current["median_ms"] - baseline["median_ms"]) / baseline["median_ms"] * 100
+                line += f"   baseline {baseline['median_ms']:>9.1f} ms   {change:+.0f}%"
+            
+            print(line)
+            for name, cumulative in current["heaviest"][:args.top]:
+                print(f"    {name:<40} {cumulative / 1000.0:>8.1f} ms")
+    finally:
+        if baseline_dir:
+            shutil.rmtree(baseline_dir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"runs": args.runs, "baseline": args.baseline, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
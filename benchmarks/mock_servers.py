@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Mock API Servers
+This module provides local stand-ins for the RingCentral and Zoho CRM APIs
+used by the benchmark suite. Both servers add configurable latency, report
+rate-limit headers, enforce per-group request budgets with 429/Retry-After
+and can inject 5xx errors, and count every request they serve.
+"""
+
+import gzip
+import json
+import time
+import random
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dateutil.parser import parse as date_parse
+
+class MockServerConfig:
+    """Fault and latency settings shared by the mock servers."""
+    
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, rate_limit=100000, rate_window=60, seed=42):
+        """
+        Initialize the configuration.
+        
+        Args:
+            latency_ms (float): Base latency added to every response
+            jitter_ms (float): Random latency added on top of the base latency
+            error_rate (float): Share of requests answered with a 503
+            rate_limit (int): Requests allowed per group in each window
+            rate_window (int): Rate limit window in seconds
+            seed (int): Random seed for latency and error injection
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.random = random.Random(seed)
+
+class MockApiServer:
+    """Base class for a threaded mock API server with request accounting."""
+    
+    name = "mock"
+    rate_limit_headers = ("X-Rate-Limit-Limit", "X-Rate-Limit-Remaining", "X-Rate-Limit-Window")
+    # Smaller JSON bodies are sent uncompressed
+    gzip_min_bytes = 1024
+    
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockServerConfig()
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.windows = {}  # group -> (window start, requests in window)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=f"{self.name}-server", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def snapshot(self):
+        """Return a copy of the per-group request counts."""
+        with self.lock:
+            return dict(self.counts)
+    
+    def classify(self, method, path):
+        """Return the API group a request is counted and rate limited under."""
+        raise NotImplementedError
+    
+    def route(self, method, path, query, body):
+        """
+        Handle an admitted request.
+        
+        Returns:
+            tuple: (status, payload) where payload is a dict, bytes or None
+        """
+        raise NotImplementedError
+    
+    def _admit(self, group):
+        # Fixed-window budget per API group, reported the way the real APIs do
+        config = self.config
+        now = time.monotonic()
+        with self.lock:
+            self.counts[group] += 1
+            window_start, used = self.windows.get(group, (now, 0))
+            if now - window_start >= config.rate_window:
+                window_start, used = now, 0
+            used += 1
+            self.windows[group] = (window_start, used)
+            inject_error = config.error_rate and config.random.random() < config.error_rate
+            delay = config.latency_ms + (config.random.random() * config.jitter_ms if config.jitter_ms else 0)
+        
+        limit_header, remaining_header, window_header = self.rate_limit_headers
+        headers = {limit_header: str(config.rate_limit), remaining_header: str(max(config.rate_limit - used, 0))}
+        if window_header:
+            headers[window_header] = str(config.rate_window)
+        
+        if delay:
+            time.sleep(delay / 1000.0)
+        
+        if used > config.rate_limit:
+            with self.lock:
+                self.counts["throttled"] += 1
+            headers["Retry-After"] = str(max(1, int(config.rate_window - (now - window_start))))
+            return 429, headers
+        if inject_error:
+            with self.lock:
+                self.counts["errors"] += 1
+            headers["Retry-After"] = "0"
+            return 503, headers
+        return None, headers
+    
+    def _handler_class(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                
+                # Throttled and failed requests must not change the mock's state
+                status, headers = server._admit(server.classify(method, parsed.path))
+                if status:
+                    payload = {"error": "throttled" if status == 429 else "injected"}
+                else:
+                    status, payload = server.route(method, parsed.path, query, body)
+                
+                if isinstance(payload, bytes):
+                    content, content_type = payload, "application/octet-stream"
+                elif payload is None:
+                    content, content_type = b"", "application/json"
+                else:
+                    content, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                
+                # JSON is compressed like the real APIs do when the client accepts it; audio is sent as is
+                if (content_type == "application/json" and len(content) >= server.gzip_min_bytes
+                        and "gzip" in self.headers.get("Accept-Encoding", "")):
+                    content = gzip.compress(content, compresslevel=5)
+                    headers = dict(headers, **{"Content-Encoding": "gzip"})
+                
+                self.send_response(status)
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            
+            def do_GET(self):
+                self._handle("GET")
+            
+            def do_POST(self):
+                self._handle("POST")
+            
+            def do_PUT(self):
+                self._handle("PUT")
+            
+            def do_DELETE(self):
+                self._handle("DELETE")
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
+class MockRingCentralServer(MockApiServer):
+    """Serves OAuth, paginated call logs, voicemail and recording content from a SyntheticCallLog."""
+    
+    name = "ringcentral"
+    # Left out of call log records unless view=Detailed is requested, as RingCentral does
+    DETAILED_FIELDS = ("legs", "billing", "transport", "internalType", "lastModifiedTime", "reasonDescription")
+    
+    def __init__(self, call_log, config=None, audio_bytes=32768, **kwargs):
+        """
+        Initialize the server.
+        
+        Args:
+            call_log (SyntheticCallLog): Calls to serve
+            config (MockServerConfig): Latency and fault settings
+            audio_bytes (int): Size of each voicemail or recording
+        """
+        self.call_log = call_log
+        self.audio = b"\0" * audio_bytes
+        super().__init__(config, **kwargs)
+    
+    def classify(self, method, path):
+        if path == "/restapi/oauth/token":
+            return "token"
+        if path.endswith("/call-log"):
+            return "call_logs"
+        if "/message-store/" in path:
+            return "voicemail"
+        if "/recording/" in path:
+            return "recording"
+        return "other"
+    
+    def route(self, method, path, query, body):
+        if path == "/restapi/oauth/token":
+            return 200, {"access_token": "mock-rc-token", "expires_in": 3600}
+        
+        parts = path.strip("/").split("/")
+        if path.endswith("/call-log") and len(parts) >= 6:
+            return 200, self._call_log_page(parts[5], query)
+        
+        if "message-store" in parts:
+            message_id = parts[parts.index("message-store") + 1]
+            if parts[-2] == "content":
+                return 200, self._audio(message_id)
+            return 200, {
+                "id": message_id,
+                "type": "VoiceMail",
+                "attachments": [{
+                    "id": message_id,
+                    "type": "AudioRecording",
+                    "contentType": "audio/wav",
+                    "uri": f"{self.url}{path}/content/{message_id}"
+                }]
+            }
+        
+        if "recording" in parts and path.endswith("/content"):
+            return 200, self._audio(parts[parts.index("recording") + 1])
+        
+        return 404, {"errorCode": "NotFound"}
+    
+    def _audio(self, media_id):
+        # Every voicemail and recording has distinct content, as real audio would
+        header = f"{media_id}:".encode("utf-8")
+        return header + self.audio[len(header):]
+    
+    def _call_log_page(self, extension_id, query):
+        if extension_id not in self.call_log.extensions:
+            return {"records": [], "navigation": {}}
+        
+        date_from = date_parse(query["dateFrom"]) if "dateFrom" in query else None
+        date_to = date_parse(query["dateTo"]) if "dateTo" in query else None
+        indices = self.call_log.index_range(date_from, date_to)
+        
+        page = int(query.get("page", 1))
+        per_page = int(query.get("perPage", 100))
+        page_indices = indices[(page - 1) * per_page:page * per_page]
+        
+        navigation = {}
+        if page * per_page < len(indices):
+            navigation["nextPage"] = {"uri": f"page={page + 1}"}
+        records = [self.call_log.record(extension_id, index) for index in page_indices]
+        if query.get("view", "Simple") == "Simple":
+            records = [
+                {field: value for field, value in record.items() if field not in self.DETAILED_FIELDS}
+                for record in records
+            ]
+        return {
+            "records": records,
+            "paging": {"page": page, "perPage": per_page, "totalElements": len(indices)},
+            "navigation": navigation
+        }
+
+# Values the mock adds to every stored lead so searches return records of a realistic size
+LEAD_SYSTEM_FIELDS = {
+    "Owner": {"name": "Mock Owner", "id": "3000000000001", "email": "owner@example.com"},
+    "Created_By": {"name": "Integration User", "id": "3000000000002", "email": "integration@example.com"},
+    "Modified_By": {"name": "Integration User", "id": "3000000000002", "email": "integration@example.com"},
+    "Created_Time": "2024-01-01T00:00:00+00:00",
+    "Modified_Time": "2024-01-01T00:00:00+00:00",
+    "Last_Activity_Time": "2024-01-01T00:00:00+00:00",
+    "Email": None, "Secondary_Email": None, "Mobile": None, "Fax": None, "Website": None,
+    "Designation": None, "Industry": None, "Annual_Revenue": None, "No_of_Employees": None,
+    "Rating": None, "Salutation": None, "Street": None, "City": None, "State": None,
+    "Zip_Code": None, "Country": None, "Description": None, "Skype_ID": None, "Twitter": None,
+    "Email_Opt_Out": False, "Converted__s": False, "Converted_Date_Time": None, "Unsubscribed_Mode": None,
+    "Unsubscribed_Time": None, "Record_Image": None, "Tag": [], "Locked__s": False,
+    "$approval": {"delegate": False, "approve": False, "reject": False, "resubmit": False},
+    "$editable": True, "$currency_symbol": "$", "$review_process": {"approve": False, "reject": False, "resubmit": False},
+    "$state": "save", "$process_flow": False, "$in_merge": False, "$approval_state": "approved"
+}
+
+class MockZohoServer(MockApiServer):
+    """Serves OAuth and the Leads, Notes and Attachments endpoints from an in-memory store."""
+    
+    name = "zoho"
+    rate_limit_headers = ("X-RATELIMIT-LIMIT", "X-RATELIMIT-REMAINING", None)
+    
+    def __init__(self, config=None, **kwargs):
+        self.leads = {}
+        self.leads_by_phone = {}
+        self.notes = defaultdict(list)
+        self.attachments = defaultdict(list)
+        self.store_lock = threading.Lock()
+        super().__init__(config, **kwargs)
+    
+    def classify(self, method, path):
+        parts = path.strip("/").split("/")
+        if path == "/oauth/v2/token":
+            return "token"
+        if parts[:3] != ["crm", "v3", "Leads"]:
+            return "other"
+        if len(parts) == 3:
+            return "create"
+        if len(parts) == 4:
+            return "search" if parts[3] == "search" else "update"
+        return parts[4].lower()
+    
+    def route(self, method, path, query, body):
+        if path == "/oauth/v2/token":
+            return 200, {"access_token": "mock-zoho-token", "expires_in": 3600}
+        
+        parts = path.strip("/").split("/")
+        if parts[:3] != ["crm", "v3", "Leads"]:
+            return 404, {"code": "INVALID_URL_PATTERN"}
+        
+        if len(parts) == 4 and parts[3] == "search":
+            with self.store_lock:
+                lead_id = self.leads_by_phone.get(query.get("phone"))
+                lead = self._lead_record(lead_id, query.get("fields")) if lead_id else None
+            return (200 if lead else 204), ({"data": [lead]} if lead else None)
+        
+        if len(parts) == 3 and method == "POST":
+            results = []
+            with self.store_lock:
+                for lead_data in json.loads(body)["data"]:
+                    lead_id = str(4000000000 + len(self.leads))
+                    self.leads[lead_id] = lead_data
+                    if lead_data.get("Phone"):
+                        self.leads_by_phone[lead_data["Phone"]] = lead_id
+                    results.append(self._success(lead_id)["data"][0])
+            return 201, {"data": results}
+        
+        lead_id = parts[3]
+        if len(parts) == 4 and method == "PUT":
+            with self.store_lock:
+                self.leads.setdefault(lead_id, {}).update(json.loads(body)["data"][0])
+            return 200, self._success(lead_id)
+        
+        if len(parts) == 5 and parts[4] == "Notes":
+            if method == "GET":
+                with self.store_lock:
+                    notes = list(self.notes.get(lead_id, []))
+                return (200 if notes else 204), ({"data": notes} if notes else None)
+            note = json.loads(body)["data"][0]
+            with self.store_lock:
+                note_id = f"{lead_id}-n{len(self.notes[lead_id])}"
+                self.notes[lead_id].append(dict(note, id=note_id))
+            return 201, self._success(note_id)
+        
+        if len(parts) == 5 and parts[4] == "Attachments":
+            if method == "GET":
+                with self.store_lock:
+                    listed = [
+                        {"id": attachment["id"], "File_Name": attachment["File_Name"], "Size": len(attachment["content"])}
+                        for attachment in self.attachments.get(lead_id, [])
+                    ]
+                return (200 if listed else 204), ({"data": listed} if listed else None)
+            file_name, content = self._multipart_file(body)
+            with self.store_lock:
+                attachment_id = f"{lead_id}-a{len(self.attachments[lead_id]) + 1}"
+                self.attachments[lead_id].append({"id": attachment_id, "File_Name": file_name, "content": content})
+            return 200, self._success(attachment_id)
+        
+        if len(parts) == 6 and parts[4] == "Attachments":
+            with self.store_lock:
+                for attachment in self.attachments.get(lead_id, []):
+                    if attachment["id"] == parts[5]:
+                        return 200, attachment["content"]
+            return 404, {"code": "INVALID_DATA"}
+        
+        return 404, {"code": "INVALID_URL_PATTERN"}
+    
+    @staticmethod
+    def _multipart_file(body):
+        # Uploads carry a single file part: headers, a blank line, the content and the closing boundary
+        headers, _, rest = body.partition(b"\r\n\r\n")
+        file_name = headers.split(b'filename="', 1)[-1].split(b'"', 1)[0].decode("utf-8", "replace")
+        return file_name, rest.rsplit(b"\r\n--", 1)[0]
+    
+    def _lead_record(self, lead_id, fields=None):
+        # Zoho returns every field of a lead, system fields included, unless fields= projects them
+        lead = dict(LEAD_SYSTEM_FIELDS, **self.leads[lead_id], id=lead_id)
+        if fields:
+            lead = {field: lead.get(field) for field in ["id"] + fields.split(",")}
+        return lead
+    
+    def _success(self, record_id):
+        return {"data": [{"code": "SUCCESS", "status": "success", "details": {"id": record_id}}]}
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Benchmark Runner
+This script runs the call processors end to end against local mock
+RingCentral and Zoho servers with synthetic call volumes and reports
+throughput, API calls per processed call, per-call latency percentiles and
+peak memory, so performance changes can be measured without live accounts.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import tempfile
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from cryptography.fernet import Fernet
+from synthetic import SyntheticCallLog
+from mock_servers import MockServerConfig, MockRingCentralServer, MockZohoServer
+
+OFFICE_ID = "benchmark"
+LEAD_OWNERS = [
+    {"id": "5000000001", "name": "Bench Owner One", "extension_id": "901"},
+    {"id": "5000000002", "name": "Bench Owner Two", "extension_id": "902"},
+    {"id": "5000000003", "name": "Bench Owner Three", "extension_id": "903"}
+]
+
+def percentile(sorted_values, fraction):
+    """Return a percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def prepare_workdir(workdir, extensions, rc_url, zoho_url):
+    """
+    Lay out the data/ and sorted/ configuration a processor expects, pointing at the mocks.
+    
+    Args:
+        workdir (str): Directory the processor runs in
+        extensions (list): Extension IDs to configure
+        rc_url (str): Mock RingCentral base URL
+        zoho_url (str): Mock Zoho base URL
+    """
+    data_dir = os.path.join(workdir, "data")
+    office_dir = os.path.join(workdir, "sorted", OFFICE_ID)
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(office_dir, exist_ok=True)
+    
+    key = Fernet.generate_key()
+    credentials = {
+        "ringcentral": {
+            "client_id": "benchmark",
+            "client_secret": "benchmark",
+            "jwt_private_key": "benchmark",
+            "server_url": rc_url
+        },
+        "zoho": {
+            "client_id": "benchmark",
+            "client_secret": "benchmark",
+            "refresh_token": "benchmark",
+            "api_domain": zoho_url,
+            "accounts_url": zoho_url
+        }
+    }
+    with open(os.path.join(data_dir, "encryption.key"), "wb") as f:
+        f.write(key)
+    with open(os.path.join(data_dir, "credentials.enc"), "wb") as f:
+        f.write(Fernet(key).encrypt(json.dumps(credentials).encode("utf-8")))
+    
+    shutil.copy(os.path.join(REPO_ROOT, "data", "zoho_field_mappings.json"), data_dir)
+    
+    with open(os.path.join(data_dir, "offices.json"), "w") as f:
+        json.dump({"offices": {OFFICE_ID: {"name": "Benchmark Office", "processing_order": 1}}}, f, indent=2)
+    with open(os.path.join(office_dir, "extensions.json"), "w") as f:
+        json.dump({"extensions": [
+            {"id": extension_id, "name": f"Benchmark {extension_id}", "process_calls": True}
+            for extension_id in extensions
+        ]}, f, indent=2)
+    with open(os.path.join(office_dir, "lead_owners.json"), "w") as f:
+        json.dump({"lead_owners": LEAD_OWNERS}, f, indent=2)
+
+def run_worker(processor, hours_back, slices):
+    """
+    Process the benchmark office in this process and print the measurements as JSON.
+    
+    Runs inside a fresh subprocess so peak RSS belongs to a single processor run.
+    """
+    # Keep per-call INFO logging out of the measurement; warnings still reach stderr
+    for name in (processor, "RingCentralClient", "ZohoClient", "ZohoOutbox"):
+        logger = logging.getLogger(name)
+        logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+    
+    if processor == "missed_calls":
+        import missed_calls as module
+    else:
+        import accepted_calls as module
+    
+    latencies = []
+    process_call = module.process_call
+    
+    def timed_process_call(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return process_call(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    
+    module.process_call = timed_process_call
+    
+    started = time.perf_counter()
+    stats = module.process_office(OFFICE_ID, hours_back, slices=slices)
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    print(json.dumps({
+        "elapsed_seconds": elapsed,
+        "calls_processed": stats.get("total_calls_processed", 0),
+        "errors": stats.get("errors", 0),
+        "success": stats.get("success", False),
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "peak_rss_mb": peak_rss_mb()
+    }))
+
+def run_scenario(processor, total_calls, args):
+    """
+    Run one processor over one synthetic dataset.
+    
+    Args:
+        processor (str): "missed_calls" or "accepted_calls"
+        total_calls (int): Calls in the dataset
+        args (argparse.Namespace): Benchmark options
+    
+    Returns:
+        dict: Scenario results
+    """
+    extensions = [str(100 + i) for i in range(args.extensions)]
+    
+    # Leave a margin so calls near the window start are still inside the processor's window
+    window_end = datetime.datetime.now(datetime.timezone.utc)
+    call_log = SyntheticCallLog(
+        "missed" if processor == "missed_calls" else "accepted",
+        extensions,
+        max(1, total_calls // len(extensions)),
+        window_end,
+        args.hours_back * 3600 - 300,
+        repeat_caller_rate=args.repeat_caller_rate,
+        voicemail_rate=args.voicemail_rate,
+        recording_rate=args.recording_rate,
+        owners=LEAD_OWNERS,
+        seed=args.seed
+    )
+    
+    def server_config():
+        return MockServerConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit, 60, args.seed)
+    
+    rc_server = MockRingCentralServer(call_log, server_config(), audio_bytes=args.audio_bytes).start()
+    zoho_server = MockZohoServer(server_config()).start()
+    workdir = tempfile.mkdtemp(prefix="rc_zoho_bench_")
+    
+    try:
+        prepare_workdir(workdir, extensions, rc_server.url, zoho_server.url)
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            "--worker", processor,
+            "--hours-back", str(args.hours_back),
+            "--slices", str(args.slices)
+        ]
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+        if completed.returncode != 0 or not completed.stdout.strip():
+            raise RuntimeError(f"Benchmark worker failed:\n{completed.stderr[-2000:]}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        rc_server.stop()
+        zoho_server.stop()
+        if args.keep_workdir:
+            print(f"Kept work directory: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    api_calls = {}
+    for service, server in (("ringcentral", rc_server), ("zoho", zoho_server)):
+        for group, count in server.snapshot().items():
+            api_calls[f"{service}.{group}"] = count
+    total_api_calls = sum(count for key, count in api_calls.items() if not key.endswith((".throttled", ".errors")))
+    
+    calls_processed = result["calls_processed"]
+    result.update({
+        "processor": processor,
+        "dataset_calls": call_log.total_calls,
+        "calls_per_second": calls_processed / result["elapsed_seconds"] if result["elapsed_seconds"] else None,
+        "api_calls": api_calls,
+        "api_calls_per_call": total_api_calls / calls_processed if calls_processed else None
+    })
+    return result
+
+def format_row(result):
+    def number(value, pattern):
+        return pattern.format(value) if value is not None else "n/a"
+    
+    return (
+        f"{result['processor']:<15} {result['dataset_calls']:>8} {result['calls_processed']:>8} "
+        f"{number(result['calls_per_second'], '{:>10.1f}')} {number(result['api_calls_per_call'], '{:>9.2f}')} "
+        f"{number(result['p50_ms'], '{:>9.2f}')} {number(result['p99_ms'], '{:>9.2f}')} "
+        f"{number(result['peak_rss_mb'], '{:>9.1f}')}"
+    )
+
+def parse_benchmark_arguments():
+    """Parse command line arguments for the benchmark runner."""
+    parser = argparse.ArgumentParser(description="Offline benchmark for the RingCentral-Zoho call processors")
+    parser.add_argument("--processor", choices=["missed_calls", "accepted_calls", "both"], default="both",
+                        help="Processor to benchmark (default: both)")
+    parser.add_argument("--calls", type=int, nargs="+", default=[10000],
+                        help="Dataset sizes to run, e.g. --calls 10000 100000 500000 (default: 10000)")
+    parser.add_argument("--extensions", type=int, default=5, help="Extensions the calls are spread over (default: 5)")
+    parser.add_argument("--hours-back", type=int, default=24, help="Window the calls are spread over (default: 24)")
+    parser.add_argument("--slices", type=int, default=1, help="Pass --slices to the processor (default: 1)")
+    parser.add_argument("--repeat-caller-rate", type=float, default=0.3,
+                        help="Share of calls from callers who already called (default: 0.3)")
+    parser.add_argument("--voicemail-rate", type=float, default=0.4,
+                        help="Share of missed calls with a voicemail (default: 0.4)")
+    parser.add_argument("--recording-rate", type=float, default=0.6,
+                        help="Share of accepted calls with a recording (default: 0.6)")
+    parser.add_argument("--audio-bytes", type=int, default=32768, help="Size of each voicemail/recording (default: 32768)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency added to every mock response (default: 0)")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra latency per response (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503 (default: 0)")
+    parser.add_argument("--rate-limit", type=int, default=100000,
+                        help="Requests per API group per minute before the mocks return 429 (default: 100000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the temporary work directories")
+    parser.add_argument("--worker", choices=["missed_calls", "accepted_calls"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_benchmark_arguments()
+    
+    if args.worker:
+        run_worker(args.worker, args.hours_back, args.slices)
+        return
+    
+    processors = ["missed_calls", "accepted_calls"] if args.processor == "both" else [args.processor]
+    
+    print(f"{'processor':<15} {'dataset':>8} {'calls':>8} {'calls/sec':>10} {'api/call':>9} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'rss MB':>9}")
+    
+    results = []
+    for total_calls in args.calls:
+        for processor in processors:
+            result = run_scenario(processor, total_calls, args)
+            results.append(result)
+            print(format_row(result))
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "generated_at": datetime.datetime.now().isoformat(),
+                "options": {key: value for key, value in vars(args).items() if key not in ("worker", "output")},
+                "results": results
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
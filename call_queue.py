@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Call Priority Queue
+This module orders fetched calls before they are processed into Zoho CRM,
+e.g. calls with a voicemail first and then the newest calls, and keeps the
+calls a run did not get to in a durable store so that the next run picks
+them up instead of dropping them when a run's time budget runs out.
+"""
+
+import os
+import json
+import time
+import heapq
+import sqlite3
+import logging
+import datetime
+import threading
+from coordination import FENCING_TABLE, LeaseLostError, fenced_write
+
+DEFAULT_PRIORITY_RULES = ("voicemail", "newest")
+
+def _has_voicemail(call):
+    if (call.get("message") or {}).get("type") == "VoiceMail":
+        return True
+    return any((leg.get("message") or {}).get("type") == "VoiceMail" for leg in call.get("legs", []))
+
+def _has_recording(call):
+    if (call.get("recording") or {}).get("id"):
+        return True
+    return any((leg.get("recording") or {}).get("id") for leg in call.get("legs", []))
+
+def call_timestamp(call):
+    """Return a call's start time as a POSIX timestamp, or 0 if it is missing or malformed."""
+    try:
+        return datetime.datetime.fromisoformat(call.get("startTime", "").replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0
+
+# Each rule maps a call to a sort key; lower keys are processed first
+PRIORITY_RULES = {
+    "voicemail": lambda call: 0 if _has_voicemail(call) else 1,
+    "recording": lambda call: 0 if _has_recording(call) else 1,
+    "newest": lambda call: -call_timestamp(call),
+    "oldest": call_timestamp,
+    "shortest": lambda call: call.get("duration") or 0
+}
+
+def parse_priority_rules(value):
+    """
+    Parse a comma-separated rule list such as "voicemail,newest".
+    
+    "none" or an empty value keeps the order calls were fetched in.
+    
+    Returns:
+        tuple: Rule names
+    
+    Raises:
+        ValueError: If a rule is unknown
+    """
+    if isinstance(value, str):
+        value = [] if value.strip().lower() in ("", "none") else value.split(",")
+    rules = tuple(rule.strip().lower() for rule in value if rule.strip())
+    unknown = [rule for rule in rules if rule not in PRIORITY_RULES]
+    if unknown:
+        raise ValueError(f"Unknown priority rule(s) {', '.join(unknown)}; choose from {', '.join(PRIORITY_RULES)}")
+    return rules
+
+class CallQueue:
+    """Priority queue of calls, ordered by a list of rules with fetch order breaking ties."""
+    
+    def __init__(self, rules=DEFAULT_PRIORITY_RULES):
+        """
+        Initialize the queue.
+        
+        Args:
+            rules (iterable): Rule names from PRIORITY_RULES, most significant first
+        """
+        self.rules = parse_priority_rules(rules)
+        self.key_functions = [PRIORITY_RULES[rule] for rule in self.rules]
+        self.heap = []
+        self.call_ids = set()
+        self.sequence = 0
+    
+    def push(self, call):
+        """
+        Add a call unless a call with the same ID is already queued.
+        
+        Returns:
+            bool: True if the call was added
+        """
+        call_id = call.get("id")
+        if call_id in self.call_ids:
+            return False
+        self.call_ids.add(call_id)
+        key = tuple(function(call) for function in self.key_functions)
+        heapq.heappush(self.heap, (key, self.sequence, call))
+        self.sequence += 1
+        return True
+    
+    def pop(self):
+        """Remove and return the call with the highest priority."""
+        call = heapq.heappop(self.heap)[2]
+        self.call_ids.discard(call.get("id"))
+        return call
+    
+    def __len__(self):
+        return len(self.heap)
+
+class DeferredCalls:
+    """
+    Durable SQLite store of fetched calls that have not been processed yet.
+    
+    Calls are saved as soon as they are fetched and removed once processed,
+    so calls left over when a time budget runs out, or when a run is
+    interrupted, are processed by the next run of the same office. A call
+    whose processing fails is retried with exponential backoff and moved to
+    the dead_calls table after max_attempts failures.
+    """
+    
+    def __init__(self, processor, office_id, db_path="data/deferred_calls.db", enabled=True, lease=None,
+                 base_delay=300, max_delay=21600, max_attempts=5):
+        """
+        Initialize the store.
+        
+        Args:
+            processor (str): "missed_calls" or "accepted_calls"
+            office_id (str): Office identifier
+            db_path (str): Path to the SQLite database file
+            enabled (bool): False keeps nothing, e.g. for dry runs
+            lease (Lease): Office lease the run holds; writes are refused once it is lost
+            base_delay (int): Delay in seconds before a failed call is retried
+            max_delay (int): Maximum retry delay in seconds
+            max_attempts (int): Failed attempts before a call is given up on
+        """
+        self.processor = processor
+        self.office_id = office_id
+        self.db_path = db_path
+        self.enabled = enabled
+        self.lease = lease
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger("DeferredCalls")
+        self.lock = threading.Lock()
+        self.conn = None
+        
+        if not enabled:
+            return
+        
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with NORMAL sync survives a crashed run; only a power loss can lose the last few removals
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS deferred_calls (
+                processor TEXT NOT NULL,
+                office_id TEXT NOT NULL,
+                call_id TEXT NOT NULL,
+                call TEXT NOT NULL,
+                deferred_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                PRIMARY KEY (processor, office_id, call_id)
+            )
+        """)
+        # Stores created before failed calls were counted lack the retry columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(deferred_calls)")}
+        for column, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"),
+                                   ("next_attempt_at", "REAL NOT NULL DEFAULT 0"),
+                                   ("last_error", "TEXT")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE deferred_calls ADD COLUMN {column} {definition}")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_calls (
+                processor TEXT NOT NULL,
+                office_id TEXT NOT NULL,
+                call_id TEXT NOT NULL,
+                call TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                dead_at REAL NOT NULL,
+                PRIMARY KEY (processor, office_id, call_id)
+            )
+        """)
+        self.conn.execute(FENCING_TABLE)
+        self.conn.commit()
+    
+    def load(self):
+        """
+        Return the calls left over by earlier runs that are due, oldest deferral first.
+        
+        Returns:
+            list: RingCentral call log records
+        """
+        if not self.enabled:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT call FROM deferred_calls WHERE processor = ? AND office_id = ? AND next_attempt_at <= ? "
+                "ORDER BY deferred_at",
+                (self.processor, self.office_id, time.time())
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def _matching_ids(self, table, call_ids, condition="", params=()):
+        found = set()
+        # Chunked to stay below SQLite's limit on query parameters
+        for offset in range(0, len(call_ids), 500):
+            chunk = call_ids[offset:offset + 500]
+            found.update(row[0] for row in self.conn.execute(
+                f"SELECT call_id FROM {table} WHERE processor = ? AND office_id = ? "
+                f"AND call_id IN ({', '.join('?' * len(chunk))}){condition}",
+                (self.processor, self.office_id, *chunk, *params)
+            ))
+        return found
+    
+    def add(self, calls):
+        """
+        Save fetched calls; calls already saved keep their original deferral time and attempts.
+        
+        Returns:
+            list: The calls to process now, leaving out calls given up on and
+                failed calls whose retry is not due yet
+        """
+        if not self.enabled or not calls:
+            return calls
+        now = time.time()
+        call_ids = [str(call.get("id")) for call in calls]
+        with self.lock, fenced_write(self.conn, self.lease):
+            dead = self._matching_ids("dead_calls", call_ids)
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO deferred_calls (processor, office_id, call_id, call, deferred_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.processor, self.office_id, call_id, json.dumps(call), now)
+                 for call_id, call in zip(call_ids, calls) if call_id not in dead]
+            )
+            waiting = self._matching_ids("deferred_calls", call_ids, " AND next_attempt_at > ?", (now,))
+        return [call for call_id, call in zip(call_ids, calls) if call_id not in dead and call_id not in waiting]
+    
+    def remove(self, call_id):
+        """Forget a call once it has been processed."""
+        if not self.enabled:
+            return
+        with self.lock, fenced_write(self.conn, self.lease):
+            self.conn.execute(
+                "DELETE FROM deferred_calls WHERE processor = ? AND office_id = ? AND call_id = ?",
+                (self.processor, self.office_id, str(call_id))
+            )
+    
+    def fail(self, call_id, error):
+        """
+        Count a failed attempt at a call and schedule its retry, backing off exponentially.
+        
+        Returns:
+            bool: True if the call reached max_attempts and was moved to dead_calls
+        """
+        if not self.enabled:
+            return False
+        key = (self.processor, self.office_id, str(call_id))
+        with self.lock, fenced_write(self.conn, self.lease):
+            row = self.conn.execute(
+                "SELECT call, attempts FROM deferred_calls WHERE processor = ? AND office_id = ? AND call_id = ?", key
+            ).fetchone()
+            if row is None:
+                return False
+            attempts = row[1] + 1
+            if attempts >= self.max_attempts:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO dead_calls "
+                    "(processor, office_id, call_id, call, attempts, last_error, dead_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*key, row[0], attempts, error, time.time())
+                )
+                self.conn.execute(
+                    "DELETE FROM deferred_calls WHERE processor = ? AND office_id = ? AND call_id = ?", key
+                )
+            else:
+                delay = min(self.base_delay * (2 ** (attempts - 1)), self.max_delay)
+                self.conn.execute(
+                    "UPDATE deferred_calls SET attempts = ?, next_attempt_at = ?, last_error = ? "
+                    "WHERE processor = ? AND office_id = ? AND call_id = ?",
+                    (attempts, time.time() + delay, error, *key)
+                )
+        
+        if attempts >= self.max_attempts:
+            self.logger.error(f"Giving up on call {call_id} after {attempts} failed attempts: {error}")
+            return True
+        return False
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def drain_queue(queue, process, deferred, deadline=None, stats=None, lease=None):
+    """
+    Process queued calls in priority order until the queue is empty or the deadline passes.
+    
+    A call whose processing raises is logged, counted in stats["errors"] and
+    left in the deferred store to be retried after a backoff, while the rest
+    of the queue is still processed; after max_attempts failures it is moved
+    to the store's dead_calls table and counted in stats["dead_calls"].
+    
+    Args:
+        queue (CallQueue): Calls to process
+        process (callable): Called with each call
+        deferred (DeferredCalls): Store the processed calls are removed from
+        deadline (float): time.time() value after which no further call is started
+        stats (dict): Processing statistics that failed calls are counted in
+        lease (Lease): Office lease the run holds; no further call is started once it is lost
+    
+    Returns:
+        int: Calls left in the queue, and in the deferred store, for the next run
+    
+    Raises:
+        LeaseLostError: If the lease is lost; the remaining calls stay in the deferred store
+    """
+    logger = logging.getLogger("CallQueue")
+    while queue:
+        if deadline is not None and time.time() >= deadline:
+            break
+        if lease is not None:
+            lease.check()
+        call = queue.pop()
+        try:
+            process(call)
+        except LeaseLostError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing call {call.get('id')}; deferring it to a later run: {str(e)}",
+                         exc_info=True)
+            dead = deferred.fail(call.get("id"), str(e))
+            if stats is not None:
+                stats["errors"] = stats.get("errors", 0) + 1
+                if dead:
+                    stats["dead_calls"] = stats.get("dead_calls", 0) + 1
+            continue
+        deferred.remove(call.get("id"))
+    return len(queue)
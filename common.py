@@ -1,87 +1,900 @@
 # Common functionality for RingCentral-Zoho integration
 
+import io
 import os
 import sys
 import json
+import re
+import time
+import gzip
+import zlib
+import queue
+import atexit
+import random
+import sqlite3
+import tracemalloc
 import logging
+import argparse
 import datetime
-import pytz
-import requests
-from requests.exceptions import RequestException
-from cryptography.fernet import Fernet
-from dateutil.parser import parse as date_parse
+import threading
+import contextlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 
-class RingCentralClient:
+# requests, cryptography, pytz and dateutil are imported where they are first
+# used, so scripts that never reach them (--help, the admin GUI, a resumed run
+# with nothing left to do) start without paying for them
+
+# zstd is optional; raw logs fall back to gzip without it
+HAVE_ZSTD = importlib.util.find_spec("zstandard") is not None
+
+class ApiClient:
+    """Request handling shared by the RingCentral and Zoho clients."""
+    
+    service_name = "API"
+    default_rate_limit = (10, 60)
+    rate_limit_headers = ("X-Rate-Limit-Limit", "X-Rate-Limit-Remaining", "X-Rate-Limit-Window")
+    # (initial, minimum, maximum) requests in flight per API group
+    default_concurrency = (4, 1, 16)
+    # Bounds of the decorrelated jitter between retries, in seconds
+    retry_base_delay = 0.5
+    retry_max_delay = 30.0
+    
+    def __init__(self):
+        import requests
+        
+        self.session = requests.Session()
+        # Call log pages and search results are JSON and typically shrink by 80-90% compressed
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.token_lock = threading.Lock()
+        self.rate_limits = {}
+        self.rate_limits_lock = threading.Lock()
+        self.concurrency_limits = {}
+        
+        # Record or replay this client's traffic when a run asked for it; only
+        # configure_traffic imports the traffic module, so plain runs never load it
+        traffic = sys.modules.get("traffic")
+        if traffic is not None:
+            traffic.attach_traffic(self)
+    
+    def _get_access_token(self):
+        # Clients may be shared by several office jobs, so refresh under a lock
+        with self.token_lock:
+            if self.access_token and self.token_expiry and time.time() < self.token_expiry - 60:
+                return self.access_token
+            return self._refresh_access_token()
+    
+    def _refresh_access_token(self):
+        raise NotImplementedError
+    
+    def _auth_headers(self):
+        return {"Authorization": f"Bearer {self._get_access_token()}"}
+    
+    def _rate_limit(self, breaker_name):
+        with self.rate_limits_lock:
+            if breaker_name not in self.rate_limits:
+                limit, window = self.default_rate_limit
+                self.rate_limits[breaker_name] = RateLimitBudget(
+                    f"{self.service_name}_{breaker_name}", limit, window, self.rate_limit_headers
+                )
+            return self.rate_limits[breaker_name]
+    
+    def _concurrency(self, breaker_name):
+        with self.rate_limits_lock:
+            if breaker_name not in self.concurrency_limits:
+                initial, minimum, maximum = self.default_concurrency
+                self.concurrency_limits[breaker_name] = AdaptiveConcurrencyLimit(
+                    f"{self.service_name}_{breaker_name}", initial, minimum, maximum
+                )
+            return self.concurrency_limits[breaker_name]
+    
+    def concurrency_status(self):
+        """Return the current adaptive concurrency limit of each API group, keyed by endpoint."""
+        with self.rate_limits_lock:
+            limits = dict(self.concurrency_limits)
+        return {
+            f"{self.service_name.lower()}.{breaker_name}": limit.status()
+            for breaker_name, limit in limits.items()
+        }
+    
+    def rate_limit_status(self):
+        """Return the last reported budget of each API group, keyed by endpoint."""
+        with self.rate_limits_lock:
+            budgets = dict(self.rate_limits)
+        return {
+            f"{self.service_name.lower()}.{breaker_name}": budget.status()
+            for breaker_name, budget in budgets.items()
+        }
+    
+    def _request(self, method, path, breaker_name, max_attempts=3, **kwargs):
+        from requests.exceptions import RequestException
+        
+        breaker = self.circuit_breakers[breaker_name]
+        rate_limit = self._rate_limit(breaker_name)
+        concurrency = self._concurrency(breaker_name)
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        instrumentation = current_instrumentation()
+        endpoint = f"{self.service_name.lower()}.{breaker_name}"
+        delay = self.retry_base_delay
+        
+        for attempt in range(1, max_attempts + 1):
+            if not breaker.allow_request():
+                self.logger.warning("Circuit %s is open, skipping %s %s", breaker.name, method, path)
+                return None
+            
+            if attempt > 1 and instrumentation:
+                instrumentation.record_retry(endpoint)
+            
+            waited = time.perf_counter()
+            rate_limit.acquire()
+            headers = self._auth_headers()
+            slot = concurrency.acquire()
+            started = time.perf_counter()
+            status = None
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=60, **kwargs)
+                status = response.status_code
+            except RequestException as e:
+                error = e
+                self._record_failure(breaker, instrumentation)
+            finally:
+                # Released on every path, so an unexpected error cannot leak the slot
+                elapsed = time.perf_counter() - started
+                self._release_concurrency(concurrency, slot, status, elapsed, breaker, endpoint, instrumentation)
+            
+            if status is None:
+                if instrumentation:
+                    instrumentation.record_request(endpoint, None, elapsed, started - waited)
+                self.logger.error("%s request %s %s failed: %s", self.service_name, method, path, error)
+                if attempt == max_attempts or not self._can_retry(instrumentation, endpoint):
+                    return None
+                delay = self._retry_delay(delay)
+                time.sleep(delay)
+                continue
+            
+            if instrumentation:
+                instrumentation.record_request(
+                    endpoint,
+                    response.status_code,
+                    elapsed,
+                    started - waited,
+                    len(response.request.body or b""),
+                    self._wire_bytes(response)
+                )
+            
+            rate_limit.update(response.headers)
+            if response.status_code == 429 or response.status_code >= 500:
+                self._record_failure(breaker, instrumentation)
+                if attempt == max_attempts or not self._can_retry(instrumentation, endpoint):
+                    self.logger.warning("%s returned %s for %s, giving up", self.service_name, response.status_code, path)
+                    return None
+                delay = self._retry_delay(delay)
+                # A Retry-After from the server is a floor for the jittered delay
+                retry_after = max(delay, float(response.headers.get("Retry-After", 0)))
+                self.logger.warning("%s returned %s for %s, retrying in %.2fs", self.service_name, response.status_code, path, retry_after)
+                time.sleep(retry_after)
+                continue
+            
+            if response.status_code >= 400:
+                self._record_failure(breaker, instrumentation)
+                self.logger.error("%s request %s %s returned %s: %s", self.service_name, method, path, response.status_code, response.text[:200])
+                return None
+            
+            breaker.record_success()
+            if self.debug:
+                self.logger.debug("%s %s -> %s", method, path, response.status_code)
+            return response
+        
+        return None
+    
+    @staticmethod
+    def _wire_bytes(response):
+        # Content-Length is the compressed size when the server used gzip; content is already decoded
+        try:
+            return int(response.headers["Content-Length"])
+        except (KeyError, ValueError):
+            return len(response.content)
+    
+    def _retry_delay(self, previous):
+        # Decorrelated jitter: spreads the retries of concurrent callers while still backing off
+        return min(self.retry_max_delay, random.uniform(self.retry_base_delay, previous * 3))
+    
+    def _can_retry(self, instrumentation, endpoint):
+        budget = instrumentation.retry_budget if instrumentation else None
+        if budget is None or budget.spend():
+            return True
+        self.logger.warning("Retry budget of this run is spent, not retrying %s", endpoint)
+        return False
+    
+    def _release_concurrency(self, concurrency, slot, status, seconds, breaker, endpoint, instrumentation):
+        # An open or half-open breaker pins the group to its minimum concurrency until it closes
+        decision, reason, limit = concurrency.release(slot, status, seconds, breaker.state)
+        if instrumentation:
+            instrumentation.record_concurrency(endpoint, decision, reason, limit)
+    
+    def _record_failure(self, breaker, instrumentation):
+        if breaker.record_failure() and instrumentation:
+            instrumentation.record_breaker_trip(breaker.name)
+
+class RingCentralClient(ApiClient):
+    service_name = "RingCentral"
+    
     def __init__(self, credentials, debug=False):
+        super().__init__()
         self.credentials = credentials
-        self.base_url = "https://platform.ringcentral.com/restapi/v1.0"
+        self.server_url = credentials.get("server_url", "https://platform.ringcentral.com")
+        self.base_url = f"{self.server_url}/restapi/v1.0"
         self.access_token = None
         self.token_expiry = None
         self.logger = logging.getLogger("RingCentralClient")
         self.debug = debug
+        # Breaker states are shared, so an outage seen by one run is not rediscovered by the next
+        breaker_store = get_breaker_store()
         self.circuit_breakers = {
-            "token": CircuitBreaker("rc_token"),
-            "call_logs": CircuitBreaker("rc_call_logs"),
-            "recording": CircuitBreaker("rc_recording"),
-            "voicemail": CircuitBreaker("rc_voicemail")
+            "token": CircuitBreaker("rc_token", store=breaker_store),
+            "call_logs": CircuitBreaker("rc_call_logs", store=breaker_store),
+            "recording": CircuitBreaker("rc_recording", store=breaker_store),
+            "voicemail": CircuitBreaker("rc_voicemail", store=breaker_store),
+            "subscription": CircuitBreaker("rc_subscription", store=breaker_store)
         }
     
-    def get_call_logs(self, extension_id, start_date=None, end_date=None):
-        # Implementation for retrieving call logs
-        pass
+    def _refresh_access_token(self):
+        from requests.exceptions import RequestException
+        
+        breaker = self.circuit_breakers["token"]
+        if not breaker.allow_request():
+            raise RequestException("RingCentral token circuit is open")
+        
+        try:
+            response = self.session.post(
+                f"{self.server_url}/restapi/oauth/token",
+                auth=(self.credentials["client_id"], self.credentials["client_secret"]),
+                data={
+                    "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                    "assertion": self.credentials["jwt_private_key"]
+                },
+                timeout=30
+            )
+            response.raise_for_status()
+        except RequestException:
+            breaker.record_failure()
+            raise
+        
+        breaker.record_success()
+        token = response.json()
+        self.access_token = token["access_token"]
+        self.token_expiry = time.time() + token.get("expires_in", 3600)
+        return self.access_token
+    
+    def iter_call_log_pages(self, extension_id, start_date=None, end_date=None, direction=None, type=None,
+                            result=None, page=1, per_page=250, view="Detailed"):
+        """
+        Yield call log records one page at a time.
+        
+        Args:
+            extension_id (str): RingCentral extension ID
+            start_date (str): ISO start of the window
+            end_date (str): ISO end of the window
+            direction (str): Call direction filter
+            type (str): Call type filter
+            result (str): Call result filter
+            page (int): First page to fetch
+            per_page (int): Records per page
+            view (str): "Simple" leaves out the call legs, which makes pages much smaller;
+                "Detailed" includes them
+        
+        Yields:
+            tuple: (page number, list of call records)
+        """
+        params = {"view": view, "perPage": per_page}
+        if start_date:
+            params["dateFrom"] = start_date
+        if end_date:
+            params["dateTo"] = end_date
+        if direction:
+            params["direction"] = direction
+        if type:
+            params["type"] = type
+        
+        while True:
+            params["page"] = page
+            response = self._request("GET", f"/account/~/extension/{extension_id}/call-log", "call_logs", params=params)
+            if response is None:
+                return
+            
+            with stage_timer("parse"):
+                data = response.json()
+            records = data.get("records", [])
+            if result:
+                records = [record for record in records if record.get("result") == result]
+            
+            yield page, records
+            
+            if "nextPage" not in data.get("navigation", {}):
+                return
+            page += 1
+    
+    def get_call_logs(self, extension_id, start_date=None, end_date=None, direction=None, type=None, result=None,
+                      view="Detailed"):
+        call_logs = []
+        for _, records in self.iter_call_log_pages(extension_id, start_date, end_date, direction, type, result,
+                                                   view=view):
+            call_logs.extend(records)
+        return call_logs
+    
+    def get_call_logs_sliced(self, extension_id, start_date, end_date, slices=4, direction=None, type=None,
+                             result=None, max_workers=8, view="Detailed"):
+        """
+        Fetch a call log window as concurrent time slices.
+        
+        Args:
+            extension_id (str): RingCentral extension ID
+            start_date (str): ISO start of the window
+            end_date (str): ISO end of the window
+            slices (int): Number of time slices
+            direction (str): Call direction filter
+            type (str): Call type filter
+            result (str): Call result filter
+            max_workers (int): Maximum slices fetched at the same time
+            view (str): "Simple" or "Detailed"
+        
+        Returns:
+            list: Call records in startTime order without duplicates
+        """
+        from dateutil.parser import parse as date_parse
+        
+        window_start = date_parse(start_date)
+        slice_length = (date_parse(end_date) - window_start) / slices
+        boundaries = [
+            (window_start + slice_length * i).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            for i in range(slices)
+        ] + [end_date]
+        
+        # Requests from all slices draw on the same rate limit budget and count towards the caller's run
+        instrumentation = current_instrumentation()
+        
+        def fetch_slice(slice_start, slice_end):
+            with bind_instrumentation(instrumentation):
+                return self.get_call_logs(extension_id, slice_start, slice_end, direction, type, result, view)
+        
+        with ThreadPoolExecutor(max_workers=min(slices, max_workers)) as executor:
+            futures = [
+                executor.submit(fetch_slice, boundaries[i], boundaries[i + 1])
+                for i in range(slices)
+            ]
+            slice_results = [future.result() for future in futures]
+        
+        # Calls that start exactly on a boundary are returned by both neighbouring slices
+        merged = {}
+        for records in slice_results:
+            for record in records:
+                merged.setdefault(record.get("id"), record)
+        
+        return sorted(merged.values(), key=lambda record: (record.get("startTime", ""), record.get("id", "")))
+    
+    def get_call_log_for_session(self, extension_id, telephony_session_id):
+        response = self._request(
+            "GET",
+            f"/account/~/extension/{extension_id}/call-log",
+            "call_logs",
+            params={"telephonySessionId": telephony_session_id, "view": "Detailed"}
+        )
+        if response is None:
+            return []
+        return response.json().get("records", [])
+    
+    def create_subscription(self, event_filters, address, verification_token=None, expires_in=604800):
+        delivery_mode = {"transportType": "WebHook", "address": address}
+        if verification_token:
+            delivery_mode["verificationToken"] = verification_token
+        
+        response = self._request(
+            "POST",
+            "/subscription",
+            "subscription",
+            json={"eventFilters": event_filters, "deliveryMode": delivery_mode, "expiresIn": expires_in}
+        )
+        return response.json() if response is not None else None
+    
+    def renew_subscription(self, subscription_id):
+        response = self._request("POST", f"/subscription/{subscription_id}/renew", "subscription")
+        return response.json() if response is not None else None
+    
+    def delete_subscription(self, subscription_id):
+        return self._request("DELETE", f"/subscription/{subscription_id}", "subscription") is not None
     
     def get_recording_content(self, recording_id):
-        # Implementation for getting call recording content
-        pass
+        response = self._request("GET", f"/account/~/recording/{recording_id}/content", "recording")
+        return response.content if response is not None else None
     
     def get_voicemail_content(self, message_id):
-        # Implementation for getting voicemail content
-        pass
+        response = self._request("GET", f"/account/~/extension/~/message-store/{message_id}", "voicemail")
+        if response is None:
+            return None
+        
+        for attachment in response.json().get("attachments", []):
+            if attachment.get("type") == "AudioRecording":
+                content = self._request("GET", attachment["uri"], "voicemail")
+                return content.content if content is not None else None
+        
+        self.logger.warning(f"Voicemail {message_id} has no audio attachment")
+        return None
 
-class ZohoClient:
-    def __init__(self, credentials, debug=False):
+class ZohoClient(ApiClient):
+    service_name = "Zoho"
+    default_rate_limit = (100, 60)
+    # Zoho allows 10 to 25 concurrent requests per organization depending on the edition
+    default_concurrency = (4, 1, 10)
+    # Zoho accepts at most 100 records per insert
+    MAX_RECORDS_PER_REQUEST = 100
+    # Fields returned by lead searches; callers only use the ID and owner
+    SEARCH_FIELDS = ("id", "Owner", "Phone")
+    rate_limit_headers = ("X-RATELIMIT-LIMIT", "X-RATELIMIT-REMAINING", None)
+    
+    def __init__(self, credentials, debug=False, seed_attachments=False):
+        from attachment_index import get_attachment_index
+        
+        super().__init__()
         self.credentials = credentials
-        self.base_url = "https://www.zohoapis.com/crm/v3"
+        self.accounts_url = credentials.get("accounts_url", "https://accounts.zoho.com")
+        self.base_url = f"{credentials.get('api_domain', 'https://www.zohoapis.com')}/crm/v3"
         self.access_token = None
         self.token_expiry = None
         self.logger = logging.getLogger("ZohoClient")
         self.debug = debug
         self.cache = ZohoCachingService()
+        # Content hashes of uploaded audio; seeding hashes a lead's older attachments before its first upload
+        self.attachment_index = get_attachment_index()
+        self.seed_attachments = seed_attachments
+        breaker_store = get_breaker_store()
         self.circuit_breakers = {
-            "token": CircuitBreaker("zoho_token"),
-            "search": CircuitBreaker("zoho_search"),
-            "create": CircuitBreaker("zoho_create"),
-            "update": CircuitBreaker("zoho_update"),
-            "notes": CircuitBreaker("zoho_notes"),
-            "attachments": CircuitBreaker("zoho_attachments")
+            "token": CircuitBreaker("zoho_token", store=breaker_store),
+            "search": CircuitBreaker("zoho_search", store=breaker_store),
+            "create": CircuitBreaker("zoho_create", store=breaker_store),
+            "update": CircuitBreaker("zoho_update", store=breaker_store),
+            "notes": CircuitBreaker("zoho_notes", store=breaker_store),
+            "attachments": CircuitBreaker("zoho_attachments", store=breaker_store)
         }
     
+    def _refresh_access_token(self):
+        from requests.exceptions import RequestException
+        
+        breaker = self.circuit_breakers["token"]
+        if not breaker.allow_request():
+            raise RequestException("Zoho token circuit is open")
+        
+        try:
+            response = self.session.post(
+                f"{self.accounts_url}/oauth/v2/token",
+                params={
+                    "grant_type": "refresh_token",
+                    "client_id": self.credentials["client_id"],
+                    "client_secret": self.credentials["client_secret"],
+                    "refresh_token": self.credentials["refresh_token"]
+                },
+                timeout=30
+            )
+            response.raise_for_status()
+        except RequestException:
+            breaker.record_failure()
+            raise
+        
+        breaker.record_success()
+        token = response.json()
+        self.access_token = token["access_token"]
+        self.token_expiry = time.time() + token.get("expires_in", 3600)
+        return self.access_token
+    
+    def _auth_headers(self):
+        return {"Authorization": f"Zoho-oauthtoken {self._get_access_token()}"}
+    
+    def _record_details(self, response):
+        if response is None:
+            return None
+        
+        return self._record_result(response.json().get("data", [{}])[0])
+    
+    def _record_result(self, record):
+        if record.get("code") != "SUCCESS":
+            self.logger.error(f"Zoho rejected record: {record.get('message', record)}")
+            return None
+        return record.get("details", {})
+    
     def search_by_phone(self, phone_number):
-        # Implementation for searching leads by phone
-        pass
+        # Only hits are cached; a miss may be followed by create_lead for the same caller
+        cached = self.cache.get(f"phone:{phone_number}")
+        if cached:
+            return cached
+        
+        response = self._request(
+            "GET",
+            "/Leads/search",
+            "search",
+            params={"phone": phone_number, "fields": ",".join(self.SEARCH_FIELDS)}
+        )
+        if response is None or response.status_code == 204:
+            return None
+        
+        with stage_timer("parse"):
+            leads = response.json().get("data", [])
+        if leads:
+            self.cache.set(f"phone:{phone_number}", leads[0])
+            return leads[0]
+        return None
     
     def create_lead(self, lead_data):
-        # Implementation for creating a lead
-        pass
+        return self.create_leads([lead_data])[0]
+    
+    def create_leads(self, leads_data):
+        """
+        Create leads with one request per MAX_RECORDS_PER_REQUEST payloads.
+        
+        Args:
+            leads_data (list): Lead payloads, e.g. built by a LeadTemplate
+        
+        Returns:
+            list: Created lead details for each payload, None where Zoho rejected it
+        """
+        results = []
+        for start in range(0, len(leads_data), self.MAX_RECORDS_PER_REQUEST):
+            chunk = leads_data[start:start + self.MAX_RECORDS_PER_REQUEST]
+            response = self._request("POST", "/Leads", "create", json={"data": chunk})
+            records = response.json().get("data", []) if response is not None else []
+            
+            for index, lead_data in enumerate(chunk):
+                lead = self._record_result(records[index]) if index < len(records) else None
+                if lead and lead_data.get("Phone"):
+                    self.cache.set(f"phone:{lead_data['Phone']}", lead)
+                results.append(lead)
+        return results
     
     def update_lead(self, lead_id, lead_update_data):
-        # Implementation for updating a lead
-        pass
+        response = self._request("PUT", f"/Leads/{lead_id}", "update", json={"data": [lead_update_data]})
+        return self._record_details(response)
     
     def add_note_to_lead(self, lead_id, content, title="Call Note"):
-        # Implementation for adding a note to a lead
-        pass
+        response = self._request(
+            "POST",
+            f"/Leads/{lead_id}/Notes",
+            "notes",
+            json={"data": [{"Note_Title": title, "Note_Content": content}]}
+        )
+        return self._record_details(response)
     
     def get_lead_notes(self, lead_id):
-        # Implementation for retrieving lead notes
-        pass
+        response = self._request(
+            "GET",
+            f"/Leads/{lead_id}/Notes",
+            "notes",
+            params={"fields": "Note_Title,Note_Content"}
+        )
+        if response is None or response.status_code == 204:
+            return []
+        return response.json().get("data", [])
+    
+    def get_lead_attachments(self, lead_id):
+        """Return the attachments of a lead, or None if they could not be listed."""
+        response = self._request(
+            "GET",
+            f"/Leads/{lead_id}/Attachments",
+            "attachments",
+            params={"fields": "id,File_Name,Size"}
+        )
+        if response is None:
+            return None
+        if response.status_code == 204:
+            return []
+        return response.json().get("data", [])
+    
+    def download_attachment(self, lead_id, attachment_id):
+        response = self._request("GET", f"/Leads/{lead_id}/Attachments/{attachment_id}", "attachments")
+        return response.content if response is not None else None
     
     def attach_audio_to_lead(self, lead_id, call, audio_content, content_type, call_time, file_type):
-        # Implementation for attaching audio to a lead
-        pass
+        """
+        Upload audio to a lead unless the lead already has an attachment with the same content.
+        
+        Returns:
+            dict: Zoho record details of the upload, or of the earlier attachment with
+                "duplicate" set; None if Zoho did not accept the upload
+        """
+        from attachment_index import content_hash
+        
+        extension = "mp3" if content_type == "audio/mpeg" else "wav"
+        timestamp = call.get("startTime", call_time).replace(":", "").replace("-", "")[:15]
+        filename = f"{file_type}_{call.get('id', 'unknown')}_{timestamp}.{extension}"
+        
+        index = self.attachment_index
+        if index is None:
+            return self._upload_attachment(lead_id, filename, audio_content, content_type)
+        
+        digest = content_hash(audio_content)
+        with index.hold(lead_id, digest):
+            if self.seed_attachments:
+                index.seed_lead(self, lead_id)
+            existing = index.lookup(lead_id, digest)
+            if existing:
+                self.logger.info(f"Lead {lead_id} already has {file_type} {filename} as {existing[1]}, not uploading it again")
+                return {"id": existing[0], "duplicate": True}
+            
+            details = self._upload_attachment(lead_id, filename, audio_content, content_type)
+            if details:
+                index.record(lead_id, digest, details.get("id"), filename)
+            return details
+    
+    def _upload_attachment(self, lead_id, filename, audio_content, content_type):
+        response = self._request(
+            "POST",
+            f"/Leads/{lead_id}/Attachments",
+            "attachments",
+            files={"file": (filename, audio_content, content_type)}
+        )
+        return self._record_details(response)
+
+class RateLimitBudget:
+    def __init__(self, name, limit=10, window=60, headers=("X-Rate-Limit-Limit", "X-Rate-Limit-Remaining", "X-Rate-Limit-Window")):
+        self.name = name
+        self.headers = headers
+        self.limit = limit
+        self.window = window
+        self.tokens = float(limit)
+        self.remaining = None  # As last reported by the API
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.logger = logging.getLogger(f"RateLimitBudget-{name}")
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.window)
+        self.updated = now
+    
+    def acquire(self):
+        with self.condition:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                self.condition.wait((1 - self.tokens) * self.window / self.limit)
+    
+    def update(self, headers):
+        # The APIs report the remaining budget of each API group on every response
+        limit_header, remaining_header, window_header = self.headers
+        try:
+            limit = int(headers[limit_header])
+            remaining = int(headers[remaining_header])
+            window = int(headers[window_header]) if window_header else self.window
+        except (KeyError, ValueError):
+            return
+        
+        with self.condition:
+            self._refill()
+            self.limit = max(limit, 1)
+            self.window = max(window, 1)
+            self.tokens = min(self.tokens, remaining)
+            self.remaining = remaining
+            self.condition.notify_all()
+    
+    def status(self):
+        with self.condition:
+            return {"limit": self.limit, "window": self.window, "remaining": self.remaining}
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD limit on the requests of one API group in flight at the same time.
+    
+    Each healthy response raises the limit by 1/limit, so it grows by about one
+    per round of requests. A 429, a 5xx, a connection error or a response much
+    slower than the usual latency cuts it by the backoff factor, and a breaker
+    that is not closed pins it to the minimum until the breaker closes again.
+    """
+    
+    def __init__(self, name, initial=4, minimum=1, maximum=16, backoff=0.5, latency_tolerance=2.0,
+                 min_spike_seconds=0.1):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.min_spike_seconds = min_spike_seconds
+        self.in_flight = 0
+        self.baseline = None  # Smoothed latency of healthy responses
+        self.samples = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        self.logger = logging.getLogger(f"AdaptiveConcurrencyLimit-{name}")
+    
+    def acquire(self):
+        """
+        Wait for a free slot.
+        
+        Returns:
+            float: Start time to hand back to release()
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+    
+    def _classify(self, status, seconds, breaker_state):
+        if breaker_state != "CLOSED":
+            return "breaker"
+        if status is None:
+            return "connection_error"
+        if status == 429:
+            return "throttled"
+        if status >= 500:
+            return "server_error"
+        # Too few samples make for a noisy baseline; spikes must also be large in absolute terms
+        if (self.samples >= 10 and seconds > self.baseline * self.latency_tolerance
+                and seconds - self.baseline > self.min_spike_seconds):
+            return "latency"
+        return None
+    
+    def release(self, started, status, seconds, breaker_state="CLOSED"):
+        """
+        Free a slot and adjust the limit from the response.
+        
+        Args:
+            started (float): Value returned by acquire()
+            status (int): HTTP status, or None for a connection error
+            seconds (float): Request latency
+            breaker_state (str): State of the API group's circuit breaker
+        
+        Returns:
+            tuple: (decision, reason, limit) - decision is "increase", "decrease" or "hold"
+        """
+        with self.condition:
+            self.in_flight -= 1
+            previous = self.limit
+            reason = self._classify(status, seconds, breaker_state)
+            
+            if reason == "breaker":
+                self.limit = float(self.minimum)
+            elif reason:
+                # Requests sent before the last cut saw the old limit; one cut per overload is enough
+                if started > self.last_decrease:
+                    self.limit = max(float(self.minimum), self.limit * self.backoff)
+                    self.last_decrease = time.monotonic()
+            else:
+                self.samples += 1
+                self.baseline = seconds if self.baseline is None else self.baseline * 0.9 + seconds * 0.1
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            
+            self.condition.notify_all()
+            limit = self.limit
+        
+        if limit < previous:
+            decision = "decrease"
+            self.logger.debug("Concurrency of %s cut from %.1f to %.1f (%s)", self.name, previous, limit, reason)
+        elif limit > previous:
+            decision = "increase"
+        else:
+            decision = "hold"
+        return decision, reason, limit
+    
+    def status(self):
+        with self.condition:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "baseline_latency_ms": round(self.baseline * 1000, 3) if self.baseline is not None else None
+            }
+
+class RetryBudget:
+    """
+    Caps the retries of one run at a share of its requests.
+    
+    During an outage every request fails; without a budget each one would be
+    retried max_attempts times. With it, retries stop once they exceed the
+    minimum plus the ratio of the requests made so far, and requests fail fast
+    until successful traffic earns new retries.
+    """
+    
+    def __init__(self, ratio=0.2, minimum=10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = 0
+        self.retries = 0
+        self.denied = 0
+        self.lock = threading.Lock()
+    
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+    
+    def spend(self):
+        """Take one retry from the budget; returns False when it is spent."""
+        with self.lock:
+            if self.retries < self.minimum + self.ratio * self.requests:
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+    
+    def status(self):
+        with self.lock:
+            return {"requests": self.requests, "retries": self.retries, "denied": self.denied,
+                    "ratio": self.ratio, "minimum": self.minimum}
+
+class BreakerStateStore:
+    """
+    Circuit breaker states shared by every client, run and process using the same data directory.
+    
+    Only state changes are written, so a breaker that stays closed costs one
+    read per sync interval. A breaker opened by one run is open for all of
+    them, and once it may be probed again exactly one of them sends the probe.
+    """
+    
+    def __init__(self, db_path="data/breaker_state.db"):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS breakers (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                opened_at REAL,
+                probe_at REAL,
+                updated_at REAL NOT NULL
+            )
+        """)
+    
+    def get(self, name):
+        """Return (state, opened_at) of a breaker, or None if no run has changed it yet."""
+        with self.lock:
+            return self.conn.execute("SELECT state, opened_at FROM breakers WHERE name = ?", (name,)).fetchone()
+    
+    def set_state(self, name, state, opened_at=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO breakers (name, state, opened_at, probe_at, updated_at) VALUES (?, ?, ?, NULL, ?)",
+                (name, state, opened_at, time.time())
+            )
+    
+    def claim_probe(self, name, reset_timeout):
+        """
+        Move an open breaker to HALF-OPEN for the caller once its reset timeout has passed.
+        
+        A probe that was claimed but never reported back, e.g. because its process
+        died, can be claimed again after another reset timeout.
+        
+        Returns:
+            bool: True if the caller should send the probe request
+        """
+        now = time.time()
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE breakers SET state = 'HALF-OPEN', probe_at = ?, updated_at = ? WHERE name = ? AND ("
+                "(state = 'OPEN' AND opened_at <= ?) OR (state = 'HALF-OPEN' AND probe_at <= ?))",
+                (now, now, name, now - reset_timeout, now - reset_timeout)
+            ).rowcount == 1
+
+_breaker_store = None
+_breaker_store_lock = threading.Lock()
+
+def get_breaker_store():
+    """Return the process-wide BreakerStateStore, or None if the database cannot be opened."""
+    global _breaker_store
+    with _breaker_store_lock:
+        if _breaker_store is None:
+            try:
+                _breaker_store = BreakerStateStore()
+            except sqlite3.Error as e:
+                logging.getLogger("CircuitBreaker").warning(f"Circuit breaker state will not be shared: {str(e)}")
+                _breaker_store = False
+        return _breaker_store or None
 
 class CircuitBreaker:
-    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+    def __init__(self, name, failure_threshold=5, reset_timeout=60, store=None, sync_interval=1.0):
         self.name = name
         self.failure_threshold = failure_threshold
         self.reset_timeout = reset_timeout
@@ -89,18 +902,102 @@ class CircuitBreaker:
         self.state = "CLOSED"  # CLOSED, OPEN, HALF-OPEN
         self.last_failure_time = None
         self.logger = logging.getLogger(f"CircuitBreaker-{name}")
+        # Optional BreakerStateStore shared with other clients and processes
+        self.store = store
+        self.sync_interval = sync_interval
+        self.synced_at = 0.0
+        # One client, and so one breaker, is shared by the threads of a run
+        self.lock = threading.Lock()
+        self.probe_thread = None
+        self.probe_started = 0.0
+    
+    def _publish(self, state, opened_at=None):
+        if self.store is None:
+            return
+        try:
+            self.store.set_state(self.name, state, opened_at)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Could not share state of circuit {self.name}: {str(e)}")
+    
+    def _sync(self, force=False):
+        now = time.monotonic()
+        if self.store is None or (not force and now - self.synced_at < self.sync_interval):
+            return
+        self.synced_at = now
+        try:
+            shared = self.store.get(self.name)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Could not read shared state of circuit {self.name}: {str(e)}")
+            return
+        if shared is None:
+            return
+        
+        state, opened_at = shared
+        if state == "CLOSED":
+            if self.state != "CLOSED":
+                self.logger.info(f"Circuit {self.name} closed by another run")
+                self.failures = 0
+                self.state = "CLOSED"
+        elif self.state != "HALF-OPEN":
+            # Open elsewhere, or half-open with another run's probe in flight: wait either way
+            if self.state == "CLOSED":
+                self.logger.warning(f"Circuit {self.name} is open in another run, skipping requests")
+            self.state = "OPEN"
+            self.last_failure_time = max(self.last_failure_time or 0, opened_at or 0)
     
     def record_failure(self):
-        # Implementation for recording a failure
-        pass
+        """Count a failure; returns True when it opened the circuit."""
+        with self.lock:
+            self.failures += 1
+            self.last_failure_time = time.time()
+            self.probe_thread = None
+            if self.state == "HALF-OPEN" or self.failures >= self.failure_threshold:
+                opened = self.state != "OPEN"
+                if opened:
+                    self.logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                    self._publish("OPEN", self.last_failure_time)
+                self.state = "OPEN"
+                return opened
+            return False
     
     def record_success(self):
-        # Implementation for recording a success
-        pass
+        with self.lock:
+            if self.state != "CLOSED":
+                self.logger.info(f"Circuit {self.name} closed")
+                self._publish("CLOSED")
+            self.failures = 0
+            self.state = "CLOSED"
+            self.probe_thread = None
     
     def allow_request(self):
-        # Implementation for determining if a request should be allowed
-        pass
+        with self.lock:
+            self._sync()
+            if self.state == "HALF-OPEN":
+                # One probe per process: other threads wait for its outcome, unless it never reported back
+                if self.probe_thread == threading.get_ident() or time.time() - self.probe_started >= self.reset_timeout:
+                    self._start_probe()
+                    return True
+                return False
+            if self.state == "OPEN":
+                if time.time() - self.last_failure_time >= self.reset_timeout:
+                    if self.store is not None:
+                        try:
+                            claimed = self.store.claim_probe(self.name, self.reset_timeout)
+                        except sqlite3.Error:
+                            claimed = True
+                        if not claimed:
+                            # Another run is probing, or the shared state has moved on
+                            self._sync(force=True)
+                            return self.state == "CLOSED"
+                    self.state = "HALF-OPEN"
+                    self._start_probe()
+                    return True
+                return False
+            return True
+    
+    def _start_probe(self):
+        self.probe_thread = threading.get_ident()
+        self.probe_started = time.time()
 
 class ZohoCachingService:
     def __init__(self, max_size=128, ttl=300):  # 5-minute TTL by default
@@ -110,88 +1007,1194 @@ class ZohoCachingService:
         self.cache_times = {}
         self.cache_keys = []  # For LRU tracking
         self.logger = logging.getLogger("ZohoCachingService")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
     
     def get(self, key):
-        # Implementation for cache retrieval with TTL check
-        pass
+        with self.lock:
+            if key not in self.cache:
+                self.misses += 1
+                return None
+            
+            if time.time() - self.cache_times[key] > self.ttl:
+                self._evict(key)
+                self.misses += 1
+                return None
+            
+            self.hits += 1
+            self.cache_keys.remove(key)
+            self.cache_keys.append(key)
+            return self.cache[key]
     
     def set(self, key, value):
-        # Implementation for cache setting with LRU eviction
-        pass
+        with self.lock:
+            if key in self.cache:
+                self.cache_keys.remove(key)
+            elif len(self.cache_keys) >= self.max_size:
+                self._evict(self.cache_keys[0])
+            
+            self.cache[key] = value
+            self.cache_times[key] = time.time()
+            self.cache_keys.append(key)
+    
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.cache_keys),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+    
+    def _evict(self, key):
+        self.cache.pop(key, None)
+        self.cache_times.pop(key, None)
+        if key in self.cache_keys:
+            self.cache_keys.remove(key)
+
+class FrozenDict(dict):
+    """dict that rejects changes; still a dict, so it serializes to JSON as usual."""
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Configuration snapshots are read-only")
+    
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class ConfigSnapshot:
+    """
+    Read-only view of the configuration files, parsed and validated once.
+    
+    The snapshot remembers the modification time of every file it read and is
+    replaced by get_config_snapshot() as soon as one of them changes. Problems
+    with one office's files are kept and raised only when that office is used,
+    so one broken office does not stop the others.
+    """
+    
+    key_file = "data/encryption.key"
+    credentials_file = "data/credentials.enc"
+    field_mappings_file = "data/zoho_field_mappings.json"
+    offices_files = ("data/offices.json", "sorted/data/offices.json")
+    
+    def __init__(self):
+        self.root = os.getcwd()
+        self.signatures = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self._credentials = None
+        self._lead_templates = None
+        
+        offices_file = next((path for path in self.offices_files if os.path.exists(path)), None)
+        for path in self.offices_files + (self.key_file, self.credentials_file, self.field_mappings_file):
+            self.signatures[path] = _file_signature(path)
+        
+        if offices_file:
+            offices_data = self._load_json(offices_file)
+            self.offices = _freeze([
+                dict(office_data, id=office_id)
+                for office_id, office_data in offices_data.get("offices", {}).items()
+            ])
+            self.global_config = _freeze(offices_data.get("global_config", {}))
+        else:
+            self.offices = _freeze([{"id": "singlecompany", "name": "Single Company", "processing_order": 1}])
+            self.global_config = FrozenDict()
+        
+        self._field_mappings = self._load_checked("field_mappings", self.field_mappings_file, lambda data: data)
+        
+        self._extensions = {}
+        self._lead_owners = {}
+        for office in self.offices:
+            office_id = office["id"]
+            self._extensions[office_id] = self._load_checked(
+                office_id, self._office_file(office_id, "extensions.json"), self._validate_extensions
+            )
+            self._lead_owners[office_id] = self._load_checked(
+                office_id, self._office_file(office_id, "lead_owners.json"), self._validate_lead_owners
+            )
+    
+    @staticmethod
+    def _office_file(office_id, filename):
+        # Single company mode keeps its configuration directly under data/
+        if office_id == "singlecompany":
+            return os.path.join("data", filename)
+        return os.path.join("sorted", office_id, filename)
+    
+    @staticmethod
+    def _load_json(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    
+    def _load_checked(self, name, path, validate):
+        self.signatures[path] = _file_signature(path)
+        try:
+            return _freeze(validate(self._load_json(path)))
+        except (OSError, ValueError) as e:
+            self.errors.setdefault(name, e)
+            return None
+    
+    @staticmethod
+    def _validate_extensions(data):
+        extensions = data.get("extensions", [])
+        for extension in extensions:
+            if "id" not in extension:
+                raise ValueError(f"Extension without an id: {extension}")
+        return [extension for extension in extensions if extension.get("process_calls", True)]
+    
+    @staticmethod
+    def _validate_lead_owners(data):
+        lead_owners = data.get("lead_owners", [])
+        for owner in lead_owners:
+            if "id" not in owner:
+                raise ValueError(f"Lead owner without a Zoho user id: {owner}")
+            weight = owner.get("assignment_weight", 1)
+            if not isinstance(weight, (int, float)) or weight < 0:
+                raise ValueError(f"Lead owner {owner['id']} has an invalid assignment_weight: {weight}")
+        return {"lead_owners": lead_owners, "assignment_rules": data.get("assignment_rules", {})}
+    
+    def is_current(self):
+        if os.getcwd() != self.root:
+            return False
+        return all(_file_signature(path) == signature for path, signature in self.signatures.items())
+    
+    def _raise_for(self, name):
+        if name in self.errors:
+            raise self.errors[name]
+    
+    def credentials(self):
+        # Decrypted on first use only, so reading the office list does not need the key
+        with self.lock:
+            if self._credentials is None:
+                from cryptography.fernet import Fernet
+                
+                with open(self.key_file, "rb") as f:
+                    cipher = Fernet(f.read())
+                with open(self.credentials_file, "rb") as f:
+                    credentials = json.loads(cipher.decrypt(f.read()).decode("utf-8"))
+                
+                for service in ("ringcentral", "zoho"):
+                    if not isinstance(credentials.get(service), dict):
+                        raise ValueError(f"Credentials are missing the {service} section")
+                self._credentials = _freeze(credentials)
+            return self._credentials
+    
+    def extensions(self, office_id):
+        if office_id not in self._extensions:
+            return _freeze(self._validate_extensions(self._load_json(self._office_file(office_id, "extensions.json"))))
+        self._raise_for(office_id)
+        return self._extensions[office_id]
+    
+    def _lead_owner_file(self, office_id):
+        if office_id not in self._lead_owners:
+            return _freeze(self._validate_lead_owners(self._load_json(self._office_file(office_id, "lead_owners.json"))))
+        self._raise_for(office_id)
+        return self._lead_owners[office_id]
+    
+    def lead_owners(self, office_id):
+        return self._lead_owner_file(office_id)["lead_owners"]
+    
+    def assignment_rules(self, office_id):
+        return self._lead_owner_file(office_id)["assignment_rules"]
+    
+    def field_mappings(self):
+        self._raise_for("field_mappings")
+        return self._field_mappings
+    
+    def lead_templates(self):
+        # Compiled on first use and then shared for as long as the mappings file is unchanged
+        with self.lock:
+            if self._lead_templates is None:
+                from lead_templates import LeadTemplates
+                
+                self._lead_templates = LeadTemplates(self.field_mappings())
+            return self._lead_templates
+
+_config_snapshot = None
+_config_snapshot_lock = threading.Lock()
+
+def get_config_snapshot():
+    """Return the shared configuration snapshot, reloading it if any of its files changed."""
+    global _config_snapshot
+    
+    with _config_snapshot_lock:
+        if _config_snapshot is None or not _config_snapshot.is_current():
+            _config_snapshot = ConfigSnapshot()
+            logging.getLogger("SecureStorage").debug(
+                "Loaded configuration for %s offices from %s", len(_config_snapshot.offices), _config_snapshot.root
+            )
+        return _config_snapshot
 
 class SecureStorage:
     def __init__(self, debug=False):
-        self.key_file = "data/encryption.key"
-        self.credentials_file = "data/credentials.enc"
+        self.key_file = ConfigSnapshot.key_file
+        self.credentials_file = ConfigSnapshot.credentials_file
         self.debug = debug
         self.logger = logging.getLogger("SecureStorage")
     
     def load_key(self):
-        # Implementation for loading encryption key
-        pass
+        with open(self.key_file, "rb") as f:
+            return f.read()
     
     def load_credentials(self):
-        # Implementation for loading credentials
-        pass
+        return get_config_snapshot().credentials()
     
     def load_office_list(self):
-        # Implementation for loading office list
-        pass
+        return list(get_config_snapshot().offices)
+    
+    def load_global_config(self):
+        return get_config_snapshot().global_config
     
     def load_extensions(self, office_id):
-        # Implementation for loading extensions
-        pass
+        return list(get_config_snapshot().extensions(office_id))
     
     def load_lead_owners(self, office_id):
-        # Implementation for loading lead owners
-        pass
+        return list(get_config_snapshot().lead_owners(office_id))
+    
+    def load_assignment_rules(self, office_id):
+        return dict(get_config_snapshot().assignment_rules(office_id))
     
     def load_field_mappings(self):
-        # Implementation for loading field mappings
-        pass
+        return get_config_snapshot().field_mappings()
+    
+    def load_lead_templates(self):
+        return get_config_snapshot().lead_templates()
+
+_instrumentation_local = threading.local()
+
+def current_instrumentation():
+    """Return the RunInstrumentation bound to the current thread, if any."""
+    return getattr(_instrumentation_local, "instrumentation", None)
+
+@contextlib.contextmanager
+def bind_instrumentation(instrumentation):
+    """Record API requests and stages made by the current thread into an instrumentation object."""
+    previous = current_instrumentation()
+    _instrumentation_local.instrumentation = instrumentation
+    try:
+        yield instrumentation
+    finally:
+        _instrumentation_local.instrumentation = previous
+
+@contextlib.contextmanager
+def stage_timer(stage):
+    """Time a processing stage against the instrumentation bound to the current thread."""
+    instrumentation = current_instrumentation()
+    if instrumentation is None:
+        yield
+        return
+    
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        instrumentation.record_stage(stage, time.perf_counter() - started)
+
+def record_call_to_lead(call):
+    """Record how long after its start a call reached its lead, if instrumentation is bound."""
+    instrumentation = current_instrumentation()
+    if instrumentation is None or not call.get("startTime"):
+        return
+    
+    from dateutil.parser import parse as date_parse
+    
+    try:
+        started = date_parse(call["startTime"])
+    except (ValueError, OverflowError):
+        return
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=datetime.timezone.utc)
+    instrumentation.record_call_to_lead((datetime.datetime.now(datetime.timezone.utc) - started).total_seconds())
+
+class RunInstrumentation:
+    """Per-run stage timings and API accounting merged into the processing stats."""
+    
+    LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    CALL_TO_LEAD_BUCKETS_S = (60, 300, 900, 1800, 3600, 7200, 14400, 43200, 86400)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.endpoints = {}
+        self.breaker_trips = {}
+        self.concurrency = {}
+        self.retry_budget = RetryBudget()
+        self.call_to_lead = {
+            "count": 0,
+            "sum": 0.0,
+            "max": 0.0,
+            "buckets": {str(bound): 0 for bound in self.CALL_TO_LEAD_BUCKETS_S + ("inf",)}
+        }
+    
+    def record_stage(self, stage, seconds):
+        with self.lock:
+            entry = self.stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+    
+    def iter_stage(self, stage, iterable):
+        """Yield from an iterable, timing each step (e.g. each call log page fetched) as a stage."""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record_stage(stage, time.perf_counter() - started)
+                return
+            self.record_stage(stage, time.perf_counter() - started)
+            yield item
+    
+    def _endpoint(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "status": {},
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "rate_limit_wait_seconds": 0.0,
+                "latency_ms": {
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "buckets": {str(bound): 0 for bound in self.LATENCY_BUCKETS_MS + ("inf",)}
+                }
+            }
+        return self.endpoints[endpoint]
+    
+    def record_request(self, endpoint, status, seconds, wait_seconds=0.0, bytes_sent=0, bytes_received=0):
+        latency_ms = seconds * 1000
+        bucket = next((str(bound) for bound in self.LATENCY_BUCKETS_MS if latency_ms <= bound), "inf")
+        status_key = str(status) if status is not None else "connection_error"
+        
+        self.retry_budget.record_request()
+        with self.lock:
+            entry = self._endpoint(endpoint)
+            entry["requests"] += 1
+            if status is None or status >= 400:
+                entry["errors"] += 1
+            entry["status"][status_key] = entry["status"].get(status_key, 0) + 1
+            entry["bytes_sent"] += bytes_sent
+            entry["bytes_received"] += bytes_received
+            entry["rate_limit_wait_seconds"] += wait_seconds
+            entry["latency_ms"]["sum"] += latency_ms
+            entry["latency_ms"]["max"] = max(entry["latency_ms"]["max"], latency_ms)
+            entry["latency_ms"]["buckets"][bucket] += 1
+    
+    def record_retry(self, endpoint):
+        with self.lock:
+            self._endpoint(endpoint)["retries"] += 1
+    
+    def record_breaker_trip(self, breaker_name):
+        with self.lock:
+            self.breaker_trips[breaker_name] = self.breaker_trips.get(breaker_name, 0) + 1
+    
+    def record_concurrency(self, endpoint, decision, reason, limit):
+        with self.lock:
+            entry = self.concurrency.get(endpoint)
+            if entry is None:
+                entry = self.concurrency[endpoint] = {
+                    "increase": 0, "decrease": 0, "hold": 0, "reasons": {},
+                    "limit": limit, "min_limit": limit, "max_limit": limit, "recent_decreases": []
+                }
+            entry[decision] += 1
+            entry["limit"] = limit
+            entry["min_limit"] = min(entry["min_limit"], limit)
+            entry["max_limit"] = max(entry["max_limit"], limit)
+            if reason:
+                entry["reasons"][reason] = entry["reasons"].get(reason, 0) + 1
+            if decision == "decrease":
+                entry["recent_decreases"] = entry["recent_decreases"][-19:] + [{
+                    "time": datetime.datetime.now().isoformat(),
+                    "reason": reason,
+                    "limit": round(limit, 2)
+                }]
+    
+    def record_call_to_lead(self, seconds):
+        bucket = next((str(bound) for bound in self.CALL_TO_LEAD_BUCKETS_S if seconds <= bound), "inf")
+        with self.lock:
+            self.call_to_lead["count"] += 1
+            self.call_to_lead["sum"] += seconds
+            self.call_to_lead["max"] = max(self.call_to_lead["max"], seconds)
+            self.call_to_lead["buckets"][bucket] += 1
+    
+    def snapshot(self):
+        """
+        Return the collected measurements as a JSON-serializable dict.
+        
+        Returns:
+            dict: Stage timings, per-endpoint accounting, breaker trips, concurrency decisions and totals
+        """
+        with self.lock:
+            endpoints = json.loads(json.dumps(self.endpoints))
+            stages = {
+                stage: dict(entry, seconds=round(entry["seconds"], 6), max_seconds=round(entry["max_seconds"], 6))
+                for stage, entry in self.stages.items()
+            }
+            breaker_trips = dict(self.breaker_trips)
+            concurrency = json.loads(json.dumps(self.concurrency))
+            call_to_lead = json.loads(json.dumps(self.call_to_lead))
+        
+        call_to_lead["sum"] = round(call_to_lead["sum"], 3)
+        call_to_lead["max"] = round(call_to_lead["max"], 3)
+        
+        for entry in endpoints.values():
+            latency = entry["latency_ms"]
+            latency["avg"] = round(latency["sum"] / entry["requests"], 3) if entry["requests"] else 0.0
+            latency["sum"] = round(latency["sum"], 3)
+            latency["max"] = round(latency["max"], 3)
+            entry["rate_limit_wait_seconds"] = round(entry["rate_limit_wait_seconds"], 6)
+        
+        for entry in concurrency.values():
+            for field in ("limit", "min_limit", "max_limit"):
+                entry[field] = round(entry[field], 2)
+        
+        return {
+            "stages": stages,
+            "api": endpoints,
+            "breaker_trips": breaker_trips,
+            "concurrency": concurrency,
+            "retry_budget": self.retry_budget.status(),
+            "call_to_lead_seconds": call_to_lead,
+            "totals": {
+                "requests": sum(entry["requests"] for entry in endpoints.values()),
+                "errors": sum(entry["errors"] for entry in endpoints.values()),
+                "retries": sum(entry["retries"] for entry in endpoints.values()),
+                "bytes_sent": sum(entry["bytes_sent"] for entry in endpoints.values()),
+                "bytes_received": sum(entry["bytes_received"] for entry in endpoints.values()),
+                "breaker_trips": sum(breaker_trips.values())
+            }
+        }
+
+class RunProfiler:
+    """Optional cProfile and tracemalloc capture for one process_office run."""
+    
+    def __init__(self, enabled=False, top_n=25):
+        self.enabled = enabled
+        self.top_n = top_n
+        self.profiler = None
+        self.started_tracemalloc = False
+        self.marks = []  # (label, current bytes, peak bytes, snapshot)
+        self.logger = logging.getLogger("RunProfiler")
+    
+    def start(self):
+        if not self.enabled:
+            return
+        
+        import cProfile
+        
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.started_tracemalloc = True
+        self.mark("start")
+        
+        # Only the thread running process_office is profiled; sliced fetch workers are not
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+    
+    def mark(self, label):
+        """Take a tracemalloc snapshot at a stage boundary."""
+        if not self.enabled or not tracemalloc.is_tracing():
+            return
+        
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+        ))
+        self.marks.append((label, current, peak, snapshot))
+    
+    def stop(self):
+        if not self.enabled or self.profiler is None:
+            return
+        
+        self.profiler.disable()
+        self.mark("end")
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+    
+    def export(self, log_exporter):
+        """
+        Write the .pstats file and top-N CPU and allocation summaries next to the run's stats.
+        
+        Args:
+            log_exporter (LogExporter): Exporter of the run
+        
+        Returns:
+            dict: Paths of the written files and memory at each stage boundary
+        """
+        if not self.enabled or self.profiler is None:
+            return None
+        
+        import pstats
+        
+        pstats_path = log_exporter._export_path("stats", f"{log_exporter.script_name}_profile", ".pstats")
+        stem = pstats_path[:-len(".pstats")]
+        self.profiler.dump_stats(pstats_path)
+        
+        cpu_path = f"{stem}_cpu.txt"
+        with open(cpu_path, "w") as f:
+            for sort_key, title in (("cumulative", "cumulative time"), ("tottime", "own time")):
+                stream = io.StringIO()
+                pstats.Stats(self.profiler, stream=stream).sort_stats(sort_key).print_stats(self.top_n)
+                f.write(f"=== Top {self.top_n} functions by {title} ===\n")
+                f.write(stream.getvalue())
+                f.write("\n")
+        
+        memory_path = f"{stem}_memory.txt"
+        boundaries = []
+        with open(memory_path, "w") as f:
+            f.write("=== Traced memory at stage boundaries ===\n")
+            for label, current, peak, _ in self.marks:
+                f.write(f"{label:<40} current {current / 1048576:10.2f} MB   peak {peak / 1048576:10.2f} MB\n")
+                boundaries.append({"stage": label, "current_bytes": current, "peak_bytes": peak})
+            
+            # Growth between consecutive boundaries shows which stage holds on to memory
+            for (previous_label, _, _, previous), (label, _, _, snapshot) in zip(self.marks, self.marks[1:]):
+                f.write(f"\n=== Top {self.top_n} allocation changes: {previous_label} -> {label} ===\n")
+                for stat in snapshot.compare_to(previous, "lineno")[:self.top_n]:
+                    f.write(f"{stat}\n")
+            
+            if self.marks:
+                f.write(f"\n=== Top {self.top_n} live allocations at end ===\n")
+                for stat in self.marks[-1][3].statistics("lineno")[:self.top_n]:
+                    f.write(f"{stat}\n")
+        
+        self.logger.info(f"Wrote profile to {pstats_path}")
+        return {
+            "pstats": pstats_path,
+            "cpu_summary": cpu_path,
+            "memory_summary": memory_path,
+            "memory": boundaries
+        }
+
+RAW_LOG_EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst", "none": ".ndjson"}
+
+class NdjsonWriter:
+    """Append-only, compressed NDJSON stream that rotates to a new file past a size limit."""
+    
+    def __init__(self, path_factory, compression="gzip", max_bytes=64 * 1024 * 1024):
+        """
+        Initialize the writer. Files are opened lazily on the first record.
+        
+        Args:
+            path_factory (callable): Returns a fresh path for a file extension, called per file
+            compression (str): "gzip", "zstd" or "none"; zstd falls back to gzip when not installed
+            max_bytes (int): Rotate once a file holds this many bytes on disk
+        """
+        if compression == "zstd" and not HAVE_ZSTD:
+            logging.getLogger("LogExporter").warning("zstandard is not installed, writing gzip raw logs instead")
+            compression = "gzip"
+        if compression not in RAW_LOG_EXTENSIONS:
+            raise ValueError(f"Unknown raw log compression: {compression}")
+        
+        self.path_factory = path_factory
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.paths = []
+        self.records = 0
+        self._raw = None
+        self._stream = None
+    
+    def _open(self):
+        path = self.path_factory(RAW_LOG_EXTENSIONS[self.compression])
+        self._raw = open(path, "wb")
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        elif self.compression == "zstd":
+            import zstandard
+            self._stream = zstandard.ZstdCompressor(level=3).stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+        self.paths.append(path)
+    
+    def write(self, record):
+        if self._stream is None:
+            self._open()
+        self._stream.write(json.dumps(record, separators=(",", ":"), default=str).encode("utf-8") + b"\n")
+        self.records += 1
+        
+        # The raw file position is the compressed size flushed so far
+        if self._raw.tell() >= self.max_bytes:
+            self._close_file()
+    
+    def flush(self):
+        """Push buffered records to disk so a crashed run keeps everything written so far."""
+        if self._stream is None:
+            return
+        if self.compression == "zstd":
+            import zstandard
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self._stream.flush()
+        self._raw.flush()
+    
+    def _close_file(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._stream = self._raw = None
+    
+    def close(self):
+        if self._stream is not None:
+            self._close_file()
+
+def _raw_log_sort_key(path):
+    # Rotated files share a timestamp and differ by a numeric counter
+    match = re.search(r"_(\d{8}_\d{6})(?:_(\d+))?\.", os.path.basename(path))
+    if not match:
+        return (os.path.basename(path), 0)
+    return (match.group(1), int(match.group(2) or 1))
+
+def read_raw_logs(path):
+    """
+    Yield the records of one raw log file.
+    
+    Reads compressed and plain NDJSON streams as well as the JSON list files
+    written by earlier versions. A stream cut short by a crash yields every
+    complete record before the cut.
+    
+    Args:
+        path (str): Raw log file
+    
+    Yields:
+        dict: Call log records in the order they were written
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            yield from json.load(f)
+        return
+    
+    if path.endswith(".gz"):
+        stream = gzip.open(path, "rb")
+    elif path.endswith(".zst"):
+        if not HAVE_ZSTD:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        import zstandard
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    else:
+        stream = open(path, "rb")
+    
+    truncated_errors = (EOFError, zlib.error) + ((sys.modules["zstandard"].ZstdError,) if path.endswith(".zst") else ())
+    with stream:
+        try:
+            for line in stream:
+                if line.endswith(b"\n"):
+                    yield json.loads(line)
+        except truncated_errors:
+            logging.getLogger("LogExporter").warning(f"Raw log {path} is truncated, stopping at the last complete record")
 
 class LogExporter:
-    def __init__(self, script_name, office_id, date_str, debug=False):
+    def __init__(self, script_name, office_id, date_str, debug=False, compression="gzip",
+                 max_bytes=64 * 1024 * 1024):
         self.script_name = script_name
         self.office_id = office_id
         self.date_str = date_str
         self.debug = debug
+        self.compression = compression
+        self.max_bytes = max_bytes
         self.base_dir = os.path.join("logs", date_str, office_id)
         self.logger = logging.getLogger("LogExporter")
+        self.writers = {}
         self._setup_dirs()
     
     def _setup_dirs(self):
-        # Implementation for setting up log directories
-        pass
+        for subdir in ("raw_logs", "stats"):
+            os.makedirs(os.path.join(self.base_dir, subdir), exist_ok=True)
+    
+    def _export_path(self, subdir, log_type, extension=".json"):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.base_dir, subdir, f"{log_type}_{timestamp}{extension}")
+        
+        # Several pages can be exported within the same second
+        counter = 1
+        while os.path.exists(path):
+            counter += 1
+            path = os.path.join(self.base_dir, subdir, f"{log_type}_{timestamp}_{counter}{extension}")
+        return path
     
     def export_raw_logs(self, logs, log_type):
-        # Implementation for exporting raw logs
-        pass
+        """
+        Append records to the run's raw log stream for a log type.
+        
+        Args:
+            logs (iterable): Records to append, written one at a time
+            log_type (str): Stream name, e.g. "raw_call_logs"
+        
+        Returns:
+            str: Path of the file currently being written
+        """
+        writer = self.writers.get(log_type)
+        if writer is None:
+            writer = self.writers[log_type] = NdjsonWriter(
+                lambda extension: self._export_path("raw_logs", log_type, extension),
+                self.compression,
+                self.max_bytes
+            )
+        
+        count = 0
+        for record in logs:
+            writer.write(record)
+            count += 1
+        writer.flush()
+        
+        if self.debug:
+            self.logger.debug("Exported %s records to %s", count, writer.paths[-1] if writer.paths else None)
+        return writer.paths[-1] if writer.paths else None
+    
+    def close(self):
+        """Finish the raw log streams; returns the files written per log type."""
+        files = {}
+        for log_type, writer in self.writers.items():
+            writer.close()
+            files[log_type] = {"files": list(writer.paths), "records": writer.records}
+        self.writers = {}
+        return files
+    
+    def raw_log_files(self, log_type):
+        """Return this office's raw log files for a log type in the order they were written."""
+        raw_dir = os.path.join(self.base_dir, "raw_logs")
+        names = [
+            name for name in os.listdir(raw_dir)
+            if name.startswith(f"{log_type}_") and name.endswith((".json", ".ndjson", ".ndjson.gz", ".ndjson.zst"))
+        ]
+        return sorted((os.path.join(raw_dir, name) for name in names), key=_raw_log_sort_key)
+    
+    def iter_raw_logs(self, log_type):
+        """Yield every raw log record for a log type, e.g. to replay a day's calls."""
+        for path in self.raw_log_files(log_type):
+            yield from read_raw_logs(path)
     
     def export_stats(self, stats, log_type):
-        # Implementation for exporting statistics
-        pass
+        path = self._export_path("stats", f"{self.script_name}_{log_type}")
+        with open(path, "w") as f:
+            json.dump(stats, f, indent=2, default=str)
+        self.logger.info(f"Exported processing statistics to {path}")
+        return path
+
+class RunCheckpoint:
+    def __init__(self, script_name, office_id, checkpoint_dir="data/checkpoints", enabled=True):
+        self.script_name = script_name
+        self.office_id = office_id
+        self.enabled = enabled
+        self.path = os.path.join(checkpoint_dir, f"{script_name}_{office_id}.json")
+        self.state = None
+        self.logger = logging.getLogger("RunCheckpoint")
+    
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable checkpoint {self.path}: {str(e)}")
+            return None
+    
+    def start(self, start_date, end_date, hours_back, resume=False):
+        """
+        Begin a run, continuing a saved window when resuming.
+        
+        Only an unfinished checkpoint is resumed; after a run finished cleanly
+        the next run starts a fresh window, so scheduled runs with --resume
+        keep fetching new calls.
+        
+        Returns:
+            dict: Checkpoint state
+        """
+        saved = self.load() if resume else None
+        if saved and saved.get("completed"):
+            self.logger.info(f"Checkpoint of {self.script_name} for {self.office_id} is complete, starting a new window")
+            saved = None
+        if saved:
+            self.logger.info(f"Resuming {self.script_name} for {self.office_id} from checkpoint {saved.get('updated_at')}")
+            self.state = saved
+        else:
+            self.state = {
+                "script": self.script_name,
+                "office_id": self.office_id,
+                "start_date": start_date,
+                "end_date": end_date,
+                "hours_back": hours_back,
+                "completed_extensions": [],
+                "extension_id": None,
+                "page": 1,
+                "completed": False
+            }
+            self._save()
+        return self.state
+    
+    def resume_point(self, extension_id):
+        """
+        Return where processing of an extension should continue.
+        
+        Returns:
+            int: Page to continue from, or None if the extension is complete
+        """
+        if extension_id in self.state["completed_extensions"]:
+            return None
+        if self.state["extension_id"] == extension_id:
+            return self.state["page"]
+        return 1
+    
+    def commit_page(self, extension_id, next_page):
+        self.state.update(extension_id=extension_id, page=next_page)
+        self._save()
+    
+    def complete_extension(self, extension_id):
+        self.state["completed_extensions"].append(extension_id)
+        self.state.update(extension_id=None, page=1)
+        self._save()
+    
+    def complete(self):
+        self.state["completed"] = True
+        self._save()
+    
+    def _save(self):
+        if not self.enabled:
+            return
+        self.state["updated_at"] = datetime.datetime.now().isoformat()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        
+        # Write then rename so a crash never leaves a half-written checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
 
 def normalize_phone_number(phone):
-    # Implementation for phone number normalization
-    pass
+    if not phone:
+        return ""
+    
+    digits = "".join(ch for ch in phone if ch.isdigit())
+    if len(digits) == 10:
+        return f"+1{digits}"
+    if len(digits) == 11 and digits.startswith("1"):
+        return f"+{digits}"
+    if phone.strip().startswith("+") and len(digits) >= 7:
+        return f"+{digits}"
+    
+    # Extensions and short codes are not callable numbers
+    return ""
 
 def format_call_time(timestamp, timezone="America/New_York"):
-    # Implementation for call time formatting
-    pass
+    if not timestamp:
+        return "Unknown time"
+    
+    import pytz
+    from dateutil.parser import parse as date_parse
+    
+    try:
+        call_time = date_parse(timestamp)
+    except (ValueError, OverflowError):
+        return timestamp
+    
+    if call_time.tzinfo is None:
+        call_time = pytz.utc.localize(call_time)
+    return call_time.astimezone(pytz.timezone(timezone)).strftime("%Y-%m-%d %I:%M %p %Z")
+
+# Share of calls whose per-call detail is written when debug logging is on
+DEFAULT_CALL_SAMPLE_RATE = 0.05
+
+# One background listener, fed from the root logger, owns the console handler and
+# one file handler per script, so log I/O happens off the call processing path and
+# module loggers such as ZohoClient or ZohoOutbox reach the log files too
+_log_listener = None
+_log_queue = None
+_log_files = {}
+_log_main_script = None
+_log_lock = threading.Lock()
+_call_loggers = {}
+
+# Script whose log file receives the module log records of the current thread
+_thread_log_scripts = threading.local()
 
-def setup_logging(script_name, debug=False):
-    # Implementation for logging setup
-    pass
+# Level of the current thread, set by thread_log_level for jobs that share a process
+_thread_log_levels = threading.local()
+
+class ThreadLevelFilter(logging.Filter):
+    """Drops records below the level of the thread that emitted them; threads without one log at INFO."""
+    
+    def filter(self, record):
+        return record.levelno >= getattr(_thread_log_levels, "level", logging.INFO)
+
+@contextlib.contextmanager
+def thread_log_level(debug=False):
+    """
+    Give the current thread its own log level, e.g. for one job of several run in a process.
+    
+    While it is set, setup_logging leaves script loggers open at DEBUG and
+    filters their records by the emitting thread's level, instead of changing
+    the level for every thread.
+    """
+    previous = getattr(_thread_log_levels, "level", None)
+    _thread_log_levels.level = logging.DEBUG if debug else logging.INFO
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _thread_log_levels.level
+        else:
+            _thread_log_levels.level = previous
+
+class CallLogSampler:
+    """Writes per-call debug lines for a stable sample of calls."""
+    
+    def __init__(self, logger, rate=DEFAULT_CALL_SAMPLE_RATE):
+        self.logger = logger
+        self.rate = rate
+    
+    def sampled(self, call_id):
+        if self.rate <= 0 or not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        if getattr(_thread_log_levels, "level", logging.DEBUG) > logging.DEBUG:
+            return False
+        if self.rate >= 1:
+            return True
+        # Hash the call ID so all lines of a sampled call are kept together
+        return zlib.crc32(str(call_id).encode("utf-8")) % 10000 < self.rate * 10000
+    
+    def debug(self, call_id, msg, *args):
+        if self.sampled(call_id):
+            self.logger.debug(msg, *args)
+
+def get_call_logger(script_name):
+    """Return the sampled per-call logger for a script."""
+    with _log_lock:
+        call_logger = _call_loggers.get(script_name)
+        if call_logger is None:
+            call_logger = _call_loggers[script_name] = CallLogSampler(logging.getLogger(script_name))
+        return call_logger
+
+class _ScriptStampFilter(logging.Filter):
+    """Stamps each record with the script running on the emitting thread, for _ScriptFileFilter."""
+    
+    def filter(self, record):
+        if not hasattr(record, "script"):
+            record.script = getattr(_thread_log_scripts, "name", None)
+        return True
+
+class _ScriptFileFilter(logging.Filter):
+    """
+    Passes the records that belong in one script's log file.
+    
+    A script's own logger always goes to its file; module loggers go to the
+    file of the script running on the thread that logged, or to the first
+    script set up in the process, e.g. the daemon, when no script is running.
+    """
+    
+    def __init__(self, script_name):
+        super().__init__()
+        self.script_name = script_name
+    
+    def filter(self, record):
+        owner = record.name.split(".")[0]
+        if owner not in _log_files:
+            owner = getattr(record, "script", None) or _log_main_script
+        return owner == self.script_name
+
+def _stop_log_listeners():
+    global _log_listener
+    with _log_lock:
+        listener, _log_listener = _log_listener, None
+    
+    # Stopping the listener flushes the records still queued
+    if listener is not None:
+        listener.stop()
+
+def setup_logging(script_name, debug=False, call_sample_rate=None):
+    """
+    Configure a script's logger to write through a background queue listener.
+    
+    Safe to call once per office: the script's log file is added on the first
+    call only, later calls just update the level and the per-call sample rate.
+    Inside thread_log_level the shared level is left open at DEBUG and each
+    thread's records are filtered by its own level instead. Records of module
+    loggers logged on the calling thread from now on go to this script's file.
+    
+    Args:
+        script_name (str): Logger and log file name
+        debug (bool): Enable debug logging
+        call_sample_rate (float): Share of calls logged in detail at debug level; None keeps the current rate
+    
+    Returns:
+        logging.Logger: The configured logger
+    """
+    global _log_listener, _log_queue, _log_main_script
+    
+    logger = logging.getLogger(script_name)
+    if getattr(_thread_log_levels, "level", None) is None:
+        logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    else:
+        logger.setLevel(logging.DEBUG)
+        with _log_lock:
+            if not any(isinstance(log_filter, ThreadLevelFilter) for log_filter in logger.filters):
+                logger.addFilter(ThreadLevelFilter())
+    
+    if call_sample_rate is not None:
+        get_call_logger(script_name).rate = call_sample_rate
+    
+    _thread_log_scripts.name = script_name
+    
+    with _log_lock:
+        if script_name in _log_files:
+            return logger
+        
+        os.makedirs("logs", exist_ok=True)
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        log_file = os.path.join("logs", f"{script_name}_{datetime.datetime.now().strftime('%Y%m%d')}.log")
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(formatter)
+        file_handler.addFilter(_ScriptFileFilter(script_name))
+        _log_files[script_name] = file_handler
+        
+        if _log_listener is None:
+            _log_main_script = script_name
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            _log_queue = queue.SimpleQueue()
+            _log_listener = QueueListener(_log_queue, console_handler, file_handler, respect_handler_level=True)
+            _log_listener.start()
+            atexit.register(_stop_log_listeners)
+            
+            queue_handler = QueueHandler(_log_queue)
+            queue_handler.addFilter(_ScriptStampFilter())
+            logging.getLogger().addHandler(queue_handler)
+        else:
+            # The listener reads its handler tuple on every record, so a new file takes effect at once
+            _log_listener.handlers = _log_listener.handlers + (file_handler,)
+    
+    return logger
 
 def parse_arguments():
-    # Implementation for command-line argument parsing
-    pass
+    parser = argparse.ArgumentParser(description="RingCentral-Zoho CRM Integration")
+    
+    office_group = parser.add_mutually_exclusive_group()
+    office_group.add_argument("--office", help="Office identifier to process")
+    office_group.add_argument("--office-order", help="Comma-separated list of offices to process in order")
+    office_group.add_argument("--all-offices", action="store_true", help="Process all offices in processing order")
+    
+    parser.add_argument("--hours-back", type=int, default=24, help="Hours to look back for calls (default: 24)")
+    parser.add_argument("--dry-run", action="store_true", help="Run without making changes to Zoho")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument("--resume", action="store_true", help="Resume interrupted offices from their last checkpoint")
+    parser.add_argument("--slices", type=int, default=1,
+                        help="Fetch the call log window as N concurrent time slices (useful for long backfills)")
+    parser.add_argument("--time-budget", type=float, default=None, metavar="SECONDS",
+                        help="Stop starting new calls after this many seconds; the rest are deferred to the next run")
+    parser.add_argument("--priority", default=None, metavar="RULES",
+                        help="Order calls are processed in, e.g. voicemail,newest or none for fetch order "
+                             "(default: global processing.priority_rules, else voicemail,newest)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile each office with cProfile and tracemalloc; reports are written next to the stats")
+    parser.add_argument("--profile-top", type=int, default=25,
+                        help="Number of functions and allocation sites in the profile summaries (default: 25)")
+    parser.add_argument("--log-sample-rate", type=float, default=None,
+                        help=f"Share of calls logged in detail with --debug (default: {DEFAULT_CALL_SAMPLE_RATE})")
+    
+    traffic_group = parser.add_mutually_exclusive_group()
+    traffic_group.add_argument("--record", metavar="ARCHIVE",
+                               help="Record all RingCentral and Zoho API traffic to this archive")
+    traffic_group.add_argument("--replay", metavar="ARCHIVE",
+                               help="Answer API requests from a recorded archive instead of the network")
+    parser.add_argument("--replay-services", default="ringcentral,zoho",
+                        help="Comma-separated services answered from the --replay archive; others stay live "
+                             "(default: ringcentral,zoho)")
+    parser.add_argument("--check-dependencies", action="store_true",
+                        help="Check the required packages again even if an earlier run already verified them")
+    parser.add_argument("--coordination-db", metavar="PATH",
+                        help="Shared lease database for splitting offices between hosts (default: global coordination.db_path)")
+    parser.add_argument("--node-id", help="Name of this host in the lease database (default: hostname:pid)")
+    parser.add_argument("--lease-ttl", type=float, default=None,
+                        help="Seconds before a dead host's office leases expire (default: 300)")
+    parser.add_argument("--claim-cooldown", type=float, default=None,
+                        help="Skip offices another host completed within this many seconds (default: 600)")
+    parser.add_argument("--replay-speed", type=float, default=0,
+                        help="Replay at this multiple of the recorded latency's real time; 0 for full speed (default: 0)")
+    
+    return parser.parse_args()
 
 def get_date_range(hours_back=24):
-    # Implementation for date range calculation
-    pass
+    end_date = datetime.datetime.now(datetime.timezone.utc)
+    start_date = end_date - datetime.timedelta(hours=hours_back)
+    return (
+        start_date.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        end_date.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    )
+
+# Packages the call processors need, by import name
+REQUIRED_PACKAGES = {
+    "requests": "requests",
+    "cryptography": "cryptography",
+    "pytz": "pytz",
+    "dateutil": "python-dateutil"
+}
+DEPENDENCY_MARKER = os.path.join("data", ".dependencies_checked")
 
-def check_and_install_dependencies():
-    # Implementation for dependency checking/installation
-    pass
+def check_and_install_dependencies(force=False):
+    """
+    Make sure the required packages are installed, once per Python environment.
+    
+    A successful check is remembered in a marker file keyed by the interpreter
+    and the package list, so scheduled runs skip it after the first run.
+    Missing packages are installed with pip.
+    
+    Args:
+        force (bool): Check again even if the marker says the environment is complete
+    
+    Returns:
+        bool: True when all required packages are available
+    """
+    logger = logging.getLogger("Dependencies")
+    fingerprint = {
+        "executable": sys.executable,
+        "version": sys.version,
+        "packages": sorted(REQUIRED_PACKAGES.values())
+    }
+    
+    if not force:
+        try:
+            with open(DEPENDENCY_MARKER, "r") as f:
+                if json.load(f) == fingerprint:
+                    return True
+        except (OSError, ValueError):
+            pass
+    
+    # find_spec locates a package without paying for importing it
+    missing = [package for module, package in REQUIRED_PACKAGES.items() if importlib.util.find_spec(module) is None]
+    if missing:
+        import subprocess
+        
+        logger.warning(f"Installing missing packages: {', '.join(missing)}")
+        completed = subprocess.run([sys.executable, "-m", "pip", "install", *missing])
+        importlib.invalidate_caches()
+        missing = [package for module, package in REQUIRED_PACKAGES.items() if importlib.util.find_spec(module) is None]
+        if completed.returncode != 0 or missing:
+            logger.error(f"Could not install required packages: {', '.join(missing) or 'pip failed'}")
+            return False
+    
+    os.makedirs(os.path.dirname(DEPENDENCY_MARKER), exist_ok=True)
+    tmp_path = f"{DEPENDENCY_MARKER}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(fingerprint, f)
+    os.replace(tmp_path, DEPENDENCY_MARKER)
+    return True
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Multi-Node Coordination
+This module lets several hosts share the offices in offices.json. Before
+processing an office a node claims a renewable lease on it in a shared
+store; other nodes skip offices that are leased or were just completed,
+and a lease whose node stopped renewing it expires so another node can
+take the office over. A node that loses its lease stops processing the
+office, and stores that record the lease's fencing token refuse writes
+from a holder whose lease was taken over.
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+import contextlib
+
+DEFAULT_LEASE_TTL = 300
+DEFAULT_CLAIM_COOLDOWN = 600
+
+# Table a store keeps the highest fencing token per resource in; see fenced_write
+FENCING_TABLE = """
+    CREATE TABLE IF NOT EXISTS fencing_tokens (
+        resource TEXT PRIMARY KEY,
+        token INTEGER NOT NULL
+    )
+"""
+
+class LeaseLostError(Exception):
+    """Raised when a node keeps working on a resource whose lease it no longer holds."""
+
+def default_node_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def state_db_path(filename, coordination_config=None):
+    """
+    Return where a state database such as outbox.db or deferred_calls.db is kept.
+    
+    The stores are local to the host under data/ unless global_config
+    coordination.data_dir points at storage every node can reach, in which
+    case a node that takes an office over also sees the office's queued work.
+    """
+    data_dir = (coordination_config or {}).get("data_dir") or "data"
+    return os.path.join(data_dir, filename)
+
+@contextlib.contextmanager
+def fenced_write(conn, lease):
+    """
+    Run a write to a SQLite store in a transaction, verifying the lease first.
+    
+    The store remembers the highest fencing token written for the lease's
+    resource, so once a newer holder has written, writes with an older
+    token are refused. The store must have created FENCING_TABLE.
+    
+    Args:
+        conn (sqlite3.Connection): Store connection
+        lease (Lease): Lease the write is made under, or None when not coordinated
+    
+    Raises:
+        LeaseLostError: If the lease is lost or a newer holder has written
+    """
+    try:
+        if lease is not None:
+            lease.check()
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT token FROM fencing_tokens WHERE resource = ?", (lease.resource,)).fetchone()
+            if row is not None and row[0] > lease.token:
+                lease.lost.set()
+                raise LeaseLostError(f"Lease on {lease.resource} (token {lease.token}) was taken over by token {row[0]}")
+            if row is None or row[0] < lease.token:
+                conn.execute("INSERT OR REPLACE INTO fencing_tokens (resource, token) VALUES (?, ?)",
+                             (lease.resource, lease.token))
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    conn.commit()
+
+class Lease:
+    """A claim on one resource; the token increases with every new claim and fences stale holders."""
+    
+    def __init__(self, resource, owner, token, expires_at):
+        self.resource = resource
+        self.owner = owner
+        self.token = token
+        self.expires_at = expires_at
+        self.succeeded = True
+        self.lost = threading.Event()
+    
+    def held(self):
+        """Return whether the lease is still held: not lost to another claim and not expired."""
+        return not self.lost.is_set() and time.time() < self.expires_at
+    
+    def check(self):
+        """
+        Raise LeaseLostError unless the lease is still held.
+        
+        Raises:
+            LeaseLostError: If the lease was lost or expired
+        """
+        if not self.held():
+            raise LeaseLostError(f"Lease on {self.resource} (token {self.token}) is no longer held")
+
+class LeaseStore:
+    """Interface for lease backends; SqliteLeaseStore is the reference implementation."""
+    
+    def claim(self, resource, owner, ttl, cooldown=0):
+        """
+        Claim a resource unless another owner holds an unexpired lease on it.
+        
+        Args:
+            resource (str): Resource name, e.g. "missed_calls:office_id"
+            owner (str): Node claiming the lease
+            ttl (float): Seconds until the lease expires unless renewed
+            cooldown (float): Refuse the claim if another owner completed the resource this many
+                seconds ago or less
+        
+        Returns:
+            tuple: (Lease, None) when claimed, (None, reason) otherwise
+        """
+        raise NotImplementedError
+    
+    def renew(self, lease, ttl):
+        """Extend a lease; returns False if it was lost to another claim."""
+        raise NotImplementedError
+    
+    def release(self, lease, completed=True):
+        """Give a lease up, recording completion; returns False if it was lost to another claim."""
+        raise NotImplementedError
+    
+    def leases(self):
+        """Return the state of every known resource as a list of dicts."""
+        raise NotImplementedError
+
+class SqliteLeaseStore(LeaseStore):
+    """
+    Leases in a SQLite file that every node can reach.
+    
+    Claims run in IMMEDIATE transactions, so two nodes can never both win the
+    same resource. Expiry uses wall-clock time, so node clocks must be kept in
+    sync (NTP), and the file system must support SQLite locking.
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                resource TEXT PRIMARY KEY,
+                owner TEXT,
+                token INTEGER NOT NULL DEFAULT 0,
+                acquired_at REAL,
+                expires_at REAL NOT NULL DEFAULT 0,
+                completed_at REAL,
+                completed_by TEXT
+            )
+        """)
+    
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+    
+    def claim(self, resource, owner, ttl, cooldown=0):
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute("SELECT * FROM leases WHERE resource = ?", (resource,)).fetchone()
+            
+            if row is not None:
+                if row["owner"] and row["owner"] != owner and row["expires_at"] > now:
+                    return None, f"leased by {row['owner']} for another {row['expires_at'] - now:.0f}s"
+                # A node's own recent completion never blocks it, so its next scheduled run goes ahead
+                if (cooldown and row["completed_at"] and row["completed_by"] != owner
+                        and now - row["completed_at"] < cooldown):
+                    return None, f"completed by {row['completed_by']} {now - row['completed_at']:.0f}s ago"
+                token = row["token"] + 1
+                conn.execute(
+                    "UPDATE leases SET owner = ?, token = ?, acquired_at = ?, expires_at = ? WHERE resource = ?",
+                    (owner, token, now, now + ttl, resource)
+                )
+            else:
+                token = 1
+                conn.execute(
+                    "INSERT INTO leases (resource, owner, token, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (resource, owner, token, now, now + ttl)
+                )
+        
+        return Lease(resource, owner, token, now + ttl), None
+    
+    def renew(self, lease, ttl):
+        with self._transaction() as conn:
+            expires_at = time.time() + ttl
+            renewed = conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE resource = ? AND owner = ? AND token = ?",
+                (expires_at, lease.resource, lease.owner, lease.token)
+            ).rowcount == 1
+        if renewed:
+            lease.expires_at = expires_at
+        return renewed
+    
+    def release(self, lease, completed=True):
+        with self._transaction() as conn:
+            if completed:
+                cursor = conn.execute(
+                    "UPDATE leases SET owner = NULL, expires_at = 0, completed_at = ?, completed_by = ? "
+                    "WHERE resource = ? AND owner = ? AND token = ?",
+                    (time.time(), lease.owner, lease.resource, lease.owner, lease.token)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE leases SET owner = NULL, expires_at = 0 WHERE resource = ? AND owner = ? AND token = ?",
+                    (lease.resource, lease.owner, lease.token)
+                )
+            return cursor.rowcount == 1
+    
+    def leases(self):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute("SELECT * FROM leases ORDER BY resource")]
+
+class LeaseKeeper:
+    """Renews a lease from a background thread while the holder works."""
+    
+    def __init__(self, store, lease, ttl):
+        self.store = store
+        self.lease = lease
+        self.ttl = ttl
+        self.stopping = threading.Event()
+        self.logger = logging.getLogger("OfficeCoordinator")
+        self.thread = threading.Thread(target=self._run, name=f"lease-{lease.resource}", daemon=True)
+    
+    def _run(self):
+        # Renewing at a third of the TTL leaves room for two failed attempts
+        while not self.stopping.wait(self.ttl / 3):
+            try:
+                renewed = self.store.renew(self.lease, self.ttl)
+            except sqlite3.Error as e:
+                if time.time() < self.lease.expires_at:
+                    self.logger.warning(f"Could not renew lease on {self.lease.resource}: {str(e)}")
+                    continue
+                self.logger.error(f"Lease on {self.lease.resource} expired before it could be renewed: {str(e)}")
+                renewed = False
+            if not renewed:
+                # The holder checks this before each call and write, and stops processing
+                self.lease.lost.set()
+                self.logger.error(f"Lost lease on {self.lease.resource}; stopping work on it")
+                return
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stopping.set()
+        self.thread.join()
+
+class OfficeCoordinator:
+    """Claims offices for this node so that each office window is processed by one node at a time."""
+    
+    def __init__(self, store, node_id=None, ttl=DEFAULT_LEASE_TTL, cooldown=DEFAULT_CLAIM_COOLDOWN):
+        """
+        Initialize the coordinator.
+        
+        Args:
+            store (LeaseStore): Shared lease backend
+            node_id (str): Name of this node; defaults to host name and process ID
+            ttl (float): Lease lifetime in seconds; a dead node's offices are free again after this long
+            cooldown (float): Skip offices another node completed this many seconds ago or less
+        """
+        self.store = store
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        self.cooldown = cooldown
+        self.logger = logging.getLogger("OfficeCoordinator")
+    
+    @classmethod
+    def from_arguments(cls, args, coordination_config=None):
+        """Build a coordinator from the command line and global_config.coordination; None when not configured."""
+        coordination_config = coordination_config or {}
+        db_path = args.coordination_db or coordination_config.get("db_path")
+        if not db_path:
+            return None
+        return cls(
+            SqliteLeaseStore(db_path),
+            args.node_id or coordination_config.get("node_id"),
+            args.lease_ttl or coordination_config.get("lease_ttl", DEFAULT_LEASE_TTL),
+            args.claim_cooldown if args.claim_cooldown is not None
+            else coordination_config.get("claim_cooldown", DEFAULT_CLAIM_COOLDOWN)
+        )
+    
+    @contextlib.contextmanager
+    def hold(self, processor, office_id, cooldown=None):
+        """
+        Claim an office for the duration of the block.
+        
+        Yields the Lease, or None when another node has the office; the caller
+        skips the office in that case. The lease is renewed in the background
+        and released as completed when the block finishes without an error,
+        unless the caller set lease.succeeded to False or the lease was lost.
+        The caller passes the lease on to process_office, which stops once
+        lease.lost is set.
+        """
+        resource = f"{processor}:{office_id}"
+        lease, reason = self.store.claim(resource, self.node_id, self.ttl, self.cooldown if cooldown is None else cooldown)
+        if lease is None:
+            self.logger.info(f"Skipping {resource}: {reason}")
+            yield None
+            return
+        
+        self.logger.info(f"Claimed {resource} as {self.node_id} (token {lease.token})")
+        completed = False
+        try:
+            with LeaseKeeper(self.store, lease, self.ttl):
+                yield lease
+            completed = lease.succeeded and not lease.lost.is_set()
+        finally:
+            if not self.store.release(lease, completed):
+                self.logger.warning(f"Lease on {resource} was taken over before {self.node_id} released it")
+    
+    def run(self, processor, office_ids, process):
+        """
+        Process every office this node can claim.
+        
+        Offices leased by other nodes are tried again after the first pass, in
+        case their lease expired in the meantime because that node died.
+        
+        Args:
+            processor (str): "missed_calls" or "accepted_calls"
+            office_ids (list): Offices in processing order
+            process (callable): Called with an office ID and its Lease once it is claimed; an office
+                whose returned stats report success False is not marked completed, so it can be retried
+        
+        Returns:
+            dict: Office IDs processed and skipped by this node
+        """
+        processed, pending = [], list(office_ids)
+        for attempt in range(2):
+            skipped = []
+            for office_id in pending:
+                with self.hold(processor, office_id) as lease:
+                    if lease is None:
+                        skipped.append(office_id)
+                        continue
+                    stats = process(office_id, lease)
+                    lease.succeeded = not isinstance(stats, dict) or stats.get("success", True)
+                    processed.append(office_id)
+            if not skipped:
+                break
+            pending = skipped
+        
+        self.logger.info(f"{self.node_id} processed {len(processed)} offices, {len(skipped)} handled by other nodes")
+        return {"processed": processed, "skipped": skipped}
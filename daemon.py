@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Daemon
+This script keeps one process running and processes each office on its own
+interval, reusing authenticated clients, connection pools and caches between
+runs instead of cold-starting a new process for every scheduled run.
+"""
+
+import sys
+import math
+import time
+import heapq
+import signal
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from common import (
+    RingCentralClient,
+    ZohoClient,
+    SecureStorage,
+    setup_logging
+)
+from metrics import MetricsCollector, MetricsServer
+from coordination import OfficeCoordinator
+from call_queue import parse_priority_rules
+import missed_calls
+import accepted_calls
+
+DEFAULT_INTERVAL_MINUTES = 60
+
+class OfficeScheduler:
+    """Runs office jobs on per-office intervals without overlapping runs of the same office."""
+    
+    def __init__(self, run_job, max_workers=2):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            run_job (callable): Called with an office ID to process that office
+            max_workers (int): Maximum number of offices processed at the same time
+        """
+        self.run_job = run_job
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="office")
+        self.schedule = []  # Heap of (next_run, office_id)
+        self.intervals = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.logger = logging.getLogger("OfficeScheduler")
+    
+    def add_office(self, office_id, interval_minutes, delay=0):
+        """
+        Schedule an office.
+        
+        Args:
+            office_id (str): Office identifier
+            interval_minutes (float): Minutes between the start of consecutive runs
+            delay (float): Seconds before the first run
+        """
+        with self.lock:
+            self.intervals[office_id] = interval_minutes * 60
+            heapq.heappush(self.schedule, (time.time() + delay, office_id))
+        self.wakeup.set()
+    
+    def run(self):
+        """Dispatch due offices until stop() is called, then wait for in-flight jobs."""
+        self.logger.info(f"Scheduler started with {len(self.intervals)} offices")
+        
+        while not self.stopping:
+            now = time.time()
+            due = []
+            with self.lock:
+                while self.schedule and self.schedule[0][0] <= now:
+                    due.append(heapq.heappop(self.schedule)[1])
+                next_run = self.schedule[0][0] if self.schedule else now + 60
+            
+            # An office is only rescheduled once its job finishes, so runs never overlap
+            for office_id in due:
+                self.executor.submit(self._run_office, office_id)
+            
+            self.wakeup.clear()
+            self.wakeup.wait(max(0, min(next_run - time.time(), 60)))
+        
+        self.logger.info("Stopping: waiting for in-flight office jobs to finish")
+        self.executor.shutdown(wait=True)
+        self.logger.info("Scheduler stopped")
+    
+    def stop(self):
+        """Stop dispatching new jobs."""
+        self.stopping = True
+        self.wakeup.set()
+    
+    def _run_office(self, office_id):
+        started = time.time()
+        try:
+            self.run_job(office_id)
+        except Exception as e:
+            self.logger.error(f"Job for office {office_id} failed: {str(e)}", exc_info=True)
+        finally:
+            elapsed = time.time() - started
+            interval = self.intervals[office_id]
+            if elapsed > interval:
+                self.logger.warning(f"Office {office_id} took {elapsed:.0f}s, longer than its {interval:.0f}s interval")
+            
+            with self.lock:
+                heapq.heappush(self.schedule, (max(started + interval, time.time()), office_id))
+            self.wakeup.set()
+
+def parse_daemon_arguments():
+    """Parse command line arguments for the daemon."""
+    parser = argparse.ArgumentParser(description="RingCentral-Zoho CRM Integration Daemon")
+    parser.add_argument("--interval", type=float, default=None,
+                        help=f"Default minutes between runs of each office (default: {DEFAULT_INTERVAL_MINUTES})")
+    parser.add_argument("--hours-back", type=int, default=None,
+                        help="Hours to look back on each run (default: twice the office interval)")
+    parser.add_argument("--workers", type=int, default=2, help="Offices processed at the same time (default: 2)")
+    parser.add_argument("--office", action="append", help="Only schedule this office (may be repeated)")
+    parser.add_argument("--no-missed", action="store_true", help="Do not process missed calls")
+    parser.add_argument("--no-accepted", action="store_true", help="Do not process accepted calls")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port at /metrics (default: global metrics.port, off if unset)")
+    parser.add_argument("--metrics-host", default=None, help="Interface for the metrics endpoint (default: 0.0.0.0)")
+    parser.add_argument("--coordination-db", metavar="PATH",
+                        help="Shared lease database for splitting offices between daemons (default: global coordination.db_path)")
+    parser.add_argument("--node-id", help="Name of this daemon in the lease database (default: hostname:pid)")
+    parser.add_argument("--lease-ttl", type=float, default=None,
+                        help="Seconds before a dead daemon's office leases expire (default: 300)")
+    parser.add_argument("--claim-cooldown", type=float, default=None,
+                        help="Skip offices another daemon completed within this many seconds (default: half the office interval)")
+    parser.add_argument("--time-budget", type=float, default=None, metavar="SECONDS",
+                        help="Seconds each office run may take before its remaining calls are deferred "
+                             "(default: the office interval)")
+    parser.add_argument("--priority", default=None, metavar="RULES",
+                        help="Order calls are processed in, e.g. voicemail,newest (default: global processing.priority_rules)")
+    parser.add_argument("--dry-run", action="store_true", help="Run without making changes to Zoho")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_daemon_arguments()
+    logger = setup_logging("daemon", args.debug)
+    
+    storage = SecureStorage(args.debug)
+    credentials = storage.load_credentials()
+    global_config = storage.load_global_config()
+    global_processing = global_config.get("processing", {})
+    metrics_config = global_config.get("metrics", {})
+    offices = sorted(storage.load_office_list(), key=lambda o: o.get('processing_order', 999))
+    if args.office:
+        offices = [office for office in offices if office["id"] in args.office]
+    
+    if not offices:
+        print("Error: No offices to schedule")
+        sys.exit(1)
+    
+    # One set of clients for the life of the process keeps tokens, pools and caches warm
+    rc_client = RingCentralClient(credentials["ringcentral"], args.debug)
+    zoho_client = ZohoClient(credentials["zoho"], args.debug,
+                             seed_attachments=global_config.get("attachments", {}).get("seed_existing", False))
+    
+    # Runs accumulate into one collector that is served for the life of the process
+    collector = MetricsCollector()
+    metrics_port = args.metrics_port or metrics_config.get("port")
+    metrics_server = None
+    if metrics_port:
+        metrics_host = args.metrics_host or metrics_config.get("host", "0.0.0.0")
+        metrics_server = MetricsServer(collector, metrics_host, int(metrics_port)).start()
+    
+    try:
+        priority_rules = parse_priority_rules(args.priority) if args.priority is not None else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    # Daemons on other hosts sharing the lease database each take a share of the offices
+    coordinator = OfficeCoordinator.from_arguments(args, global_config.get("coordination"))
+    
+    hours_back_by_office = {}
+    interval_by_office = {}
+    
+    def run_processor(processor, office_id, deadline):
+        hours_back = hours_back_by_office[office_id]
+        module = missed_calls if processor == "missed_calls" else accepted_calls
+        if coordinator is None:
+            stats = module.process_office(office_id, hours_back, args.debug, args.dry_run,
+                                          rc_client=rc_client, zoho_client=zoho_client,
+                                          deadline=deadline, priority_rules=priority_rules)
+            collector.observe_run(processor, office_id, stats)
+            return
+        
+        # Unless configured otherwise, a run another daemon finished in the first half of
+        # this interval already covers the window
+        cooldown = args.claim_cooldown
+        if cooldown is None:
+            cooldown = interval_by_office[office_id] * 60 / 2
+        with coordinator.hold(processor, office_id, cooldown=cooldown) as lease:
+            if lease is None:
+                return
+            stats = module.process_office(office_id, hours_back, args.debug, args.dry_run,
+                                          rc_client=rc_client, zoho_client=zoho_client,
+                                          deadline=deadline, priority_rules=priority_rules, lease=lease)
+            lease.succeeded = bool(stats.get("success"))
+            collector.observe_run(processor, office_id, stats)
+    
+    def run_office(office_id):
+        # Both processors share the budget, so a slow run does not push back the next one
+        deadline = time.time() + (args.time_budget or interval_by_office[office_id] * 60)
+        if not args.no_missed:
+            run_processor("missed_calls", office_id, deadline)
+        if not args.no_accepted:
+            run_processor("accepted_calls", office_id, deadline)
+    
+    scheduler = OfficeScheduler(run_office, max_workers=args.workers)
+    
+    for office in offices:
+        schedule = office.get("schedule", {})
+        interval = (
+            schedule.get("interval_minutes")
+            or args.interval
+            or global_processing.get("interval_minutes")
+            or DEFAULT_INTERVAL_MINUTES
+        )
+        
+        # Overlap consecutive windows so a slow or failed run does not leave a gap
+        hours_back = schedule.get("hours_back") or args.hours_back or max(1, math.ceil(interval * 2 / 60))
+        hours_back_by_office[office["id"]] = hours_back
+        interval_by_office[office["id"]] = interval
+        
+        logger.info(f"Scheduling office {office['id']} every {interval} minutes, looking back {hours_back} hours")
+        scheduler.add_office(office["id"], interval)
+    
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down after in-flight jobs finish")
+        scheduler.stop()
+    
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    
+    scheduler.run()
+    
+    if metrics_server:
+        metrics_server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Job Runner
+This module runs office processing jobs inside the calling process, e.g. the
+admin GUI. Jobs are queued and run on a small worker pool that shares one
+set of authenticated clients, connection pools and caches, so a job does not
+cold-start, decrypt credentials and authenticate from scratch, and every
+job's status, log messages and statistics stay available while it runs.
+"""
+
+import os
+import time
+import logging
+import itertools
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+PROCESSORS = ("missed_calls", "accepted_calls")
+
+class Job:
+    """One office run of one or more processors, with its progress."""
+    
+    def __init__(self, job_id, office_id, processors, hours_back=24, dry_run=False, debug=False, log_path=None,
+                 max_messages=1000):
+        self.id = job_id
+        self.office_id = office_id
+        self.processors = tuple(processors)
+        self.hours_back = hours_back
+        self.dry_run = dry_run
+        self.debug = debug
+        self.status = "queued"  # queued, running, succeeded, failed, cancelled
+        self.current_processor = None
+        self.stats = {}  # processor -> processing statistics
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Only the latest messages are kept in memory; log_path receives all of them
+        self.messages = collections.deque(maxlen=max_messages)
+        self.message_count = 0
+        self.log_path = log_path
+        self.log_file = None
+        self.future = None
+    
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed", "cancelled")
+    
+    def elapsed(self):
+        """Seconds the job has been running, or ran for."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+    
+    def calls_processed(self):
+        # The running processor's statistics are updated in place as each call is processed
+        return sum(stats.get("total_calls_processed", 0) for stats in list(self.stats.values()))
+    
+    def last_message(self):
+        return self.messages[-1] if self.messages else ""
+    
+    def summary(self):
+        """Return the job's progress as a dict, e.g. for display."""
+        return {
+            "id": self.id,
+            "office_id": self.office_id,
+            "processors": self.processors,
+            "status": self.status,
+            "current_processor": self.current_processor,
+            "elapsed": self.elapsed(),
+            "calls_processed": self.calls_processed(),
+            "error": self.error,
+            "last_message": self.last_message()
+        }
+
+class JobFilter(logging.Filter):
+    """Passes only records emitted by a job's worker thread, at that job's level, and tags them with the job."""
+    
+    def __init__(self, runner):
+        super().__init__()
+        self.runner = runner
+    
+    def filter(self, record):
+        job = self.runner.job_for_thread(record.thread)
+        if job is None or (record.levelno < logging.INFO and not job.debug):
+            return False
+        record.job = job
+        return True
+
+class JobLogHandler(logging.Handler):
+    """Copies log records to the job whose worker thread emitted them."""
+    
+    def __init__(self, runner):
+        super().__init__()
+        self.addFilter(JobFilter(runner))
+        self.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    
+    def emit(self, record):
+        job = record.job
+        try:
+            message = self.format(record)
+            job.messages.append(message)
+            job.message_count += 1
+            if job.log_file is not None:
+                job.log_file.write(message + "\n")
+        except Exception:
+            self.handleError(record)
+
+class JobRunner:
+    """Queues office jobs and runs them on a worker pool with warm shared clients."""
+    
+    def __init__(self, max_workers=2):
+        """
+        Initialize the runner.
+        
+        Args:
+            max_workers (int): Maximum number of jobs run at the same time
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs = collections.OrderedDict()
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.threads = {}  # worker thread ident -> running Job
+        self.office_locks = collections.defaultdict(threading.Lock)
+        self.rc_client = None
+        self.zoho_client = None
+        self.clients_lock = threading.Lock()
+        self.logger = logging.getLogger("JobRunner")
+        
+        self.log_handler = JobLogHandler(self)
+        logging.getLogger().addHandler(self.log_handler)
+    
+    def submit(self, office_id, processors=PROCESSORS, hours_back=24, dry_run=False, debug=False, log_path=None):
+        """
+        Queue a job for an office.
+        
+        Args:
+            office_id (str): Office identifier
+            processors (iterable): Processors to run in order, from PROCESSORS
+            hours_back (int): Hours to look back
+            dry_run (bool): Run without making changes to Zoho
+            debug (bool): Enable debug logging
+            log_path (str): Optional file that receives every log message of the job
+        
+        Returns:
+            Job: The queued job
+        
+        Raises:
+            ValueError: If a processor is unknown or none is given
+        """
+        processors = tuple(processors)
+        unknown = [processor for processor in processors if processor not in PROCESSORS]
+        if unknown or not processors:
+            raise ValueError(f"Choose processors from {', '.join(PROCESSORS)}")
+        
+        with self.lock:
+            job = Job(next(self.job_ids), office_id, processors, hours_back, dry_run, debug, log_path)
+            self.jobs[job.id] = job
+        job.future = self.executor.submit(self._run, job)
+        self.logger.info(f"Queued job {job.id}: {', '.join(processors)} for office {office_id}")
+        return job
+    
+    def list_jobs(self):
+        """Return all jobs, oldest first."""
+        with self.lock:
+            return list(self.jobs.values())
+    
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+    
+    def job_for_thread(self, thread_ident):
+        return self.threads.get(thread_ident)
+    
+    def active_jobs(self):
+        return [job for job in self.list_jobs() if not job.done]
+    
+    def cancel(self, job_id):
+        """
+        Cancel a job that has not started yet.
+        
+        Returns:
+            bool: True if the job was cancelled; running jobs finish normally
+        """
+        job = self.get(job_id)
+        if job is None or job.status != "queued" or not job.future.cancel():
+            return False
+        job.status = "cancelled"
+        job.finished_at = time.time()
+        return True
+    
+    def clear_finished(self):
+        """Forget finished jobs."""
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.done]:
+                del self.jobs[job_id]
+    
+    def shutdown(self, wait=True):
+        """Cancel queued jobs and stop the workers once running jobs finish."""
+        for job in self.list_jobs():
+            if job.status == "queued":
+                self.cancel(job.id)
+        self.executor.shutdown(wait=wait)
+        logging.getLogger().removeHandler(self.log_handler)
+    
+    def _clients(self):
+        # Built on the first job and shared by every later one, which keeps tokens, pools and caches warm
+        from common import RingCentralClient, ZohoClient, SecureStorage
+        
+        with self.clients_lock:
+            if self.rc_client is None or self.zoho_client is None:
+                storage = SecureStorage()
+                credentials = storage.load_credentials()
+                self.rc_client = RingCentralClient(credentials["ringcentral"])
+                self.zoho_client = ZohoClient(
+                    credentials["zoho"],
+                    seed_attachments=storage.load_global_config().get("attachments", {}).get("seed_existing", False)
+                )
+            return self.rc_client, self.zoho_client
+    
+    def _run(self, job):
+        import missed_calls
+        import accepted_calls
+        from common import thread_log_level
+        
+        modules = {"missed_calls": missed_calls, "accepted_calls": accepted_calls}
+        thread_ident = threading.get_ident()
+        self.threads[thread_ident] = job
+        
+        try:
+            # Runs of the same office share checkpoints and deferred calls, so they wait for each other
+            # The job's debug setting applies to its own thread, not to every job sharing the loggers
+            with self.office_locks[job.office_id], thread_log_level(job.debug):
+                job.status = "running"
+                job.started_at = time.time()
+                if job.log_path:
+                    if os.path.dirname(job.log_path):
+                        os.makedirs(os.path.dirname(job.log_path), exist_ok=True)
+                    job.log_file = open(job.log_path, "w", encoding="utf-8")
+                rc_client, zoho_client = self._clients()
+                
+                for processor in job.processors:
+                    job.current_processor = processor
+                    
+                    def track(stats, processor=processor):
+                        # The processor keeps updating this dict, so calls_processed moves during the run
+                        job.stats[processor] = stats
+                    
+                    stats = modules[processor].process_office(
+                        job.office_id, job.hours_back, job.debug, job.dry_run,
+                        rc_client=rc_client, zoho_client=zoho_client, progress=track
+                    )
+                    job.stats[processor] = stats
+                    if not stats.get("success"):
+                        job.error = stats.get("error") or f"{processor} did not finish"
+                
+                job.status = "failed" if job.error else "succeeded"
+        except Exception as e:
+            self.logger.error(f"Job {job.id} for office {job.office_id} failed: {str(e)}", exc_info=True)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.current_processor = None
+            job.finished_at = time.time()
+            self.threads.pop(thread_ident, None)
+            if job.log_file is not None:
+                job.log_file.close()
+                job.log_file = None
+        
+        self.logger.info(f"Job {job.id} for office {job.office_id} {job.status} in {job.elapsed():.1f}s")
+        return job
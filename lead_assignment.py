@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Lead Owner Assignment
+This module assigns new leads to the lead owners of an office by smooth
+weighted round-robin, honouring assignment_weight and active from
+lead_owners.json. The position in the rotation is kept per office in a
+SQLite file, so runs continue where the last one stopped and concurrent
+workers and processes draw from one shared rotation.
+"""
+
+import os
+import math
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from functools import reduce
+
+# Longest rotation precomputed per office; finer weight ratios are rounded to fit
+MAX_CYCLE_LENGTH = 10000
+
+# Owners reserved from the shared rotation at a time by an office run
+DEFAULT_BLOCK_SIZE = 25
+
+def _integer_weights(weights):
+    # Weights such as 1.5 and 2.0 become 3 and 4; two decimals are kept
+    scaled = [max(1, round(weight * 100)) for weight in weights]
+    divisor = reduce(math.gcd, scaled)
+    scaled = [weight // divisor for weight in scaled]
+    total = sum(scaled)
+    if total > MAX_CYCLE_LENGTH:
+        scaled = [max(1, round(weight * MAX_CYCLE_LENGTH / total)) for weight in scaled]
+    return scaled
+
+def smooth_weighted_cycle(weights):
+    """
+    Build one full rotation of smooth weighted round-robin.
+    
+    Every step adds each owner's weight to their current value, picks the
+    owner with the highest value and subtracts the total weight from it, so
+    heavier owners are picked more often without long runs of the same owner.
+    
+    Args:
+        weights (list): Positive integer weight per owner
+    
+    Returns:
+        list: Owner indexes; the rotation repeats after sum(weights) picks
+    """
+    total = sum(weights)
+    current = [0] * len(weights)
+    cycle = []
+    for _ in range(total):
+        for index, weight in enumerate(weights):
+            current[index] += weight
+        chosen = max(range(len(weights)), key=lambda index: current[index])
+        current[chosen] -= total
+        cycle.append(chosen)
+    return cycle
+
+class LeadOwnerAllocator:
+    """
+    Hands out lead owners from a persisted smooth weighted rotation; each pick is O(1).
+    
+    Picks are served from a block of positions reserved from the shared
+    rotation in one transaction, so an office run does not write to the
+    rotation database for every new lead. close() hands unused positions
+    back unless another process has reserved after them.
+    """
+    
+    def __init__(self, office_id, lead_owners, assignment_rules=None, db_path="data/lead_assignment.db",
+                 persist=True, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Initialize the allocator.
+        
+        Args:
+            office_id (str): Office identifier; offices rotate independently
+            lead_owners (list): Owners from lead_owners.json
+            assignment_rules (dict): assignment_rules from lead_owners.json
+            db_path (str): Path to the SQLite database with the rotation positions
+            persist (bool): False keeps the position in memory only, e.g. for dry runs
+            block_size (int): Positions reserved at a time; 1 reserves each pick on its own,
+                e.g. for long-lived allocators that pick rarely
+        
+        Raises:
+            ValueError: If no owner is active and no fallback owner is configured
+        """
+        assignment_rules = assignment_rules or {}
+        self.office_id = office_id
+        self.persist = persist
+        self.block_size = max(1, block_size)
+        # Reserved positions not handed out yet, unwrapped; the cycle index is position % len(cycle)
+        self.block_next = 0
+        self.block_end = 0
+        self.logger = logging.getLogger("LeadOwnerAllocator")
+        self.lock = threading.Lock()
+        
+        self.owners = [
+            owner for owner in lead_owners
+            if owner.get("active", True) and owner.get("assignment_weight", 1) > 0
+        ]
+        if not self.owners:
+            fallback_id = assignment_rules.get("fallback_owner_id")
+            if not fallback_id:
+                raise ValueError(f"Office {office_id} has no active lead owners and no fallback_owner_id")
+            self.logger.warning(f"Office {office_id} has no active lead owners, assigning all leads to {fallback_id}")
+            self.owners = [{"id": fallback_id}]
+        
+        if assignment_rules.get("respect_weights", True):
+            weights = [float(owner.get("assignment_weight", 1)) for owner in self.owners]
+        else:
+            weights = [1.0] * len(self.owners)
+        self.cycle = smooth_weighted_cycle(_integer_weights(weights))
+        
+        # A different set of owners or weights starts a new rotation
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [[str(owner["id"]), weight] for owner, weight in zip(self.owners, weights)]
+        ).encode("utf-8")).hexdigest()
+        
+        self.position = 0
+        self.conn = None
+        if persist:
+            if os.path.dirname(db_path):
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS rotation (
+                    office_id TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    position INTEGER NOT NULL
+                )
+            """)
+        else:
+            self.position = self._stored_position(db_path)
+    
+    def _stored_position(self, db_path):
+        # Dry runs preview the assignments a real run would make, without moving the rotation
+        if not os.path.exists(db_path):
+            return 0
+        try:
+            with sqlite3.connect(db_path) as conn:
+                row = conn.execute(
+                    "SELECT fingerprint, position FROM rotation WHERE office_id = ?", (self.office_id,)
+                ).fetchone()
+        except sqlite3.Error:
+            return 0
+        return row[1] if row and row[0] == self.fingerprint else 0
+    
+    def _reserve(self, count):
+        """Advance the shared rotation by count picks and return the first reserved position."""
+        if self.conn is None:
+            start = self.position
+            self.position += count
+            return start
+        
+        # IMMEDIATE takes the write lock up front, so concurrent processes never reserve the same positions
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT fingerprint, position FROM rotation WHERE office_id = ?", (self.office_id,)
+            ).fetchone()
+            start = row[1] if row and row[0] == self.fingerprint else 0
+            if row and row[0] != self.fingerprint:
+                self.logger.info(f"Lead owners of {self.office_id} changed, starting a new rotation")
+            # Kept within one rotation so the stored number never grows without bound
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rotation (office_id, fingerprint, position) VALUES (?, ?, ?)",
+                (self.office_id, self.fingerprint, (start + count) % len(self.cycle))
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return start
+    
+    def _release(self):
+        """Hand the unused rest of the block back, unless another process reserved after it."""
+        if self.conn is None or self.block_next >= self.block_end:
+            return
+        length = len(self.cycle)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE rotation SET position = ? WHERE office_id = ? AND fingerprint = ? AND position = ?",
+                (self.block_next % length, self.office_id, self.fingerprint, self.block_end % length)
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        self.block_next = self.block_end
+    
+    def allocate(self, count=1):
+        """
+        Hand out owners for several leads at once, e.g. for ZohoClient.create_leads.
+        
+        Owners come from the reserved block first; the rest are reserved in
+        one transaction, together with a new block.
+        
+        Args:
+            count (int): Number of leads
+        
+        Returns:
+            list: Lead owner dicts, one per lead
+        """
+        if count <= 0:
+            return []
+        with self.lock:
+            positions = list(range(self.block_next, min(self.block_end, self.block_next + count)))
+            self.block_next += len(positions)
+            missing = count - len(positions)
+            if missing:
+                # A single pick reserves exactly one block
+                reserved = missing + self.block_size - 1
+                start = self._reserve(reserved)
+                positions.extend(range(start, start + missing))
+                self.block_next = start + missing
+                self.block_end = start + reserved
+        cycle = self.cycle
+        length = len(cycle)
+        return [self.owners[cycle[position % length]] for position in positions]
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        return self.allocate(1)[0]
+    
+    def close(self):
+        if self.conn is not None:
+            with self.lock:
+                try:
+                    self._release()
+                except sqlite3.Error as e:
+                    self.logger.warning(f"Could not hand back unused lead owner positions of {self.office_id}: {str(e)}")
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Lead Payload Templates
+This module compiles data/zoho_field_mappings.json once into builder
+callables per processor and lead status, so building a Zoho lead payload
+for a call is a single cheap call instead of walking the mapping and
+substituting placeholders for every call.
+"""
+
+import re
+
+# Used when the mappings file has no section for a processor; matches the
+# payload the processors built before mappings were applied
+DEFAULT_LEAD_FIELDS = {
+    "Phone": "Phone",
+    "First_Name": "First_Name",
+    "Last_Name": "Last_Name",
+    "Company": "Company",
+    "Lead_Status": "Lead_Status",
+    "Lead_Source": "Lead_Source",
+    "Lead_Owner": {"id": "${lead_owner_id}"}
+}
+DEFAULT_LEAD_STATUSES = {
+    "accepted_call": "Accepted Call",
+    "missed_call": "Missed Call",
+    "missed_call_with_voicemail": "Missed Call with Voicemail"
+}
+DEFAULT_LEAD_SOURCE = "RingCentral Integration"
+
+PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+def _compile_value(template):
+    """
+    Compile one mapping value into a function of the template variables.
+    
+    Returns:
+        tuple: (function or None, constant) - the function is None when the value is constant
+    """
+    if isinstance(template, dict):
+        compiled = [(field, _compile_value(value)) for field, value in template.items()]
+        if all(function is None for _, (function, _) in compiled):
+            return None, {field: constant for field, (_, constant) in compiled}
+        
+        def build_dict(variables):
+            return {
+                field: function(variables) if function else constant
+                for field, (function, constant) in compiled
+            }
+        return build_dict, None
+    
+    if isinstance(template, str) and PLACEHOLDER.search(template):
+        whole = PLACEHOLDER.fullmatch(template)
+        if whole:
+            # A lone placeholder keeps the variable's type, e.g. a numeric owner id
+            name = whole.group(1)
+            return (lambda variables: variables[name]), None
+        
+        # split() alternates literal text and placeholder names; literal braces are escaped for format()
+        parts = PLACEHOLDER.split(template)
+        pattern = "".join(
+            "{" + part + "}" if index % 2 else part.replace("{", "{{").replace("}", "}}")
+            for index, part in enumerate(parts)
+        )
+        return (lambda variables: pattern.format(**variables)), None
+    
+    return None, template
+
+class LeadTemplate:
+    """Builds Zoho lead payloads for one processor and lead status."""
+    
+    def __init__(self, fields, bound):
+        """
+        Compile a processor's field mapping.
+        
+        Args:
+            fields (dict): Zoho field to source field name, or to a nested template with ${...} placeholders
+            bound (dict): Source fields with a fixed value for this template, e.g. Lead_Status
+        """
+        self.constants = {}
+        self.copies = []
+        self.templates = []
+        
+        for zoho_field, source in fields.items():
+            if isinstance(source, str) and not PLACEHOLDER.search(source):
+                if source in bound:
+                    self.constants[zoho_field] = bound[source]
+                else:
+                    self.copies.append((zoho_field, source))
+                continue
+            
+            function, constant = _compile_value(source)
+            if function is None:
+                self.constants[zoho_field] = constant
+            else:
+                self.templates.append((zoho_field, function))
+    
+    def __call__(self, values, **variables):
+        """
+        Build one lead payload.
+        
+        Args:
+            values (dict): Source field values, e.g. Phone and Company; missing or None values are left out
+            **variables: Placeholder values, e.g. lead_owner_id
+        
+        Returns:
+            dict: Lead payload for ZohoClient.create_lead
+        """
+        payload = dict(self.constants)
+        for zoho_field, source in self.copies:
+            value = values.get(source)
+            if value is not None:
+                payload[zoho_field] = value
+        for zoho_field, function in self.templates:
+            payload[zoho_field] = function(variables)
+        return payload
+    
+    def build_batch(self, rows):
+        """
+        Build payloads for ZohoClient.create_leads.
+        
+        Args:
+            rows (iterable): (values, variables) pairs
+        
+        Returns:
+            list: Lead payloads in the order of the rows
+        """
+        return [self(values, **variables) for values, variables in rows]
+
+class LeadTemplates:
+    """All lead templates compiled from one field mappings file."""
+    
+    def __init__(self, mappings):
+        """
+        Compile the field mappings.
+        
+        Args:
+            mappings (dict): Contents of data/zoho_field_mappings.json
+        """
+        self.statuses = mappings.get("lead_status") or DEFAULT_LEAD_STATUSES
+        self.lead_source = mappings.get("lead_source", DEFAULT_LEAD_SOURCE)
+        self.templates = {}
+        
+        for processor in ("missed_calls", "accepted_calls"):
+            fields = mappings.get(processor) or DEFAULT_LEAD_FIELDS
+            for status, label in self.statuses.items():
+                self.templates[(processor, status)] = LeadTemplate(
+                    fields, {"Lead_Status": label, "Lead_Source": self.lead_source}
+                )
+    
+    def builder(self, processor, status):
+        """
+        Return the compiled template for a processor and lead status.
+        
+        Args:
+            processor (str): "missed_calls" or "accepted_calls"
+            status (str): Key of the lead_status mapping, e.g. "missed_call_with_voicemail"
+        
+        Returns:
+            LeadTemplate: Callable building the lead payload
+        """
+        try:
+            return self.templates[(processor, status)]
+        except KeyError:
+            raise ValueError(f"No lead template for {processor} with status {status}") from None
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Metrics
+This module turns processing statistics into Prometheus/OpenMetrics text
+exposition format. Scheduled runs write a textfile for the node_exporter
+textfile collector; long-running processes can serve /metrics directly.
+Every series carries office and processor labels, so the per-run textfiles
+of different offices never collide.
+"""
+
+import os
+import json
+import logging
+import datetime
+import threading
+from common import SecureStorage
+
+METRIC_PREFIX = "rc_zoho"
+DEFAULT_TEXTFILE_DIR = os.path.join("logs", "metrics")
+
+# name -> (type, help)
+METRICS = {
+    "runs_total": ("counter", "Processing runs by result"),
+    "calls_processed_total": ("counter", "Calls processed"),
+    "leads_created_total": ("counter", "Leads created in Zoho CRM"),
+    "leads_updated_total": ("counter", "Existing leads that received a call note"),
+    "errors_total": ("counter", "Calls that failed to process"),
+    "queued_for_retry_total": ("counter", "Zoho writes parked in the outbox"),
+    "dead_calls_total": ("counter", "Calls given up on after failing max_attempts times"),
+    "duplicate_attachments_skipped_total": ("counter", "Audio uploads skipped because the lead already had the same content"),
+    "stage_seconds_total": ("counter", "Time spent in each processing stage"),
+    "api_requests_total": ("counter", "API requests by endpoint and HTTP status"),
+    "api_retries_total": ("counter", "API request retries by endpoint"),
+    "api_bytes_sent_total": ("counter", "Request bytes sent by endpoint"),
+    "api_bytes_received_total": ("counter", "Response bytes received by endpoint"),
+    "api_rate_limit_wait_seconds_total": ("counter", "Time spent waiting for rate limit budget by endpoint"),
+    "circuit_breaker_trips_total": ("counter", "Times a circuit breaker opened"),
+    "concurrency_decisions_total": ("counter", "Adaptive concurrency limit changes by endpoint and decision"),
+    "api_request_duration_seconds": ("histogram", "API request latency by endpoint"),
+    "call_to_lead_latency_seconds": ("histogram", "Time from call start until the call was logged on its lead"),
+    "last_run_timestamp_seconds": ("gauge", "Unix time the last run finished"),
+    "last_run_success": ("gauge", "Whether the last run finished without an office-level error"),
+    "last_run_duration_seconds": ("gauge", "Wall time of the last run"),
+    "last_run_calls_per_second": ("gauge", "Throughput of the last run"),
+    "outbox_depth": ("gauge", "Zoho writes waiting in the outbox"),
+    "deferred_calls": ("gauge", "Calls left for the next run when the last run's time budget ran out"),
+    "rate_limit_remaining": ("gauge", "Requests left in the current rate limit window, as reported by the API"),
+    "rate_limit_limit": ("gauge", "Requests allowed per rate limit window, as reported by the API"),
+    "rate_limit_headroom_ratio": ("gauge", "Share of the rate limit window still available"),
+    "concurrency_limit": ("gauge", "Requests allowed in flight at once by the adaptive concurrency limit"),
+    "cache_hits": ("gauge", "Zoho lead cache hits since the client started"),
+    "cache_misses": ("gauge", "Zoho lead cache misses since the client started"),
+    "cache_hit_ratio": ("gauge", "Zoho lead cache hit ratio since the client started")
+}
+
+def _labels_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _seconds_between(start, end):
+    try:
+        return (datetime.datetime.fromisoformat(end) - datetime.datetime.fromisoformat(start)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+class MetricsCollector:
+    """Accumulates processing statistics into counters, gauges and histograms."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+    
+    def _inc(self, name, labels, value):
+        series = self.counters.setdefault(name, {})
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + (value or 0)
+    
+    def _set(self, name, labels, value):
+        if value is None:
+            return
+        self.gauges.setdefault(name, {})[_labels_key(labels)] = value
+    
+    def _observe_buckets(self, name, labels, buckets, total, count, scale=1.0):
+        # Buckets are per-range counts keyed by upper bound; they are made cumulative on render
+        if not count:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = _labels_key(labels)
+        histogram = series.setdefault(key, {"buckets": {}, "sum": 0.0, "count": 0})
+        for bound, bucket_count in buckets.items():
+            bound = "inf" if bound == "inf" else _format_value(float(bound) * scale)
+            histogram["buckets"][bound] = histogram["buckets"].get(bound, 0) + bucket_count
+        histogram["sum"] += total * scale
+        histogram["count"] += count
+    
+    def observe_run(self, processor, office_id, stats):
+        """
+        Fold the statistics of one process_office run into the metrics.
+        
+        Args:
+            processor (str): "missed_calls" or "accepted_calls"
+            office_id (str): Office identifier
+            stats (dict): Statistics returned by process_office
+        """
+        labels = {"office": office_id, "processor": processor}
+        duration = _seconds_between(stats.get("start_time"), stats.get("end_time"))
+        calls = stats.get("total_calls_processed", 0)
+        
+        self.observe_calls(processor, office_id, stats)
+        
+        with self.lock:
+            self._inc("runs_total", dict(labels, result="success" if stats.get("success") else "failure"), 1)
+            self._set("last_run_timestamp_seconds", labels, round(datetime.datetime.now().timestamp(), 3))
+            self._set("last_run_success", labels, 1 if stats.get("success") else 0)
+            self._set("last_run_duration_seconds", labels, duration)
+            if duration:
+                self._set("last_run_calls_per_second", labels, round(calls / duration, 3))
+    
+    def observe_calls(self, processor, office_id, stats):
+        """
+        Fold call counts, instrumentation and client state into the metrics without
+        counting a run, e.g. for calls processed one at a time from webhook events.
+        
+        Args:
+            processor (str): "missed_calls" or "accepted_calls"
+            office_id (str): Office identifier
+            stats (dict): Processing statistics, optionally with "instrumentation"
+        """
+        labels = {"office": office_id, "processor": processor}
+        instrumentation = stats.get("instrumentation", {})
+        
+        with self.lock:
+            self._inc("calls_processed_total", labels, stats.get("total_calls_processed", 0))
+            self._inc("leads_created_total", labels, stats.get("new_leads_created", 0))
+            self._inc("leads_updated_total", labels, stats.get("existing_leads_updated", 0))
+            self._inc("errors_total", labels, stats.get("errors", 0))
+            self._inc("queued_for_retry_total", labels, stats.get("queued_for_retry", 0))
+            self._inc("dead_calls_total", labels, stats.get("dead_calls", 0))
+            self._inc("duplicate_attachments_skipped_total", labels, stats.get("duplicate_attachments_skipped", 0))
+            
+            for stage, entry in instrumentation.get("stages", {}).items():
+                self._inc("stage_seconds_total", dict(labels, stage=stage), entry.get("seconds", 0))
+            
+            for endpoint, entry in instrumentation.get("api", {}).items():
+                endpoint_labels = dict(labels, endpoint=endpoint)
+                for status, count in entry.get("status", {}).items():
+                    self._inc("api_requests_total", dict(endpoint_labels, status=status), count)
+                self._inc("api_retries_total", endpoint_labels, entry.get("retries", 0))
+                self._inc("api_bytes_sent_total", endpoint_labels, entry.get("bytes_sent", 0))
+                self._inc("api_bytes_received_total", endpoint_labels, entry.get("bytes_received", 0))
+                self._inc("api_rate_limit_wait_seconds_total", endpoint_labels, entry.get("rate_limit_wait_seconds", 0))
+                latency = entry.get("latency_ms", {})
+                self._observe_buckets("api_request_duration_seconds", endpoint_labels, latency.get("buckets", {}),
+                                      latency.get("sum", 0), entry.get("requests", 0), scale=0.001)
+            
+            for breaker, trips in instrumentation.get("breaker_trips", {}).items():
+                self._inc("circuit_breaker_trips_total", dict(labels, breaker=breaker), trips)
+            
+            for endpoint, entry in instrumentation.get("concurrency", {}).items():
+                for decision in ("increase", "decrease"):
+                    self._inc("concurrency_decisions_total", dict(labels, endpoint=endpoint, decision=decision),
+                              entry.get(decision, 0))
+            
+            call_to_lead = instrumentation.get("call_to_lead_seconds", {})
+            self._observe_buckets("call_to_lead_latency_seconds", labels, call_to_lead.get("buckets", {}),
+                                  call_to_lead.get("sum", 0), call_to_lead.get("count", 0))
+            
+            if "outbox_depth" in stats:
+                self._set("outbox_depth", labels, stats["outbox_depth"])
+            if "deferred_calls" in stats:
+                self._set("deferred_calls", labels, stats["deferred_calls"])
+            
+            for endpoint, budget in stats.get("rate_limits", {}).items():
+                if budget.get("remaining") is None:
+                    continue
+                endpoint_labels = dict(labels, endpoint=endpoint)
+                self._set("rate_limit_remaining", endpoint_labels, budget["remaining"])
+                self._set("rate_limit_limit", endpoint_labels, budget["limit"])
+                self._set("rate_limit_headroom_ratio", endpoint_labels,
+                          round(budget["remaining"] / budget["limit"], 4) if budget.get("limit") else 0)
+            
+            for endpoint, entry in stats.get("concurrency", {}).items():
+                self._set("concurrency_limit", dict(labels, endpoint=endpoint), entry.get("limit"))
+            
+            cache = stats.get("cache")
+            if cache:
+                self._set("cache_hits", labels, cache.get("hits"))
+                self._set("cache_misses", labels, cache.get("misses"))
+                self._set("cache_hit_ratio", labels, cache.get("hit_ratio"))
+    
+    def render(self):
+        """
+        Render all metrics in Prometheus text exposition format.
+        
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text) in METRICS.items():
+                store = {"counter": self.counters, "gauge": self.gauges, "histogram": self.histograms}[metric_type]
+                series = store.get(name)
+                if not series:
+                    continue
+                
+                full_name = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                
+                for key in sorted(series):
+                    labels = [tuple(item) for item in json.loads(key)]
+                    if metric_type != "histogram":
+                        lines.append(f"{full_name}{_format_labels(labels)} {_format_value(series[key])}")
+                        continue
+                    
+                    histogram = series[key]
+                    cumulative = 0
+                    bounds = sorted((bound for bound in histogram["buckets"] if bound != "inf"), key=float)
+                    for bound in bounds:
+                        cumulative += histogram["buckets"][bound]
+                        lines.append(f"{full_name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(round(histogram['sum'], 6))}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {histogram['count']}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def to_dict(self):
+        with self.lock:
+            return json.loads(json.dumps({
+                "counters": self.counters,
+                "gauges": self.gauges,
+                "histograms": self.histograms
+            }))
+    
+    @classmethod
+    def from_dict(cls, data):
+        collector = cls()
+        collector.counters = data.get("counters", {})
+        collector.gauges = data.get("gauges", {})
+        collector.histograms = data.get("histograms", {})
+        return collector
+
+def write_textfile_metrics(processor, office_id, stats, textfile_dir=None):
+    """
+    Write the metrics of a run for the node_exporter textfile collector.
+    
+    Counters are carried over from previous runs through a state file next to the
+    .prom file, so they keep increasing across scheduled runs.
+    
+    Args:
+        processor (str): "missed_calls" or "accepted_calls"
+        office_id (str): Office identifier
+        stats (dict): Statistics returned by process_office
+        textfile_dir (str): Output directory; defaults to global_config.metrics.textfile_dir
+    
+    Returns:
+        str: Path of the .prom file, or None if metrics are disabled or could not be written
+    """
+    logger = logging.getLogger("metrics")
+    
+    try:
+        if textfile_dir is None:
+            metrics_config = SecureStorage().load_global_config().get("metrics", {})
+            if not metrics_config.get("enabled", True):
+                return None
+            textfile_dir = metrics_config.get("textfile_dir", DEFAULT_TEXTFILE_DIR)
+        
+        os.makedirs(textfile_dir, exist_ok=True)
+        base_name = f"{METRIC_PREFIX}_{processor}_{office_id}"
+        state_path = os.path.join(textfile_dir, f".{base_name}.state.json")
+        prom_path = os.path.join(textfile_dir, f"{base_name}.prom")
+        
+        collector = MetricsCollector()
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                collector = MetricsCollector.from_dict(json.load(f))
+        collector.observe_run(processor, office_id, stats)
+        
+        # The collector must never see a half-written file
+        for path, content in ((state_path, json.dumps(collector.to_dict())), (prom_path, collector.render())):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        
+        return prom_path
+    except Exception as e:
+        logger.error(f"Error writing metrics for {processor}/{office_id}: {str(e)}")
+        return None
+
+class MetricsServer:
+    """Serves a MetricsCollector on /metrics for long-running processes."""
+    
+    def __init__(self, collector, host="0.0.0.0", port=9464):
+        """
+        Initialize the server.
+        
+        Args:
+            collector (MetricsCollector): Metrics to serve
+            host (str): Interface to listen on
+            port (int): Port to listen on
+        """
+        from http.server import ThreadingHTTPServer
+        
+        self.collector = collector
+        self.logger = logging.getLogger("MetricsServer")
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def _handler_class(self):
+        from http.server import BaseHTTPRequestHandler
+        
+        collector = self.collector
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                
+                content = collector.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
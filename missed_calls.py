@@ -9,27 +9,268 @@ This script processes missed calls from RingCentral and creates/updates leads in
 import os
 import sys
 import json
+import time
 import logging
 import argparse
 import datetime
-import itertools
 from common import (
     RingCentralClient, 
     ZohoClient, 
     SecureStorage, 
     LogExporter,
+    RunCheckpoint,
+    RunInstrumentation,
+    RunProfiler,
+    bind_instrumentation,
+    stage_timer,
+    record_call_to_lead,
     normalize_phone_number,
     format_call_time,
     setup_logging,
+    get_call_logger,
     parse_arguments,
     get_date_range,
     check_and_install_dependencies
 )
+from outbox import ZohoOutbox
+from lead_assignment import LeadOwnerAllocator
+from call_queue import CallQueue, DeferredCalls, DEFAULT_PRIORITY_RULES, drain_queue, parse_priority_rules
+from coordination import state_db_path
+from metrics import write_textfile_metrics
+from run_history import record_run
 
-# Check dependencies before importing other modules
-check_and_install_dependencies()
+def _build_call_note(call, caller_number, call_time, has_voicemail):
+    """
+    Build the note title and body recorded on a lead for a missed call.
+    
+    Returns:
+        tuple: (note_title, note_content)
+    """
+    note_title = f"Missed Call - {call_time}"
+    note_content = f"Missed call at {call_time}\n"
+    note_content += f"Caller: {call.get('from', {}).get('name', 'Unknown')} <{caller_number}>\n"
+    note_content += f"Call ID: {call.get('id', 'unknown')}\n"
+    
+    if has_voicemail:
+        note_content += "Voicemail attached"
+    
+    return note_title, note_content
+
+def _log_call_to_lead(zoho_client, rc_client, outbox, office_id, lead_id, call, caller_number, call_time,
+                      has_voicemail, message_id, stats, voicemail_content=None):
+    """
+    Add the call note and voicemail to a lead, queueing anything Zoho rejects.
+    
+    Args:
+        zoho_client (ZohoClient): Zoho client
+        rc_client (RingCentralClient): RingCentral client
+        outbox (ZohoOutbox): Outbox for failed Zoho writes
+        office_id (str): Office identifier
+        lead_id (str): Zoho lead ID
+        call (dict): RingCentral call log record
+        caller_number (str): Normalized caller number
+        call_time (str): Formatted call time
+        has_voicemail (bool): Whether the call has a voicemail
+        message_id (str): RingCentral voicemail message ID
+        stats (dict): Processing statistics
+        voicemail_content (bytes): Voicemail audio if already downloaded
+    """
+    call_id = call.get("id", "unknown")
+    
+    # Add note with call details
+    with stage_timer("note"):
+        note_title, note_content = _build_call_note(call, caller_number, call_time, has_voicemail)
+        note = outbox.submit(
+            zoho_client,
+            ZohoOutbox.make_key("missed_calls", call_id, "add_note"),
+            "add_note",
+            {"lead_id": lead_id, "content": note_content, "title": note_title, "call_id": call_id},
+            office_id
+        )
+    if note:
+        record_call_to_lead(call)
+    else:
+        stats["queued_for_retry"] += 1
+    
+    # Attach voicemail if available
+    if has_voicemail and message_id:
+        with stage_timer("media"):
+            if voicemail_content is None:
+                voicemail_content = rc_client.get_voicemail_content(message_id)
+            if voicemail_content:
+                attachment = outbox.submit(
+                    zoho_client,
+                    ZohoOutbox.make_key("missed_calls", call_id, "attach_audio"),
+                    "attach_audio",
+                    {
+                        "lead_id": lead_id,
+                        "call": call,
+                        "content_type": "audio/wav",
+                        "call_time": call_time,
+                        "file_type": "voicemail"
+                    },
+                    office_id,
+                    voicemail_content
+                )
+                if attachment and attachment.get("duplicate"):
+                    stats["duplicate_attachments_skipped"] += 1
+                elif attachment:
+                    stats["voicemail_attachments"] += 1
+                else:
+                    stats["queued_for_retry"] += 1
+
+def process_call(call, rc_client, zoho_client, outbox, office_id, lead_owner_cycle, stats, dry_run=False,
+                 lead_templates=None):
+    """
+    Process a single missed call into Zoho CRM.
+    
+    Args:
+        call (dict): RingCentral call log record
+        rc_client (RingCentralClient): RingCentral client
+        zoho_client (ZohoClient): Zoho client
+        outbox (ZohoOutbox): Outbox for failed Zoho writes
+        office_id (str): Office identifier
+        lead_owner_cycle (iterator): Lead owners for weighted round-robin assignment, e.g. a LeadOwnerAllocator
+        stats (dict): Processing statistics
+        dry_run (bool): Run without making changes to Zoho
+        lead_templates (LeadTemplates): Compiled field mappings; loaded from the configuration when omitted
+    """
+    logger = logging.getLogger("missed_calls")
+    call_logger = get_call_logger("missed_calls")
+    
+    stats["total_calls_processed"] += 1
+    
+    # Extract caller information
+    with stage_timer("normalize"):
+        caller_number = normalize_phone_number(call.get("from", {}).get("phoneNumber", ""))
+        call_time = format_call_time(call.get("startTime", ""))
+    
+    if not caller_number:
+        logger.warning("Skipping call %s with no caller number", call['id'])
+        return
+    
+    call_id = call.get("id", "unknown")
+    
+    # Calls with queued operations are finished by the outbox drain
+    with stage_timer("dedupe"):
+        has_pending = outbox.has_pending("missed_calls", call_id)
+    if has_pending:
+        call_logger.debug(call_id, "Skipping call %s with operations pending in the outbox", call_id)
+        return
+    
+    # Check for voicemail; Simple view records carry it on the call, Detailed ones on a leg
+    has_voicemail = False
+    message_id = None
+    
+    for message in [call.get("message")] + [leg.get("message") for leg in call.get("legs", [])]:
+        if message and message.get("type") == "VoiceMail":
+            has_voicemail = True
+            message_id = message.get("id")
+            break
+    
+    if has_voicemail:
+        stats["missed_with_voicemail"] += 1
+        call_logger.debug(call_id, "Found voicemail for call %s", call_id)
+    else:
+        stats["missed_without_voicemail"] += 1
+        call_logger.debug(call_id, "No voicemail for call %s", call_id)
+    
+    # Skip processing if in dry-run mode
+    if dry_run:
+        call_logger.debug(call_id, "DRY RUN: Would process missed call %s", call_id)
+        return
+    
+    # Search for existing lead by phone number
+    with stage_timer("resolve"):
+        existing_lead = zoho_client.search_by_phone(caller_number)
+    
+    if existing_lead:
+        # Lead exists, update it
+        lead_id = existing_lead.get("id")
+        call_logger.debug(call_id, "Found existing lead %s for caller %s", lead_id, caller_number)
+        
+        # Only add note, do not update fields on existing leads
+        stats["existing_leads_updated"] += 1
+        
+        # Check for existing notes for this call to prevent duplicates
+        with stage_timer("dedupe"):
+            existing_notes = zoho_client.get_lead_notes(lead_id)
+        
+        if existing_notes:
+            has_note_for_call = any(f"Call ID: {call_id}" in note.get("Note_Content", "") for note in existing_notes)
+            if has_note_for_call:
+                call_logger.debug(call_id, "Skipping note creation for call %s as it already exists", call_id)
+                return
+        
+        _log_call_to_lead(
+            zoho_client, rc_client, outbox, office_id, lead_id, call,
+            caller_number, call_time, has_voicemail, message_id, stats
+        )
+    
+    else:
+        # Create new lead
+        lead_owner = next(lead_owner_cycle)
+        
+        # Set base lead data
+        status = "missed_call_with_voicemail" if has_voicemail else "missed_call"
+        build_lead = (lead_templates or SecureStorage().load_lead_templates()).builder("missed_calls", status)
+        lead_data = build_lead({
+            "Company": call.get("from", {}).get("name", "Unknown Caller"),
+            "First_Name": "",
+            "Last_Name": "Unknown Caller",
+            "Phone": caller_number
+        }, lead_owner_id=lead_owner["id"])
+        
+        # Create lead in Zoho
+        with stage_timer("create"):
+            new_lead = zoho_client.create_lead(lead_data)
+        
+        if new_lead:
+            lead_id = new_lead["id"]
+            call_logger.debug(call_id, "Created new lead %s for caller %s", lead_id, caller_number)
+            stats["new_leads_created"] += 1
+            
+            _log_call_to_lead(
+                zoho_client, rc_client, outbox, office_id, lead_id, call,
+                caller_number, call_time, has_voicemail, message_id, stats
+            )
+        else:
+            # Zoho did not accept the lead; park the whole chain in the outbox
+            voicemail_content = None
+            if has_voicemail and message_id:
+                voicemail_content = rc_client.get_voicemail_content(message_id)
+            
+            note_title, note_content = _build_call_note(call, caller_number, call_time, has_voicemail)
+            followups = [{
+                "key": ZohoOutbox.make_key("missed_calls", call_id, "add_note"),
+                "operation": "add_note",
+                "payload": {"content": note_content, "title": note_title, "call_id": call_id}
+            }]
+            if voicemail_content:
+                followups.append({
+                    "key": ZohoOutbox.make_key("missed_calls", call_id, "attach_audio"),
+                    "operation": "attach_audio",
+                    "payload": {
+                        "call": call,
+                        "content_type": "audio/wav",
+                        "call_time": call_time,
+                        "file_type": "voicemail"
+                    }
+                })
+            
+            outbox.enqueue(
+                ZohoOutbox.make_key("missed_calls", call_id, "create_lead"),
+                "create_lead",
+                {"lead_data": lead_data, "caller_number": caller_number, "call_id": call_id, "followups": followups},
+                office_id,
+                voicemail_content,
+                "Lead creation failed"
+            )
+            stats["queued_for_retry"] += 1
 
-def process_office(office_id, hours_back=24, debug=False, dry_run=False):
+def process_office(office_id, hours_back=24, debug=False, dry_run=False, resume=False, slices=1,
+                   profile=False, profile_top=25, rc_client=None, zoho_client=None, deadline=None,
+                   priority_rules=None, lease=None, progress=None):
     """
     Process missed calls for a specific office.
     
@@ -38,14 +279,27 @@ def process_office(office_id, hours_back=24, debug=False, dry_run=False):
         hours_back (int): Hours to look back for calls
         debug (bool): Enable debug logging
         dry_run (bool): Run without making changes to Zoho
-        
+        resume (bool): Continue from the last checkpoint of an interrupted run
+        slices (int): Number of time slices the call log window is fetched in concurrently
+        profile (bool): Write cProfile and tracemalloc reports next to the stats
+        profile_top (int): Entries in the profile summaries
+        rc_client (RingCentralClient): Existing client to reuse, e.g. from the daemon
+        zoho_client (ZohoClient): Existing client to reuse, e.g. from the daemon
+        deadline (float): time.time() after which no further call is started; the rest are deferred
+        priority_rules (iterable): Order calls are processed in, e.g. ("voicemail", "newest");
+            defaults to global_config processing.priority_rules
+        lease (Lease): Office lease held when offices are shared between nodes; processing
+            stops, and outbox and deferred call writes are refused, once it is lost
+        progress (callable): Called with the statistics dict as soon as it is created; the dict
+            is updated as each call is processed, e.g. for showing a job's progress
+    
     Returns:
         dict: Processing statistics
     """
     # Set up logging
     logger = setup_logging("missed_calls", debug)
-    logger.info(f"Starting missed calls processing for office: {office_id}")
-    logger.info(f"Looking back {hours_back} hours")
+    logger.info("Starting missed calls processing for office: %s", office_id)
+    logger.info("Looking back %s hours", hours_back)
     
     if dry_run:
         logger.info("DRY RUN MODE: No changes will be made to Zoho")
@@ -58,221 +312,253 @@ def process_office(office_id, hours_back=24, debug=False, dry_run=False):
         "new_leads_created": 0,
         "existing_leads_updated": 0,
         "voicemail_attachments": 0,
+        "duplicate_attachments_skipped": 0,
+        "queued_for_retry": 0,
+        "deferred_calls": 0,
+        "dead_calls": 0,
         "errors": 0,
         "start_time": datetime.datetime.now().isoformat(),
         "office_id": office_id,
         "hours_back": hours_back
     }
+    if progress is not None:
+        progress(stats)
     
-    try:
-        # Initialize services
-        storage = SecureStorage(debug)
-        
-        # Load configuration
-        credentials = storage.load_credentials()
-        extensions = storage.load_extensions(office_id)
-        lead_owners = storage.load_lead_owners(office_id)
-        field_mappings = storage.load_field_mappings()
-        
-        # Initialize clients
-        rc_client = RingCentralClient(credentials["ringcentral"], debug)
-        zoho_client = ZohoClient(credentials["zoho"], debug)
-        
-        # Setup lead owner cycle for round-robin assignment
-        lead_owner_cycle = itertools.cycle(lead_owners)
-        
-        # Get date range for call logs
-        start_date, end_date = get_date_range(hours_back)
-        
-        # Create log exporter
-        date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        log_exporter = LogExporter("missed_calls", office_id, date_str, debug)
-        
-        # Process each extension
-        for extension in extensions:
-            logger.info(f"Processing extension: {extension['name']} (ID: {extension['id']})")
+    # Time stages and account API requests made while processing this office
+    instrumentation = RunInstrumentation()
+    profiler = RunProfiler(profile, profile_top)
+    profiler.start()
+    
+    outbox = None
+    lead_owner_cycle = None
+    with bind_instrumentation(instrumentation):
+        try:
+            # Initialize services
+            storage = SecureStorage(debug)
             
-            # Get missed calls for this extension
-            call_logs = rc_client.get_call_logs(
-                extension['id'], 
-                start_date=start_date, 
-                end_date=end_date, 
-                direction="Inbound",
-                type="Voice",
-                result="Missed"
-            )
+            # Load configuration
+            extensions = storage.load_extensions(office_id)
+            lead_owners = storage.load_lead_owners(office_id)
+            lead_templates = storage.load_lead_templates()
             
-            if not call_logs:
-                logger.info(f"No missed calls found for extension {extension['id']}")
-                continue
+            # Initialize clients unless warm ones were handed in
+            if rc_client is None or zoho_client is None:
+                credentials = storage.load_credentials()
+                rc_client = rc_client or RingCentralClient(credentials["ringcentral"], debug)
+                zoho_client = zoho_client or ZohoClient(
+                    credentials["zoho"], debug,
+                    seed_attachments=storage.load_global_config().get("attachments", {}).get("seed_existing", False)
+                )
             
-            # Export raw call logs
-            log_exporter.export_raw_logs(call_logs, "raw_call_logs")
+            # Retry Zoho writes that failed on previous runs before fetching new calls
+            coordination_config = storage.load_global_config().get("coordination")
+            outbox = ZohoOutbox(state_db_path("outbox.db", coordination_config), debug=debug, lease=lease)
+            if not dry_run:
+                stats["outbox_drain"] = outbox.drain(zoho_client, office_id)
             
-            # Process each call
-            for call in call_logs:
-                stats["total_calls_processed"] += 1
-                
-                # Extract caller information
-                caller_number = normalize_phone_number(call.get("from", {}).get("phoneNumber", ""))
+            # Weighted rotation of lead owners, continued from the office's previous runs and
+            # reserved in blocks, so new leads do not each write to the rotation database
+            lead_owner_cycle = LeadOwnerAllocator(office_id, lead_owners, storage.load_assignment_rules(office_id),
+                                                  persist=not dry_run)
+            
+            # Get date range for call logs
+            start_date, end_date = get_date_range(hours_back)
+            
+            # Create log exporter
+            date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+            log_exporter = LogExporter("missed_calls", office_id, date_str, debug)
+            
+            # Checkpoint progress so an interrupted run can resume at the last committed page
+            checkpoint = RunCheckpoint("missed_calls", office_id, enabled=not dry_run)
+            state = checkpoint.start(start_date, end_date, hours_back, resume)
+            start_date, end_date = state["start_date"], state["end_date"]
+            
+            # Calls are queued as they are fetched and processed by priority afterwards; calls
+            # left over by an earlier run whose time budget ran out go first in line
+            if priority_rules is None:
+                priority_rules = storage.load_global_config().get("processing", {}).get(
+                    "priority_rules", DEFAULT_PRIORITY_RULES)
+            queue = CallQueue(priority_rules)
+            deferred = DeferredCalls("missed_calls", office_id, state_db_path("deferred_calls.db", coordination_config),
+                                     enabled=not dry_run, lease=lease)
+            for call in deferred.load():
+                queue.push(call)
+            stats["deferred_loaded"] = len(queue)
+            if queue:
+                logger.info("Picked up %d calls deferred by an earlier run", len(queue))
+            
+            profiler.mark("setup")
+            
+            # Process each extension
+            for extension in extensions:
+                if lease is not None:
+                    lease.check()
                 
-                if not caller_number:
-                    logger.warning(f"Skipping call {call['id']} with no caller number")
+                page = checkpoint.resume_point(extension['id'])
+                if page is None:
+                    logger.info("Extension %s already completed, skipping", extension['id'])
                     continue
                 
-                call_time = format_call_time(call.get("startTime", ""))
-                call_id = call.get("id", "unknown")
-                
-                # Check for voicemail
-                has_voicemail = False
-                message_id = None
-                
-                for leg in call.get("legs", []):
-                    message = leg.get("message", {})
-                    if message and message.get("type") == "VoiceMail":
-                        has_voicemail = True
-                        message_id = message.get("id")
-                        break
+                logger.info("Processing extension: %s (ID: %s)", extension['name'], extension['id'])
                 
-                if has_voicemail:
-                    stats["missed_with_voicemail"] += 1
-                    logger.info(f"Found voicemail for call {call_id}")
+                # Get missed calls for this extension a page at a time; the Simple view has
+                # everything a missed call needs, including the voicemail link
+                found_calls = False
+                if slices > 1:
+                    # The merged slices are treated as a single page for checkpointing
+                    with stage_timer("fetch"):
+                        pages = [(1, rc_client.get_call_logs_sliced(
+                            extension['id'],
+                            start_date,
+                            end_date,
+                            slices=slices,
+                            direction="Inbound",
+                            type="Voice",
+                            result="Missed",
+                            view="Simple"
+                        ))]
                 else:
-                    stats["missed_without_voicemail"] += 1
-                    logger.info(f"No voicemail for call {call_id}")
+                    pages = rc_client.iter_call_log_pages(
+                        extension['id'], 
+                        start_date=start_date, 
+                        end_date=end_date, 
+                        direction="Inbound",
+                        type="Voice",
+                        result="Missed",
+                        page=page,
+                        view="Simple"
+                    )
+                    pages = instrumentation.iter_stage("fetch", pages)
                 
-                # Skip processing if in dry-run mode
-                if dry_run:
-                    logger.info(f"DRY RUN: Would process missed call {call_id}")
-                    continue
-                
-                # Search for existing lead by phone number
-                existing_lead = zoho_client.search_by_phone(caller_number)
-                
-                if existing_lead:
-                    # Lead exists, update it
-                    lead_id = existing_lead.get("id")
-                    logger.info(f"Found existing lead {lead_id} for caller {caller_number}")
-                    
-                    # Only add note, do not update fields on existing leads
-                    stats["existing_leads_updated"] += 1
-                    
-                    # Check for existing notes for this call to prevent duplicates
-                    existing_notes = zoho_client.get_lead_notes(lead_id)
-                    
-                    if existing_notes:
-                        has_note_for_call = any(f"Call ID: {call_id}" in note.get("Note_Content", "") for note in existing_notes)
-                        if has_note_for_call:
-                            logger.info(f"Skipping note creation for call {call_id} as it already exists")
-                            continue
+                for page, call_logs in pages:
+                    if not call_logs:
+                        checkpoint.commit_page(extension['id'], page + 1)
+                        continue
+                    found_calls = True
                     
-                    # Add note with call details
-                    note_title = f"Missed Call - {call_time}"
-                    note_content = f"Missed call at {call_time}\n"
-                    note_content += f"Caller: {call.get('from', {}).get('name', 'Unknown')} <{caller_number}>\n"
-                    note_content += f"Call ID: {call_id}\n"
+                    # Export raw call logs
+                    log_exporter.export_raw_logs(call_logs, "raw_call_logs")
                     
-                    if has_voicemail:
-                        note_content += "Voicemail attached"
+                    # Save the page's calls before committing it, so none are lost if the run stops
+                    for call in deferred.add(call_logs):
+                        queue.push(call)
                     
-                    zoho_client.add_note_to_lead(lead_id, note_content, note_title)
-                    
-                    # Attach voicemail if available
-                    if has_voicemail and message_id:
-                        voicemail_content = rc_client.get_voicemail_content(message_id)
-                        if voicemail_content:
-                            zoho_client.attach_audio_to_lead(
-                                lead_id,
-                                call,
-                                voicemail_content,
-                                "audio/wav",
-                                call_time,
-                                "voicemail"
-                            )
-                            stats["voicemail_attachments"] += 1
+                    checkpoint.commit_page(extension['id'], page + 1)
                 
-                else:
-                    # Create new lead
-                    lead_owner = next(lead_owner_cycle)
-                    
-                    # Set base lead data
-                    lead_data = {
-                        "Company": call.get("from", {}).get("name", "Unknown Caller"),
-                        "First_Name": "", 
-                        "Last_Name": "Unknown Caller",
-                        "Phone": caller_number,
-                        "Lead_Status": "Missed Call",
-                        "Lead_Source": "RingCentral Integration",
-                        "Lead_Owner": {"id": lead_owner["id"]}
-                    }
-                    
-                    # Create lead in Zoho
-                    new_lead = zoho_client.create_lead(lead_data)
-                    
-                    if new_lead:
-                        lead_id = new_lead["id"]
-                        logger.info(f"Created new lead {lead_id} for caller {caller_number}")
-                        stats["new_leads_created"] += 1
-                        
-                        # Add note with call details
-                        note_title = f"Missed Call - {call_time}"
-                        note_content = f"Missed call at {call_time}\n"
-                        note_content += f"Caller: {call.get('from', {}).get('name', 'Unknown')} <{caller_number}>\n"
-                        note_content += f"Call ID: {call_id}\n"
-                        
-                        if has_voicemail:
-                            note_content += "Voicemail attached"
-                        
-                        zoho_client.add_note_to_lead(lead_id, note_content, note_title)
-                        
-                        # Attach voicemail if available
-                        if has_voicemail and message_id:
-                            voicemail_content = rc_client.get_voicemail_content(message_id)
-                            if voicemail_content:
-                                zoho_client.attach_audio_to_lead(
-                                    lead_id,
-                                    call,
-                                    voicemail_content,
-                                    "audio/wav",
-                                    call_time,
-                                    "voicemail"
-                                )
-                                stats["voicemail_attachments"] += 1
+                if not found_calls:
+                    logger.info("No missed calls found for extension %s", extension['id'])
+                
+                checkpoint.complete_extension(extension['id'])
+                profiler.mark(f"extension {extension['id']}")
+            
+            # Process queued calls by priority until the time budget runs out
+            logger.info("Processing %d queued calls by priority: %s", len(queue), ", ".join(queue.rules) or "fetch order")
+            stats["deferred_calls"] = drain_queue(
+                queue,
+                lambda call: process_call(call, rc_client, zoho_client, outbox, office_id, lead_owner_cycle, stats,
+                                          dry_run, lead_templates),
+                deferred,
+                deadline,
+                stats,
+                lease
+            )
+            deferred.close()
+            profiler.mark("process")
+            if stats["deferred_calls"]:
+                logger.warning("Time budget ran out; %d calls deferred to the next run", stats["deferred_calls"])
+            
+            checkpoint.complete()
+            
+            # Capture backlog, rate limit, concurrency and cache state for the metrics exporter
+            stats["outbox_depth"] = outbox.depth(office_id)
+            stats["rate_limits"] = dict(rc_client.rate_limit_status(), **zoho_client.rate_limit_status())
+            stats["concurrency"] = dict(rc_client.concurrency_status(), **zoho_client.concurrency_status())
+            stats["cache"] = zoho_client.cache.stats()
+            
+            # Log completion
+            stats["end_time"] = datetime.datetime.now().isoformat()
+            stats["success"] = True
+            logger.info("Missed calls processing completed for office: %s", office_id)
+            logger.info("Stats: %s", json.dumps(stats, indent=2))
         
-        # Log completion
-        stats["end_time"] = datetime.datetime.now().isoformat()
-        stats["success"] = True
-        logger.info(f"Missed calls processing completed for office: {office_id}")
-        logger.info(f"Stats: {json.dumps(stats, indent=2)}")
+        except Exception as e:
+            logger.error("Error processing office %s: %s", office_id, e, exc_info=True)
+            stats["success"] = False
+            stats["error"] = str(e)
+            stats["end_time"] = datetime.datetime.now().isoformat()
         
-    except Exception as e:
-        logger.error(f"Error processing office {office_id}: {str(e)}", exc_info=True)
-        stats["success"] = False
-        stats["error"] = str(e)
-        stats["end_time"] = datetime.datetime.now().isoformat()
+        finally:
+            if outbox is not None:
+                outbox.close()
+            # Hands the unused owners of the reserved block back to the rotation
+            if lead_owner_cycle is not None:
+                lead_owner_cycle.close()
+    
+    stats["instrumentation"] = instrumentation.snapshot()
+    profiler.stop()
     
     # Export processing statistics
+    stats_path = None
     if 'log_exporter' in locals():
-        log_exporter.export_stats(stats, "processing_stats")
+        stats["raw_logs"] = log_exporter.close()
+        if profile:
+            stats["profile"] = profiler.export(log_exporter)
+        stats_path = log_exporter.export_stats(stats, "processing_stats")
+    
+    # Index the run for the admin Reports tab and HTML reports
+    record_run("missed_calls", office_id, stats, stats_path, dry_run)
+    
+    # Publish the run for the Prometheus textfile collector
+    write_textfile_metrics("missed_calls", office_id, stats)
     
     return stats
 
 if __name__ == "__main__":
     # Parse command line arguments
     args = parse_arguments()
+    setup_logging("missed_calls", args.debug, args.log_sample_rate)
+    
+    # Verified once per environment; later runs only read a marker file
+    if not check_and_install_dependencies(args.check_dependencies):
+        sys.exit(1)
+    
+    if args.record or args.replay:
+        from traffic import configure_traffic
+        configure_traffic(args.record, args.replay, args.replay_services.split(","), args.replay_speed)
     
     # Process single office or multiple offices based on arguments
     if args.office:
-        process_office(args.office, args.hours_back, args.debug, args.dry_run)
+        office_ids = [args.office]
     elif args.office_order:
-        offices = [o.strip() for o in args.office_order.split(',')]
-        for office in offices:
-            process_office(office, args.hours_back, args.debug, args.dry_run)
+        office_ids = [o.strip() for o in args.office_order.split(',')]
     elif args.all_offices:
         storage = SecureStorage(args.debug)
         offices = storage.load_office_list()
-        for office in sorted(offices, key=lambda o: o.get('processing_order', 999)):
-            process_office(office['id'], args.hours_back, args.debug, args.dry_run)
+        office_ids = [office['id'] for office in sorted(offices, key=lambda o: o.get('processing_order', 999))]
     else:
         print("Error: Must specify --office, --office-order, or --all-offices")
         sys.exit(1)
+    
+    try:
+        priority_rules = parse_priority_rules(args.priority) if args.priority is not None else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    # The budget is shared by all offices of the run, so offices later in processing_order
+    # are the ones whose calls are deferred when it runs out
+    deadline = time.time() + args.time_budget if args.time_budget else None
+    
+    def run_office(office_id, lease=None):
+        return process_office(office_id, args.hours_back, args.debug, args.dry_run, args.resume, args.slices,
+                              args.profile, args.profile_top, deadline=deadline, priority_rules=priority_rules,
+                              lease=lease)
+    
+    # With a shared lease store, offices are split between the nodes running this script
+    from coordination import OfficeCoordinator
+    coordinator = OfficeCoordinator.from_arguments(args, SecureStorage(args.debug).load_global_config().get("coordination"))
+    if coordinator:
+        coordinator.run("missed_calls", office_ids, run_office)
+    else:
+        for office_id in office_ids:
+            run_office(office_id)
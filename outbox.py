@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Zoho Outbox
+This module keeps a durable, SQLite-backed queue of Zoho CRM writes that
+failed during a run so they can be retried on the next run without
+re-scanning RingCentral call logs.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from coordination import FENCING_TABLE, fenced_write
+
+# Maps outbox operations to the ZohoClient circuit breaker that guards them
+OPERATION_BREAKERS = {
+    "create_lead": "create",
+    "add_note": "notes",
+    "attach_audio": "attachments"
+}
+
+class ZohoOutbox:
+    """Durable queue of pending Zoho operations keyed by idempotency key."""
+    
+    def __init__(self, db_path="data/outbox.db", debug=False, base_delay=60, max_delay=21600, max_attempts=12,
+                 lease=None):
+        """
+        Initialize the outbox.
+        
+        Args:
+            db_path (str): Path to the SQLite database file
+            debug (bool): Enable debug logging
+            base_delay (int): Initial retry delay in seconds
+            max_delay (int): Maximum retry delay in seconds
+            max_attempts (int): Attempts before an operation is marked dead
+            lease (Lease): Office lease the run holds; operations and writes are refused once it is lost
+        """
+        self.db_path = db_path
+        self.debug = debug
+        self.lease = lease
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger("ZohoOutbox")
+        self.lock = threading.Lock()
+        
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                idempotency_key TEXT PRIMARY KEY,
+                office_id TEXT,
+                operation TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                audio BLOB,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+        self.conn.execute(FENCING_TABLE)
+        self.conn.commit()
+    
+    @staticmethod
+    def make_key(source, call_id, operation):
+        """
+        Build the idempotency key for an operation.
+        
+        Args:
+            source (str): Processor name, e.g. "missed_calls"
+            call_id (str): RingCentral call ID
+            operation (str): Outbox operation name
+        
+        Returns:
+            str: Idempotency key
+        """
+        return f"{source}:{call_id}:{operation}"
+    
+    def enqueue(self, key, operation, payload, office_id=None, audio=None, error=None):
+        """
+        Park an operation for a later retry. Re-enqueueing an existing key is a no-op.
+        
+        Args:
+            key (str): Idempotency key
+            operation (str): One of OPERATION_BREAKERS
+            payload (dict): JSON-serializable operation arguments
+            office_id (str): Office identifier
+            audio (bytes): Optional audio content for attachments
+            error (str): Error that caused the operation to be queued
+        
+        Returns:
+            bool: True if a new entry was created
+        """
+        now = time.time()
+        with self.lock, fenced_write(self.conn, self.lease):
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(idempotency_key, office_id, operation, payload, audio, next_attempt_at, last_error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, office_id, operation, json.dumps(payload), audio, now + self.base_delay, error, now)
+            )
+        
+        if cursor.rowcount:
+            self.logger.warning(f"Queued {operation} for retry: {key}")
+        return bool(cursor.rowcount)
+    
+    def has_pending(self, source, call_id):
+        """
+        Check whether any operation for a call is still waiting in the outbox.
+        
+        Args:
+            source (str): Processor name
+            call_id (str): RingCentral call ID
+        
+        Returns:
+            bool: True if the call has pending operations
+        """
+        # Exact keys use the primary key index; every operation's key is built by make_key
+        keys = [self.make_key(source, call_id, operation) for operation in OPERATION_BREAKERS]
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT 1 FROM outbox WHERE idempotency_key IN ({', '.join('?' * len(keys))}) "
+                f"AND status = 'pending' LIMIT 1",
+                keys
+            ).fetchone()
+        return row is not None
+    
+    def depth(self, office_id=None):
+        """
+        Count pending operations.
+        
+        Args:
+            office_id (str): Limit the count to one office
+        
+        Returns:
+            int: Number of pending operations
+        """
+        query = "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+        params = ()
+        if office_id:
+            query += " AND office_id = ?"
+            params = (office_id,)
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()[0]
+    
+    def submit(self, zoho_client, key, operation, payload, office_id=None, audio=None):
+        """
+        Execute an operation now and queue it if Zoho does not accept it.
+        
+        Args:
+            zoho_client (ZohoClient): Zoho client
+            key (str): Idempotency key
+            operation (str): One of OPERATION_BREAKERS
+            payload (dict): Operation arguments
+            office_id (str): Office identifier
+            audio (bytes): Optional audio content for attachments
+        
+        Returns:
+            The Zoho result, or None if the operation was queued
+        
+        Raises:
+            LeaseLostError: If the outbox's lease was lost; nothing is sent or queued
+        """
+        if self.lease is not None:
+            self.lease.check()
+        
+        try:
+            result = self._execute(zoho_client, operation, payload, audio, office_id)
+            error = None if result else "No result returned from Zoho"
+        except Exception as e:
+            result = None
+            error = str(e)
+        
+        if not result:
+            self.enqueue(key, operation, payload, office_id, audio, error)
+        return result
+    
+    def drain(self, zoho_client, office_id=None, limit=None):
+        """
+        Retry due operations, backing off exponentially on failure.
+        
+        Args:
+            zoho_client (ZohoClient): Zoho client
+            office_id (str): Only drain operations for this office
+            limit (int): Maximum number of operations to attempt
+        
+        Returns:
+            dict: Drain statistics
+        """
+        stats = {"attempted": 0, "succeeded": 0, "failed": 0, "dead": 0, "skipped": 0}
+        
+        query = "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ?"
+        params = [time.time()]
+        if office_id:
+            query += " AND office_id = ?"
+            params.append(office_id)
+        query += " ORDER BY created_at"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        
+        if rows:
+            self.logger.info(f"Draining {len(rows)} queued Zoho operations")
+        
+        for row in rows:
+            if self.lease is not None:
+                self.lease.check()
+            
+            breaker = zoho_client.circuit_breakers.get(OPERATION_BREAKERS.get(row["operation"]))
+            if breaker and not breaker.allow_request():
+                stats["skipped"] += 1
+                continue
+            
+            stats["attempted"] += 1
+            try:
+                result = self._execute(zoho_client, row["operation"], json.loads(row["payload"]), row["audio"], row["office_id"])
+                error = None if result else "No result returned from Zoho"
+            except Exception as e:
+                result = None
+                error = str(e)
+            
+            if result:
+                self._delete(row["idempotency_key"])
+                stats["succeeded"] += 1
+            elif self._reschedule(row, error):
+                stats["failed"] += 1
+            else:
+                stats["dead"] += 1
+        
+        if stats["attempted"]:
+            self.logger.info(f"Outbox drain: {stats['succeeded']} succeeded, {stats['failed']} rescheduled, {stats['dead']} dead")
+        return stats
+    
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
+    
+    def _execute(self, zoho_client, operation, payload, audio, office_id):
+        if operation == "create_lead":
+            # A previous attempt may have reached Zoho before failing, so look first
+            lead = zoho_client.search_by_phone(payload["caller_number"])
+            if not lead:
+                lead = zoho_client.create_lead(payload["lead_data"])
+            if not lead:
+                return None
+            
+            # Follow-ups get their own keys so a failure only requeues that step
+            for followup in payload.get("followups", []):
+                followup_payload = dict(followup["payload"], lead_id=lead["id"])
+                self.submit(
+                    zoho_client,
+                    followup["key"],
+                    followup["operation"],
+                    followup_payload,
+                    office_id,
+                    audio if followup["operation"] == "attach_audio" else None
+                )
+            return lead
+        
+        if operation == "add_note":
+            call_marker = f"Call ID: {payload['call_id']}"
+            existing_notes = zoho_client.get_lead_notes(payload["lead_id"]) or []
+            if any(call_marker in note.get("Note_Content", "") for note in existing_notes):
+                return True
+            return zoho_client.add_note_to_lead(payload["lead_id"], payload["content"], payload["title"])
+        
+        if operation == "attach_audio":
+            return zoho_client.attach_audio_to_lead(
+                payload["lead_id"],
+                payload["call"],
+                audio,
+                payload["content_type"],
+                payload["call_time"],
+                payload["file_type"]
+            )
+        
+        raise ValueError(f"Unknown outbox operation: {operation}")
+    
+    def _delete(self, key):
+        with self.lock, fenced_write(self.conn, self.lease):
+            self.conn.execute("DELETE FROM outbox WHERE idempotency_key = ?", (key,))
+    
+    def _reschedule(self, row, error):
+        attempts = row["attempts"] + 1
+        if attempts >= self.max_attempts:
+            self.logger.error(f"Giving up on {row['operation']} after {attempts} attempts: {row['idempotency_key']}")
+            with self.lock, fenced_write(self.conn, self.lease):
+                self.conn.execute(
+                    "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE idempotency_key = ?",
+                    (attempts, error, row["idempotency_key"])
+                )
+            return False
+        
+        delay = min(self.base_delay * (2 ** attempts), self.max_delay)
+        with self.lock, fenced_write(self.conn, self.lease):
+            self.conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE idempotency_key = ?",
+                (attempts, time.time() + delay, error, row["idempotency_key"])
+            )
+        return True
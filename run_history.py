@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Run History
+This module keeps an indexed SQLite history of every processing run,
+written at the end of each process_office, so the admin Reports tab and
+HTML reports can query runs by office, processor and date range instead
+of finding and parsing the per-day statistics files under logs/.
+"""
+
+import os
+import sys
+import html
+import json
+import sqlite3
+import logging
+import argparse
+import datetime
+import threading
+
+# Statistics copied into their own columns; the full statistics are kept as JSON
+SUMMARY_FIELDS = (
+    ("calls_processed", "total_calls_processed"),
+    ("leads_created", "new_leads_created"),
+    ("leads_updated", "existing_leads_updated"),
+    ("errors", "errors"),
+    ("queued_for_retry", "queued_for_retry"),
+    ("deferred_calls", "deferred_calls")
+)
+
+def _timestamp(value):
+    """Return an ISO time from the statistics as a POSIX timestamp, or None."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+class RunHistory:
+    """SQLite index of processing runs."""
+    
+    def __init__(self, db_path="data/run_history.db"):
+        """
+        Initialize the history.
+        
+        Args:
+            db_path (str): Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        summary_columns = ", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column, _ in SUMMARY_FIELDS)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                processor TEXT NOT NULL,
+                office_id TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                ended_at REAL,
+                success INTEGER NOT NULL,
+                dry_run INTEGER NOT NULL DEFAULT 0,
+                {summary_columns},
+                error TEXT,
+                stats_path TEXT UNIQUE,
+                stats TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_office ON runs (office_id, started_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_processor ON runs (processor, started_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started_at)")
+        self.conn.commit()
+    
+    def record(self, processor, office_id, stats, stats_path=None, dry_run=False):
+        """
+        Add a run.
+        
+        Args:
+            processor (str): "missed_calls" or "accepted_calls"
+            office_id (str): Office identifier
+            stats (dict): Statistics returned by process_office
+            stats_path (str): Statistics file written for the run; a file is only recorded once
+            dry_run (bool): Whether the run made no changes to Zoho
+        
+        Returns:
+            int: Row ID of the run, or None if its statistics file was recorded before
+        """
+        started_at = _timestamp(stats.get("start_time"))
+        ended_at = _timestamp(stats.get("end_time"))
+        if started_at is None:
+            started_at = ended_at or datetime.datetime.now().timestamp()
+        
+        columns = ["processor", "office_id", "started_at", "ended_at", "success", "dry_run"]
+        values = [processor, office_id, started_at, ended_at, int(bool(stats.get("success"))), int(bool(dry_run))]
+        for column, field in SUMMARY_FIELDS:
+            columns.append(column)
+            values.append(int(stats.get(field) or 0))
+        columns += ["error", "stats_path", "stats"]
+        values += [stats.get("error"), stats_path, json.dumps(stats, default=str)]
+        
+        with self.lock:
+            cursor = self.conn.execute(
+                f"INSERT OR IGNORE INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values
+            )
+            self.conn.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+    
+    @staticmethod
+    def _filters(office_id=None, processor=None, start=None, end=None, include_dry_runs=True):
+        clauses, params = [], []
+        if office_id:
+            clauses.append("office_id = ?")
+            params.append(office_id)
+        if processor:
+            clauses.append("processor = ?")
+            params.append(processor)
+        if start is not None:
+            clauses.append("started_at >= ?")
+            params.append(start.timestamp() if isinstance(start, datetime.datetime) else start)
+        if end is not None:
+            clauses.append("started_at < ?")
+            params.append(end.timestamp() if isinstance(end, datetime.datetime) else end)
+        if not include_dry_runs:
+            clauses.append("dry_run = 0")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+    
+    def runs(self, office_id=None, processor=None, start=None, end=None, limit=None, include_stats=False,
+             include_dry_runs=True):
+        """
+        Return runs, newest first.
+        
+        Args:
+            office_id (str): Only runs of this office
+            processor (str): Only runs of this processor
+            start (datetime or float): Only runs started at or after this time
+            end (datetime or float): Only runs started before this time
+            limit (int): Maximum number of runs
+            include_stats (bool): Include the full statistics as "stats"
+            include_dry_runs (bool): Include runs made with --dry-run
+        
+        Returns:
+            list: One dict per run
+        """
+        where, params = self._filters(office_id, processor, start, end, include_dry_runs)
+        columns = "*" if include_stats else "id, processor, office_id, started_at, ended_at, success, dry_run, " + \
+            ", ".join(column for column, _ in SUMMARY_FIELDS) + ", error, stats_path"
+        query = f"SELECT {columns} FROM runs{where} ORDER BY started_at DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        
+        with self.lock:
+            rows = [dict(row) for row in self.conn.execute(query, params)]
+        if include_stats:
+            for row in rows:
+                row["stats"] = json.loads(row["stats"])
+        return rows
+    
+    def summary(self, office_id=None, processor=None, start=None, end=None, include_dry_runs=False):
+        """
+        Return totals per office and processor.
+        
+        Returns:
+            list: One dict per office and processor with run counts and summed statistics
+        """
+        where, params = self._filters(office_id, processor, start, end, include_dry_runs)
+        sums = ", ".join(f"SUM({column}) AS {column}" for column, _ in SUMMARY_FIELDS)
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(
+                f"SELECT office_id, processor, COUNT(*) AS runs, SUM(1 - success) AS failed_runs, "
+                f"MAX(started_at) AS last_run, {sums} FROM runs{where} "
+                f"GROUP BY office_id, processor ORDER BY office_id, processor",
+                params
+            )]
+    
+    def import_stats_files(self, logs_dir="logs"):
+        """
+        Add runs from statistics files written before the history existed.
+        
+        Returns:
+            int: Runs added; files already in the history are skipped
+        """
+        added = 0
+        for root, _, names in os.walk(logs_dir):
+            if os.path.basename(root) != "stats":
+                continue
+            office_id = os.path.basename(os.path.dirname(root))
+            for name in names:
+                processor = next((p for p in ("missed_calls", "accepted_calls") if name.startswith(f"{p}_processing_stats")), None)
+                if processor is None or not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "r") as f:
+                        stats = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if self.record(processor, stats.get("office_id", office_id), stats, path) is not None:
+                    added += 1
+        return added
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_run_history = None
+_run_history_lock = threading.Lock()
+
+def get_run_history():
+    """Return the process-wide RunHistory, or None if the database cannot be opened."""
+    global _run_history
+    with _run_history_lock:
+        if _run_history is None:
+            try:
+                _run_history = RunHistory()
+            except sqlite3.Error as e:
+                logging.getLogger("RunHistory").warning(f"Runs will not be recorded in the run history: {str(e)}")
+                _run_history = False
+        return _run_history or None
+
+def record_run(processor, office_id, stats, stats_path=None, dry_run=False):
+    """
+    Record a finished process_office run; failures are logged, never raised.
+    
+    Returns:
+        int: Row ID of the run, or None if it was not recorded
+    """
+    history = get_run_history()
+    if history is None:
+        return None
+    try:
+        return history.record(processor, office_id, stats, stats_path, dry_run)
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logging.getLogger("RunHistory").warning(f"Could not record {processor} run of {office_id}: {str(e)}")
+        return None
+
+def _format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else ""
+
+def render_html_report(history, office_id=None, processor=None, start=None, end=None, max_runs=500):
+    """
+    Build an HTML report of the runs matching the filters.
+    
+    Args:
+        history (RunHistory): Run history
+        office_id (str): Only runs of this office
+        processor (str): Only runs of this processor
+        start (datetime): Only runs started at or after this time
+        end (datetime): Only runs started before this time
+        max_runs (int): Runs listed individually after the totals
+    
+    Returns:
+        str: HTML document
+    """
+    summary = history.summary(office_id, processor, start, end)
+    runs = history.runs(office_id, processor, start, end, limit=max_runs, include_dry_runs=False)
+    columns = [column for column, _ in SUMMARY_FIELDS]
+    
+    def cell(value):
+        return f"<td>{html.escape(str(value if value is not None else ''))}</td>"
+    
+    def header(names):
+        return "<tr>" + "".join(f"<th>{html.escape(name.replace('_', ' ').title())}</th>" for name in names) + "</tr>"
+    
+    period = f"{_format_time(start.timestamp()) if start else 'first run'} to {_format_time(end.timestamp()) if end else 'now'}"
+    parts = [
+        "<!DOCTYPE html>",
+        "<html><head><meta charset=\"utf-8\"><title>RingCentral-Zoho Processing Report</title>",
+        "<style>body{font-family:Helvetica,Arial,sans-serif;margin:20px}table{border-collapse:collapse;margin-bottom:24px}"
+        "th,td{border:1px solid #ccc;padding:4px 8px;text-align:left}th{background:#f0f0f0}.failed{color:#b00}</style>",
+        "</head><body>",
+        "<h1>RingCentral-Zoho Processing Report</h1>",
+        f"<p>{html.escape(period)}; office: {html.escape(office_id or 'all')}; processor: {html.escape(processor or 'all')}. "
+        f"Generated {html.escape(_format_time(datetime.datetime.now().timestamp()))}.</p>",
+        "<h2>Totals</h2>",
+        "<table>" + header(["office", "processor", "runs", "failed_runs", "last_run"] + columns)
+    ]
+    for row in summary:
+        parts.append("<tr>" + "".join(cell(row[name]) for name in ("office_id", "processor", "runs", "failed_runs"))
+                     + cell(_format_time(row["last_run"])) + "".join(cell(row[column]) for column in columns) + "</tr>")
+    parts.append("</table>")
+    
+    parts.append(f"<h2>Runs</h2><table>{header(['started', 'office', 'processor', 'result', 'duration'] + columns)}")
+    for run in runs:
+        duration = f"{run['ended_at'] - run['started_at']:.0f}s" if run["ended_at"] else ""
+        result = "OK" if run["success"] else f"Failed: {run['error'] or 'unknown error'}"
+        row_class = "" if run["success"] else ' class="failed"'
+        parts.append(f"<tr{row_class}>"
+                     + "".join(cell(value) for value in (_format_time(run["started_at"]), run["office_id"],
+                                                          run["processor"], result, duration))
+                     + "".join(cell(run[column]) for column in columns) + "</tr>")
+    parts.append("</table></body></html>")
+    return "\n".join(parts)
+
+def write_html_report(history, path=None, **filters):
+    """
+    Write an HTML report to a file, by default a new file in logs/reports.
+    
+    Returns:
+        str: Path of the report
+    """
+    if path is None:
+        path = os.path.join("logs", "reports", f"report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(render_html_report(history, **filters))
+    return path
+
+def main():
+    """Import old statistics files or write an HTML report from the command line."""
+    parser = argparse.ArgumentParser(description="RingCentral-Zoho CRM Integration run history")
+    parser.add_argument("--import-logs", metavar="DIR", nargs="?", const="logs",
+                        help="Add runs from statistics files under DIR (default: logs)")
+    parser.add_argument("--office", help="Only runs of this office")
+    parser.add_argument("--processor", choices=["missed_calls", "accepted_calls"], help="Only runs of this processor")
+    parser.add_argument("--days", type=float, default=7, help="Report on runs from this many days back (default: 7)")
+    parser.add_argument("--html", metavar="PATH", nargs="?", const="",
+                        help="Write an HTML report (default: a new file in logs/reports)")
+    args = parser.parse_args()
+    
+    history = RunHistory()
+    if args.import_logs:
+        print(f"Imported {history.import_stats_files(args.import_logs)} runs from {args.import_logs}")
+    if args.html is not None:
+        start = datetime.datetime.now() - datetime.timedelta(days=args.days)
+        path = write_html_report(history, args.html or None, office_id=args.office, processor=args.processor, start=start)
+        print(f"Wrote {path}")
+    if not args.import_logs and args.html is None:
+        for row in history.summary(args.office, args.processor,
+                                   datetime.datetime.now() - datetime.timedelta(days=args.days)):
+            print(json.dumps(row))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Tests for the request limits and raw log streams in common.py."""
+
+import os
+import tempfile
+import unittest
+
+from common import AdaptiveConcurrencyLimit, RetryBudget, NdjsonWriter, read_raw_logs
+
+class AdaptiveConcurrencyLimitTest(unittest.TestCase):
+    def test_additive_increase_then_multiplicative_decrease(self):
+        limit = AdaptiveConcurrencyLimit("zoho.search", initial=4, maximum=16)
+        
+        # One round of healthy responses adds about one slot
+        for _ in range(4):
+            decision, reason, _ = limit.release(limit.acquire(), 200, 0.05)
+            self.assertEqual((decision, reason), ("increase", None))
+        self.assertAlmostEqual(limit.limit, 4.92, places=2)
+        
+        started = limit.acquire()
+        decision, reason, value = limit.release(started, 429, 0.05)
+        self.assertEqual((decision, reason), ("decrease", "throttled"))
+        self.assertAlmostEqual(value, 2.46, places=2)
+    
+    def test_one_cut_per_overload(self):
+        limit = AdaptiveConcurrencyLimit("zoho.search", initial=8)
+        first, second = limit.acquire(), limit.acquire()
+        limit.release(first, 503, 0.05)
+        # Sent before the cut, so its failure does not cut again
+        decision, reason, value = limit.release(second, 503, 0.05)
+        self.assertEqual((decision, reason, value), ("hold", "server_error", 4.0))
+    
+    def test_open_breaker_pins_minimum(self):
+        limit = AdaptiveConcurrencyLimit("zoho.search", initial=8, minimum=1)
+        self.assertEqual(limit.release(limit.acquire(), 200, 0.05, "OPEN")[2], 1.0)
+        self.assertEqual(limit.status()["in_flight"], 0)
+
+class RetryBudgetTest(unittest.TestCase):
+    def test_retries_are_earned_by_requests(self):
+        budget = RetryBudget(ratio=0.5, minimum=2)
+        self.assertEqual([budget.spend() for _ in range(3)], [True, True, False])
+        
+        for _ in range(2):
+            budget.record_request()
+        self.assertEqual([budget.spend() for _ in range(2)], [True, False])
+        self.assertEqual(budget.status()["denied"], 2)
+
+class NdjsonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = 0
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _path(self, extension):
+        self.files += 1
+        return os.path.join(self.tmp.name, f"raw_call_logs_20260101_000000_{self.files}{extension}")
+    
+    def _write(self, compression, records, max_bytes):
+        writer = NdjsonWriter(self._path, compression, max_bytes)
+        for record in records:
+            writer.write(record)
+        writer.close()
+        return writer.paths
+    
+    def test_rotated_files_read_back_in_order(self):
+        # Random payloads, so the compressor flushes output, and the file grows, as records arrive
+        records = [{"id": str(i), "payload": os.urandom(64).hex()} for i in range(400)]
+        for compression in ("none", "gzip"):
+            with self.subTest(compression=compression):
+                paths = self._write(compression, records, 8192)
+                self.assertGreater(len(paths), 1)
+                read = [record for path in paths for record in read_raw_logs(path)]
+                self.assertEqual(read, records)
+    
+    def test_truncated_gzip_yields_complete_records(self):
+        records = [{"id": str(i)} for i in range(500)]
+        path = self._write("gzip", records, 64 * 1024 * 1024)[0]
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:len(data) // 2])
+        
+        with self.assertLogs("LogExporter", "WARNING"):
+            read = list(read_raw_logs(path))
+        self.assertTrue(0 < len(read) < len(records))
+        self.assertEqual(read, records[:len(read)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests for fencing writes to the state stores with lease tokens."""
+
+import os
+import time
+import sqlite3
+import tempfile
+import unittest
+
+from call_queue import DeferredCalls
+from coordination import Lease, LeaseLostError
+
+RESOURCE = "missed_calls:office"
+
+class FencingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "deferred_calls.db")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _store(self, token):
+        lease = Lease(RESOURCE, f"node-{token}", token, time.time() + 60)
+        store = DeferredCalls("missed_calls", "office", self.db_path, lease=lease)
+        self.addCleanup(store.close)
+        return store, lease
+    
+    def _saved_ids(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return {row[0] for row in conn.execute("SELECT call_id FROM deferred_calls")}
+    
+    def test_stale_token_is_refused_after_newer_holder_writes(self):
+        stale, stale_lease = self._store(1)
+        stale.add([{"id": "1"}])
+        
+        current, _ = self._store(2)
+        current.add([{"id": "2"}])
+        
+        with self.assertRaises(LeaseLostError):
+            stale.add([{"id": "3"}])
+        with self.assertRaises(LeaseLostError):
+            stale.remove("2")
+        
+        # The refused writes changed nothing, and the old holder now knows it lost the lease
+        self.assertEqual(self._saved_ids(), {"1", "2"})
+        self.assertTrue(stale_lease.lost.is_set())
+    
+    def test_expired_lease_is_refused_before_writing(self):
+        store, lease = self._store(1)
+        lease.expires_at = time.time() - 1
+        with self.assertRaises(LeaseLostError):
+            store.add([{"id": "1"}])
+        self.assertEqual(self._saved_ids(), set())
+    
+    def test_newer_token_may_write_after_older_one(self):
+        old, _ = self._store(1)
+        old.add([{"id": "1"}])
+        new, _ = self._store(2)
+        new.remove("1")
+        self.assertEqual(self._saved_ids(), set())
+
+if __name__ == "__main__":
+    unittest.main()
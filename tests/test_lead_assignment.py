@@ -0,0 +1,82 @@
+"""Tests for the smooth weighted rotation of lead owners."""
+
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+from lead_assignment import LeadOwnerAllocator, smooth_weighted_cycle
+
+OWNERS = [
+    {"id": "a", "assignment_weight": 3},
+    {"id": "b", "assignment_weight": 1},
+    {"id": "c", "assignment_weight": 1}
+]
+
+class SmoothWeightedCycleTest(unittest.TestCase):
+    def test_cycle_picks_owners_in_proportion_to_weight(self):
+        cycle = smooth_weighted_cycle([5, 2, 1])
+        self.assertEqual(len(cycle), 8)
+        self.assertEqual(Counter(cycle), {0: 5, 1: 2, 2: 1})
+    
+    def test_heavy_owner_is_interleaved(self):
+        cycle = smooth_weighted_cycle([3, 1, 1])
+        # Smooth: the heavy owner never gets three picks in a row, even across the wrap
+        doubled = cycle + cycle
+        self.assertFalse(any(doubled[i:i + 3] == [0, 0, 0] for i in range(len(cycle))))
+    
+    def test_allocator_keeps_proportions_across_cycles(self):
+        allocator = LeadOwnerAllocator("office", OWNERS, persist=False)
+        picks = Counter(owner["id"] for owner in allocator.allocate(50))
+        self.assertEqual(picks, {"a": 30, "b": 10, "c": 10})
+
+class BlockHandBackTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "lead_assignment.db")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _allocator(self, block_size=4):
+        return LeadOwnerAllocator("office", OWNERS, db_path=self.db_path, block_size=block_size)
+    
+    def _ids(self, owners):
+        return [owner["id"] for owner in owners]
+    
+    def test_unused_positions_are_reused_after_close(self):
+        expected = self._ids(LeadOwnerAllocator("office", OWNERS, persist=False).allocate(5))
+        
+        first = self._allocator()
+        picked = self._ids(first.allocate(2))
+        first.close()
+        
+        second = self._allocator()
+        picked += self._ids(second.allocate(3))
+        second.close()
+        
+        # Together the two runs walk the rotation without a gap
+        self.assertEqual(picked, expected)
+    
+    def test_positions_are_kept_when_another_run_reserved_after_them(self):
+        expected = self._ids(LeadOwnerAllocator("office", OWNERS, persist=False).allocate(5))
+        
+        first = self._allocator(block_size=2)
+        second = self._allocator(block_size=2)
+        first_picks = self._ids(first.allocate(1))
+        second_picks = self._ids(second.allocate(1))
+        first.close()
+        second.close()
+        
+        third = self._allocator(block_size=1)
+        third_pick = self._ids(third.allocate(1))
+        third.close()
+        
+        self.assertEqual(first_picks, expected[0:1])
+        self.assertEqual(second_picks, expected[2:3])
+        # The first run's unused position is not handed back over the second run's block,
+        # while the second run, the last to reserve, hands its unused position back
+        self.assertEqual(third_pick, expected[3:4])
+
+if __name__ == "__main__":
+    unittest.main()
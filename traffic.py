@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - API Traffic Record/Replay
+This module captures the HTTP traffic of the RingCentral and Zoho clients,
+including voicemail and recording media, into a compact zip archive, and
+serves an archive back to the clients without touching the network. That
+lets a past window be reprocessed offline, e.g. after a field mapping fix,
+without spending RingCentral quota, and lets recorded production traffic be
+pushed through the pipeline faster than real time for load testing.
+"""
+
+import io
+import json
+import time
+import atexit
+import hashlib
+import logging
+import zipfile
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlsplit, parse_qsl
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Query parameters that depend on when a run starts rather than what it asks for
+VOLATILE_PARAMS = {"dateFrom", "dateTo"}
+
+# Credential query parameters, e.g. of the Zoho token refresh, which are never archived
+SECRET_PARAMS = {"client_id", "client_secret", "refresh_token", "assertion", "code"}
+
+# Token endpoints; only a placeholder token is archived for their responses
+TOKEN_PATHS = ("/oauth/token", "/oauth/v2/token")
+
+# Response headers kept in the archive; everything else is dropped
+KEPT_HEADERS = {
+    "content-type", "retry-after",
+    "x-rate-limit-limit", "x-rate-limit-remaining", "x-rate-limit-window",
+    "x-ratelimit-limit", "x-ratelimit-remaining"
+}
+
+# Token fields replaced before a response body is archived
+SECRET_FIELDS = ("access_token", "refresh_token", "id_token")
+
+_active_traffic = None
+
+def request_key(service, method, url):
+    """
+    Build the key a request is recorded and replayed under.
+    
+    The host and the time window parameters are left out so a recording
+    replays against any server URL and on any later day, and credential
+    parameters are left out so they never reach an archive.
+    """
+    parts = urlsplit(url)
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query)
+        if name not in VOLATILE_PARAMS and name not in SECRET_PARAMS
+    )
+    return json.dumps([service, method.upper(), parts.path, query])
+
+def _is_token_exchange(url):
+    return urlsplit(url).path.endswith(TOKEN_PATHS)
+
+def _redact(content, content_type, url=None):
+    if url and _is_token_exchange(url):
+        # The token exchange body is never stored; clients only need a token and its lifetime
+        expires_in = 3600
+        try:
+            expires_in = int(json.loads(content).get("expires_in", expires_in))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        return json.dumps({"access_token": "replayed", "token_type": "bearer", "expires_in": expires_in}).encode("utf-8")
+    if "json" not in (content_type or "") or not content:
+        return content
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(payload, dict) or not any(field in payload for field in SECRET_FIELDS):
+        return content
+    for field in SECRET_FIELDS:
+        if field in payload:
+            payload[field] = "replayed"
+    return json.dumps(payload).encode("utf-8")
+
+class TrafficRecorder:
+    """Writes request/response pairs to a zip archive, storing each distinct body once."""
+    
+    def __init__(self, path, services=("ringcentral", "zoho")):
+        """
+        Initialize the recorder.
+        
+        Args:
+            path (str): Archive to create; an existing file is replaced
+            services (iterable): Services whose traffic is recorded
+        """
+        self.path = path
+        self.services = set(services)
+        self.logger = logging.getLogger("TrafficRecorder")
+        self.lock = threading.Lock()
+        self.archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        self.index = io.StringIO()
+        self.bodies = set()
+        self.exchanges = 0
+        self.started = time.monotonic()
+    
+    def adapter(self, service):
+        return RecordingAdapter(self, service)
+    
+    def record(self, service, request, response, elapsed):
+        content_type = response.headers.get("Content-Type", "")
+        body = _redact(response.content, content_type, request.url)
+        digest = hashlib.sha256(body).hexdigest() if body else None
+        entry = {
+            "key": request_key(service, request.method, request.url),
+            "offset": round(time.monotonic() - self.started - elapsed, 6),
+            "elapsed": round(elapsed, 6),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {name: value for name, value in response.headers.items() if name.lower() in KEPT_HEADERS},
+            "body": digest
+        }
+        
+        with self.lock:
+            if self.archive is None:
+                return
+            if digest and digest not in self.bodies:
+                self.archive.writestr(f"bodies/{digest}", body)
+                self.bodies.add(digest)
+            self.index.write(json.dumps(entry) + "\n")
+            self.exchanges += 1
+    
+    def close(self):
+        with self.lock:
+            if self.archive is None:
+                return
+            self.archive.writestr("index.ndjson", self.index.getvalue())
+            self.archive.close()
+            self.archive = None
+        self.logger.info(f"Recorded {self.exchanges} API exchanges ({len(self.bodies)} distinct bodies) to {self.path}")
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that sends requests normally and records what came back."""
+    
+    def __init__(self, recorder, service):
+        super().__init__()
+        self.recorder = recorder
+        self.service = service
+    
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        # Reading the content here keeps it available to the caller as usual
+        response.content
+        self.recorder.record(self.service, request, response, time.monotonic() - started)
+        return response
+
+class TrafficReplayer:
+    """Serves archived responses in the order they were recorded."""
+    
+    def __init__(self, path, services=("ringcentral", "zoho"), speed=0):
+        """
+        Initialize the replayer.
+        
+        Args:
+            path (str): Archive written by TrafficRecorder
+            services (iterable): Services answered from the archive; others stay live
+            speed (float): 0 replays at full speed; otherwise each response takes its
+                recorded latency divided by this factor, e.g. 4 for four times real time
+        """
+        self.path = path
+        self.services = set(services)
+        self.speed = speed
+        self.logger = logging.getLogger("TrafficReplayer")
+        self.lock = threading.Lock()
+        self.archive = zipfile.ZipFile(path, "r")
+        self.queues = defaultdict(deque)
+        self.last = {}
+        self.served = 0
+        self.missed = 0
+        
+        for line in self.archive.read("index.ndjson").decode("utf-8").splitlines():
+            entry = json.loads(line)
+            self.queues[entry["key"]].append(entry)
+    
+    def adapter(self, service):
+        return ReplayAdapter(self, service)
+    
+    def next_entry(self, key):
+        # Once a key's recorded responses run out the last one is repeated,
+        # so replays that make more requests than the recording still proceed
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                self.last[key] = queue.popleft()
+            entry = self.last.get(key)
+            if entry is None:
+                self.missed += 1
+            else:
+                self.served += 1
+            return entry
+    
+    def body(self, digest):
+        if not digest:
+            return b""
+        with self.lock:
+            return self.archive.read(f"bodies/{digest}")
+    
+    def close(self):
+        with self.lock:
+            if self.archive is None:
+                return
+            self.archive.close()
+            self.archive = None
+        self.logger.info(f"Replayed {self.served} API exchanges from {self.path}, {self.missed} requests had no recording")
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter that answers requests from a TrafficReplayer instead of the network."""
+    
+    def __init__(self, replayer, service):
+        super().__init__()
+        self.replayer = replayer
+        self.service = service
+    
+    def send(self, request, **kwargs):
+        key = request_key(self.service, request.method, request.url)
+        entry = self.replayer.next_entry(key)
+        if entry is None:
+            # The key rather than the URL, which may carry credentials
+            raise requests.exceptions.ConnectionError(f"No recorded response for {key}", request=request)
+        
+        if self.replayer.speed:
+            time.sleep(entry["elapsed"] / self.replayer.speed)
+        
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = self.replayer.body(entry["body"])
+        response.url = request.url
+        response.request = request
+        response.encoding = None
+        return response
+    
+    def close(self):
+        pass
+
+def configure_traffic(record_path=None, replay_path=None, replay_services=("ringcentral", "zoho"), speed=0):
+    """
+    Turn on recording or replay for every API client created afterwards.
+    
+    Args:
+        record_path (str): Archive to record to
+        replay_path (str): Archive to replay from
+        replay_services (iterable): Services answered from the archive; others stay live
+        speed (float): Replay speed factor, 0 for full speed
+    
+    Returns:
+        TrafficRecorder or TrafficReplayer: The active recorder or replayer, or None
+    """
+    global _active_traffic
+    
+    if record_path and replay_path:
+        raise ValueError("Recording and replaying in the same run is not supported")
+    
+    if record_path:
+        traffic = TrafficRecorder(record_path)
+    elif replay_path:
+        traffic = TrafficReplayer(replay_path, [service.lower() for service in replay_services], speed)
+    else:
+        return None
+    
+    _active_traffic = traffic
+    atexit.register(traffic.close)
+    return traffic
+
+def attach_traffic(client):
+    """Mount the active recorder or replayer on an API client's session, if one is configured."""
+    traffic = _active_traffic
+    service = client.service_name.lower()
+    if traffic is None or service not in traffic.services:
+        return
+    
+    adapter = traffic.adapter(service)
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
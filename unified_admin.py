@@ -8,7 +8,6 @@ This script provides a GUI to manage the RingCentral-Zoho integration.
 
 import os
 import sys
-import json
 import logging
 import tkinter as tk
 from tkinter import ttk
@@ -18,6 +17,9 @@ import datetime
 import threading
 import queue
 from secure_credentials import SecureCredentials
+from common import get_config_snapshot
+from job_runner import JobRunner
+from run_history import RunHistory, write_html_report
 
 # Try to import ttkbootstrap for better styling
 try:
@@ -47,45 +49,101 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Streamed output is drawn at most this often, however fast lines arrive
+OUTPUT_FRAME_MS = 100
+# Lines kept in the output pane; older lines are trimmed from the top
+OUTPUT_MAX_LINES = 5000
+
+class OutputView:
+    """Bounded view of streamed output in a Text widget, appended to in batches."""
+    
+    def __init__(self, text_widget, max_lines=OUTPUT_MAX_LINES):
+        self.text_widget = text_widget
+        self.max_lines = max_lines
+    
+    def clear(self, header=""):
+        self.text_widget.delete(1.0, tk.END)
+        if header:
+            self.text_widget.insert(tk.END, header)
+    
+    def append(self, lines):
+        """
+        Insert a batch of lines with one widget update.
+        
+        Args:
+            lines (list): Lines with or without a trailing newline
+        """
+        if not lines:
+            return
+        
+        # Lines that would be trimmed straight away are never inserted
+        lines = lines[-self.max_lines:]
+        follow = self.text_widget.yview()[1] >= 0.999
+        self.text_widget.insert(tk.END, "".join(line if line.endswith("\n") else line + "\n" for line in lines))
+        
+        excess = int(self.text_widget.index("end-1c").split(".")[0]) - self.max_lines
+        if excess > 0:
+            self.text_widget.delete("1.0", f"{excess + 1}.0")
+        
+        # Only scroll along when the user has not scrolled up to read earlier output
+        if follow:
+            self.text_widget.see(tk.END)
+
 class ProcessOutputReader:
     """Class to read output from a subprocess in a separate thread."""
     
-    def __init__(self, process, text_widget):
+    def __init__(self, process, output_view, spill_path=None):
+        """
+        Start reading a process's output.
+        
+        Args:
+            process (subprocess.Popen): Process with stdout piped
+            output_view (OutputView): Where the output is shown
+            spill_path (str): Optional file that receives the full output, including trimmed lines
+        """
         self.process = process
-        self.text_widget = text_widget
-        self.queue = queue.Queue()
+        self.output_view = output_view
+        self.spill_path = spill_path
+        self.queue = queue.SimpleQueue()
         self.running = True
         self.thread = threading.Thread(target=self._read_output)
         self.thread.daemon = True
         self.thread.start()
-        self.text_widget.after(100, self._update_text)
+        self.output_view.text_widget.after(OUTPUT_FRAME_MS, self._update_text)
     
     def _read_output(self):
-        while self.running:
-            if self.process.poll() is not None:
-                self.running = False
-                break
-            try:
-                line = self.process.stdout.readline()
-                if line:
-                    self.queue.put(line.decode('utf-8', errors='replace'))
-            except:
-                self.running = False
-                break
+        spill = None
+        try:
+            if self.spill_path:
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                spill = open(self.spill_path, "wb")
+            # readline blocks until a line arrives and returns b"" once the process closes its output
+            for line in iter(self.process.stdout.readline, b""):
+                if spill:
+                    spill.write(line)
+                self.queue.put(line.decode('utf-8', errors='replace'))
+        except (OSError, ValueError) as e:
+            self.queue.put(f"Error reading output: {str(e)}\n")
+        finally:
+            if spill:
+                spill.close()
+            self.process.wait()
+            self.running = False
     
     def _update_text(self):
+        finished = not self.running
+        lines = []
         try:
             while True:
-                line = self.queue.get_nowait()
-                self.text_widget.insert(tk.END, line)
-                self.text_widget.see(tk.END)
-                self.queue.task_done()
+                lines.append(self.queue.get_nowait())
         except queue.Empty:
-            if self.running:
-                self.text_widget.after(100, self._update_text)
-            else:
-                self.text_widget.insert(tk.END, "\n--- Process completed ---\n")
-                self.text_widget.see(tk.END)
+            pass
+        self.output_view.append(lines)
+        
+        if not finished:
+            self.output_view.text_widget.after(OUTPUT_FRAME_MS, self._update_text)
+        else:
+            self.output_view.append(["", "--- Process completed ---"])
 
 class UnifiedAdmin:
     """Main admin interface class."""
@@ -95,6 +153,12 @@ class UnifiedAdmin:
         self.root.title("RingCentral-Zoho Integration Admin")
         self.root.geometry("900x600")
         self.current_process = None
+        # Processing runs in this process on warm shared clients; setup scripts still run as subprocesses
+        self.job_runner = JobRunner(max_workers=2)
+        self.shown_job = (None, 0)  # (job ID, messages shown) in the output pane
+        self.run_history = None
+        self.report_runs = {}  # tree item -> run
+        self.finished_jobs = set()
         
         # Set icon if available
         try:
@@ -111,6 +175,10 @@ class UnifiedAdmin:
         self._create_layout()
         self._check_credentials()
         self._load_offices()
+        self._refresh_reports()
+        
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.root.after(OUTPUT_FRAME_MS * 2, self._refresh_jobs)
     
     def _create_variables(self):
         """Initialize UI variables."""
@@ -122,6 +190,10 @@ class UnifiedAdmin:
         self.process_missed = tk.BooleanVar(value=True)
         self.send_email = tk.BooleanVar(value=True)
         self.log_level = tk.StringVar(value="INFO")
+        self.spill_output = tk.BooleanVar(value=False)
+        self.report_office = tk.StringVar(value="All")
+        self.report_processor = tk.StringVar(value="All")
+        self.report_days = tk.IntVar(value=7)
     
     def _create_widgets(self):
         """Create UI widgets."""
@@ -180,11 +252,33 @@ class UnifiedAdmin:
         self.email_check = ttk.Checkbutton(self.call_types_frame, text="Send email report", variable=self.send_email)
         
         self.run_btn = ttk.Button(self.proc_config_frame, text="Run Processing", command=self._run_processing)
+        self.run_all_btn = ttk.Button(self.proc_config_frame, text="Run All Offices", command=self._run_all_offices)
+        
+        self.jobs_frame = ttk.LabelFrame(self.processing_frame, text="Jobs")
+        self.jobs_tree = ttk.Treeview(
+            self.jobs_frame,
+            columns=("office", "processors", "status", "elapsed", "calls", "message"),
+            show="headings",
+            height=5,
+            selectmode="browse"
+        )
+        for column, heading, width in (
+            ("office", "Office", 100), ("processors", "Processors", 160), ("status", "Status", 120),
+            ("elapsed", "Elapsed", 70), ("calls", "Calls", 60), ("message", "Latest Message", 360)
+        ):
+            self.jobs_tree.heading(column, text=heading)
+            self.jobs_tree.column(column, width=width, stretch=(column == "message"))
+        self.jobs_tree.bind("<<TreeviewSelect>>", lambda event: self._show_selected_job())
+        self.cancel_job_btn = ttk.Button(self.jobs_frame, text="Cancel Job", command=self._cancel_selected_job)
+        self.clear_jobs_btn = ttk.Button(self.jobs_frame, text="Clear Finished", command=self._clear_finished_jobs)
         
         self.output_frame = ttk.LabelFrame(self.processing_frame, text="Processing Output")
         self.output_text = tk.Text(self.output_frame, height=15, wrap=tk.WORD)
         self.output_scrollbar = ttk.Scrollbar(self.output_frame, orient=tk.VERTICAL, command=self.output_text.yview)
         self.output_text.configure(yscrollcommand=self.output_scrollbar.set)
+        self.output_view = OutputView(self.output_text)
+        self.spill_check = ttk.Checkbutton(self.proc_config_frame, text="Save full output to logs/output",
+                                           variable=self.spill_output)
         
         # Configuration widgets
         self.config_title = ttk.Label(self.config_frame, text="Configuration Management", font=("Helvetica", 16))
@@ -210,13 +304,40 @@ class UnifiedAdmin:
         # Reports widgets
         self.reports_title = ttk.Label(self.reports_frame, text="Processing Reports", font=("Helvetica", 16))
         
-        self.report_list_frame = ttk.LabelFrame(self.reports_frame, text="Available Reports")
-        self.report_listbox = tk.Listbox(self.report_list_frame, height=10)
-        self.report_scrollbar = ttk.Scrollbar(self.report_list_frame, orient=tk.VERTICAL, command=self.report_listbox.yview)
-        self.report_listbox.configure(yscrollcommand=self.report_scrollbar.set)
-        
-        self.report_view_btn = ttk.Button(self.report_list_frame, text="View Report", command=self._view_report)
-        self.report_refresh_btn = ttk.Button(self.report_list_frame, text="Refresh List", command=self._refresh_reports)
+        self.report_filter_frame = ttk.LabelFrame(self.reports_frame, text="Filter")
+        self.report_office_label = ttk.Label(self.report_filter_frame, text="Office:")
+        self.report_office_combo = ttk.Combobox(self.report_filter_frame, textvariable=self.report_office, width=15,
+                                                values=["All"], state="readonly")
+        self.report_processor_label = ttk.Label(self.report_filter_frame, text="Processor:")
+        self.report_processor_combo = ttk.Combobox(self.report_filter_frame, textvariable=self.report_processor, width=15,
+                                                   values=["All", "missed_calls", "accepted_calls"], state="readonly")
+        self.report_days_label = ttk.Label(self.report_filter_frame, text="Days back:")
+        self.report_days_spin = ttk.Spinbox(self.report_filter_frame, from_=1, to=365, width=5, textvariable=self.report_days)
+        
+        # Runs come from the run history database, newest first
+        self.report_list_frame = ttk.LabelFrame(self.reports_frame, text="Processing Runs")
+        self.report_tree = ttk.Treeview(
+            self.report_list_frame,
+            columns=("started", "office", "processor", "result", "calls", "created", "updated", "errors", "duration"),
+            show="headings",
+            height=10,
+            selectmode="browse"
+        )
+        for column, heading, width in (
+            ("started", "Started", 130), ("office", "Office", 100), ("processor", "Processor", 110),
+            ("result", "Result", 200), ("calls", "Calls", 60), ("created", "Created", 60),
+            ("updated", "Updated", 60), ("errors", "Errors", 60), ("duration", "Duration", 70)
+        ):
+            self.report_tree.heading(column, text=heading)
+            self.report_tree.column(column, width=width, stretch=(column == "result"))
+        self.report_scrollbar = ttk.Scrollbar(self.report_list_frame, orient=tk.VERTICAL, command=self.report_tree.yview)
+        self.report_tree.configure(yscrollcommand=self.report_scrollbar.set)
+        self.report_totals = ttk.Label(self.reports_frame, text="")
+        
+        self.report_buttons_frame = ttk.Frame(self.reports_frame)
+        self.report_refresh_btn = ttk.Button(self.report_buttons_frame, text="Refresh", command=self._refresh_reports)
+        self.report_view_btn = ttk.Button(self.report_buttons_frame, text="Generate HTML Report", command=self._view_report)
+        self.report_stats_btn = ttk.Button(self.report_buttons_frame, text="Open Run Statistics", command=self._open_run_stats)
     
     def _create_layout(self):
         """Create UI layout."""
@@ -251,13 +372,20 @@ class UnifiedAdmin:
         
         self.dry_run_check.grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
         self.debug_check.grid(row=3, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        self.spill_check.grid(row=4, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
         
-        self.call_types_frame.grid(row=4, column=0, columnspan=2, sticky=tk.W+tk.E, padx=5, pady=5)
+        self.call_types_frame.grid(row=5, column=0, columnspan=2, sticky=tk.W+tk.E, padx=5, pady=5)
         self.accepted_check.pack(anchor=tk.W, padx=5, pady=2)
         self.missed_check.pack(anchor=tk.W, padx=5, pady=2)
         self.email_check.pack(anchor=tk.W, padx=5, pady=2)
         
-        self.run_btn.grid(row=5, column=0, columnspan=2, padx=5, pady=10)
+        self.run_btn.grid(row=6, column=0, padx=5, pady=10)
+        self.run_all_btn.grid(row=6, column=1, padx=5, pady=10)
+        
+        self.jobs_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.jobs_tree.pack(fill=tk.X, padx=5, pady=5)
+        self.cancel_job_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        self.clear_jobs_btn.pack(side=tk.LEFT, padx=5, pady=5)
         
         self.output_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         self.output_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -270,12 +398,23 @@ class UnifiedAdmin:
         # Reports layout
         self.reports_title.pack(pady=10)
         
+        self.report_filter_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.report_office_label.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_office_combo.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_processor_label.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_processor_combo.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_days_label.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_days_spin.pack(side=tk.LEFT, padx=5, pady=5)
+        
         self.report_list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         self.report_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.report_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.report_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.report_totals.pack(anchor=tk.W, padx=10)
         
-        self.report_view_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_buttons_frame.pack(fill=tk.X, padx=10, pady=5)
         self.report_refresh_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_view_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        self.report_stats_btn.pack(side=tk.LEFT, padx=5, pady=5)
     
     def _check_credentials(self):
         """Check if credentials are configured and valid."""
@@ -300,46 +439,22 @@ class UnifiedAdmin:
     def _load_offices(self):
         """Load office list from configuration."""
         try:
-            if os.path.exists("data/offices.json"):
-                with open("data/offices.json", "r") as f:
-                    offices_data = json.load(f)
-                    offices = [
-                        {"id": office_id, "name": office_data.get("name", office_id), "processing_order": office_data.get("processing_order", 999)}
-                        for office_id, office_data in offices_data.get("offices", {}).items()
-                    ]
-                    
-                    # Sort by processing order
-                    offices.sort(key=lambda x: x["processing_order"])
-                    
-                    # Populate combobox
-                    self.office_combo["values"] = [o["id"] for o in offices]
-                    
-                    if offices:
-                        self.office_combo.current(0)
-            elif os.path.exists("sorted/data/offices.json"):
-                with open("sorted/data/offices.json", "r") as f:
-                    offices_data = json.load(f)
-                    offices = [
-                        {"id": office_id, "name": office_data.get("name", office_id), "processing_order": office_data.get("processing_order", 999)}
-                        for office_id, office_data in offices_data.get("offices", {}).items()
-                    ]
-                    
-                    # Sort by processing order
-                    offices.sort(key=lambda x: x["processing_order"])
-                    
-                    # Populate combobox
-                    self.office_combo["values"] = [o["id"] for o in offices]
-                    
-                    if offices:
-                        self.office_combo.current(0)
-            else:
-                # No offices.json, check if we have single company configuration
-                if os.path.exists("data/extensions.json") and os.path.exists("data/lead_owners.json"):
-                    # Single company mode
-                    self.office_combo["values"] = ["singlecompany"]
-                    self.office_combo.current(0)
-                else:
-                    messagebox.showwarning("Configuration Missing", "No office configuration found. Please run setup_integration.bat first.")
+            offices = sorted(get_config_snapshot().offices, key=lambda x: x.get("processing_order", 999))
+            office_ids = [o["id"] for o in offices]
+            
+            # Without offices.json only a complete single company configuration can run
+            if office_ids == ["singlecompany"] and not (
+                os.path.exists("data/extensions.json") and os.path.exists("data/lead_owners.json")
+            ):
+                messagebox.showwarning("Configuration Missing", "No office configuration found. Please run setup_integration.bat first.")
+                return
+            
+            # Populate comboboxes
+            self.office_combo["values"] = office_ids
+            self.report_office_combo["values"] = ["All"] + office_ids
+            
+            if offices:
+                self.office_combo.current(0)
         except Exception as e:
             logger.error(f"Error loading offices: {str(e)}")
             messagebox.showerror("Error", f"Failed to load office configuration: {str(e)}")
@@ -358,26 +473,7 @@ class UnifiedAdmin:
             messagebox.showerror("Error", "Please select an office")
             return
         
-        if os.path.exists("run_accepted_calls.bat"):
-            cmd = f"run_accepted_calls.bat --office {office}"
-            if self.dry_run.get():
-                cmd += " --dry-run"
-            if self.debug_mode.get():
-                cmd += " --debug"
-            if self.hours_back.get() != 24:
-                cmd += f" --hours-back {self.hours_back.get()}"
-            
-            self._run_command(cmd)
-        else:
-            args = ["accepted_calls.py", "--office", office]
-            if self.dry_run.get():
-                args.append("--dry-run")
-            if self.debug_mode.get():
-                args.append("--debug")
-            if self.hours_back.get() != 24:
-                args.extend(["--hours-back", str(self.hours_back.get())])
-            
-            self._run_script(*args)
+        self._submit_jobs([office], ["accepted_calls"])
     
     def _run_missed_calls(self):
         """Run missed calls processing."""
@@ -386,26 +482,17 @@ class UnifiedAdmin:
             messagebox.showerror("Error", "Please select an office")
             return
         
-        if os.path.exists("run_missed_calls.bat"):
-            cmd = f"run_missed_calls.bat --office {office}"
-            if self.dry_run.get():
-                cmd += " --dry-run"
-            if self.debug_mode.get():
-                cmd += " --debug"
-            if self.hours_back.get() != 24:
-                cmd += f" --hours-back {self.hours_back.get()}"
-            
-            self._run_command(cmd)
-        else:
-            args = ["missed_calls.py", "--office", office]
-            if self.dry_run.get():
-                args.append("--dry-run")
-            if self.debug_mode.get():
-                args.append("--debug")
-            if self.hours_back.get() != 24:
-                args.extend(["--hours-back", str(self.hours_back.get())])
-            
-            self._run_script(*args)
+        self._submit_jobs([office], ["missed_calls"])
+    
+    def _selected_processors(self):
+        processors = []
+        if self.process_missed.get():
+            processors.append("missed_calls")
+        if self.process_accepted.get():
+            processors.append("accepted_calls")
+        if not processors:
+            messagebox.showerror("Error", "Please select at least one call type")
+        return processors
     
     def _run_processing(self):
         """Run full processing with selected options."""
@@ -414,34 +501,158 @@ class UnifiedAdmin:
             messagebox.showerror("Error", "Please select an office")
             return
         
-        # Determine single or multi-company mode
-        if office == "singlecompany" and os.path.exists("run_single_company_all_calls_with_report.bat"):
-            # Single company mode
-            cmd = "run_single_company_all_calls_with_report.bat"
-            if self.dry_run.get():
-                cmd += " --dry-run"
-            if self.debug_mode.get():
-                cmd += " --debug"
-            if self.hours_back.get() != 24:
-                cmd += f" --hours-back {self.hours_back.get()}"
+        processors = self._selected_processors()
+        if processors:
+            self._submit_jobs([office], processors)
+        
+        if self.send_email.get():
+            # TODO: Implement email report generation
+            pass
+    
+    def _run_all_offices(self):
+        """Queue a job for every configured office; up to two offices run at the same time."""
+        offices = list(self.office_combo["values"])
+        if not offices:
+            messagebox.showerror("Error", "No offices configured")
+            return
+        
+        processors = self._selected_processors()
+        if processors:
+            self._submit_jobs(offices, processors)
+    
+    def _submit_jobs(self, offices, processors):
+        """Queue one job per office with the selected options."""
+        try:
+            jobs = [
+                self.job_runner.submit(
+                    office,
+                    processors,
+                    hours_back=self.hours_back.get(),
+                    dry_run=self.dry_run.get(),
+                    debug=self.debug_mode.get(),
+                    log_path=self._output_spill_path(f"job_{office}")
+                )
+                for office in offices
+            ]
+        except Exception as e:
+            logger.error(f"Error queueing jobs: {str(e)}")
+            messagebox.showerror("Error", f"Failed to queue processing: {str(e)}")
+            return
+        
+        self.status_bar.config(text=f"Queued {len(jobs)} job(s): {', '.join(processors)}")
+        self._refresh_jobs(reschedule=False)
+        # Follow the first new job in the output pane
+        self.jobs_tree.selection_set(str(jobs[0].id))
+    
+    def _spill_path(self, name):
+        """Return a new file under logs/output for the full output of a run."""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        return os.path.join("logs", "output", f"{name}_{timestamp}.log")
+    
+    def _refresh_jobs(self, reschedule=True):
+        """Update the jobs list and the selected job's output."""
+        try:
+            for job in self.job_runner.list_jobs():
+                status = job.status
+                if job.current_processor:
+                    status = f"running {job.current_processor}"
+                values = (
+                    job.office_id,
+                    ", ".join(job.processors),
+                    status if not job.error else f"{status}: {job.error}",
+                    f"{job.elapsed():.0f}s",
+                    job.calls_processed() if job.started_at is not None else "",
+                    (job.last_message().split(" - ", 3)[-1].splitlines() or [""])[0]
+                )
+                item = str(job.id)
+                if self.jobs_tree.exists(item):
+                    self.jobs_tree.item(item, values=values)
+                else:
+                    self.jobs_tree.insert("", tk.END, iid=item, values=values)
             
-            self._run_command(cmd)
-        else:
-            # Multi-company mode, run scripts sequentially
-            if self.process_missed.get():
-                self._run_missed_calls()
+            self._show_selected_job()
             
-            if self.process_accepted.get():
-                self._run_accepted_calls()
+            # Finished jobs have recorded their runs in the history
+            finished = {job.id for job in self.job_runner.list_jobs() if job.done}
+            if finished - self.finished_jobs:
+                self._refresh_reports()
+            self.finished_jobs = finished
             
-            if self.send_email.get():
-                # TODO: Implement email report generation
-                pass
+            active = len(self.job_runner.active_jobs())
+            if active:
+                self.status_bar.config(text=f"{active} job(s) queued or running")
+        except Exception as e:
+            logger.error(f"Error refreshing jobs: {str(e)}")
+        
+        if reschedule:
+            self.root.after(OUTPUT_FRAME_MS * 2, self._refresh_jobs)
+    
+    def _show_selected_job(self):
+        """Show the selected job's log messages in the output pane, appending only new ones."""
+        selected = self.jobs_tree.selection()
+        job = self.job_runner.get(int(selected[0])) if selected else None
+        if job is None:
+            return
+        
+        shown_id, shown_count = self.shown_job
+        if shown_id != job.id:
+            header = f"Job {job.id}: {', '.join(job.processors)} for office {job.office_id}\n"
+            if job.log_path:
+                header += f"Full output: {job.log_path}\n"
+            self.output_view.clear(header + "\n")
+            shown_count = 0
+        
+        # The job keeps its latest messages only, so a long-running job may have dropped some
+        message_count = job.message_count
+        messages = list(job.messages)
+        new = min(message_count - shown_count, len(messages))
+        if new > 0:
+            self.output_view.append(messages[-new:])
+        self.shown_job = (job.id, message_count)
+    
+    def _output_spill_path(self, name):
+        return self._spill_path(name) if self.spill_output.get() else None
+    
+    def _detach_job_output(self):
+        """Stop showing job output so a script's output has the pane to itself."""
+        self.jobs_tree.selection_remove(*self.jobs_tree.selection())
+        self.shown_job = (None, 0)
+    
+    def _cancel_selected_job(self):
+        """Cancel the selected job if it has not started yet."""
+        selected = self.jobs_tree.selection()
+        if not selected:
+            messagebox.showinfo("No Selection", "Please select a job to cancel")
+            return
+        
+        if not self.job_runner.cancel(int(selected[0])):
+            messagebox.showinfo("Job Running", "Only queued jobs can be cancelled; running jobs finish their office")
+        self._refresh_jobs(reschedule=False)
+    
+    def _clear_finished_jobs(self):
+        """Remove finished jobs from the list."""
+        self.job_runner.clear_finished()
+        known = {str(job.id) for job in self.job_runner.list_jobs()}
+        for item in self.jobs_tree.get_children():
+            if item not in known:
+                self.jobs_tree.delete(item)
+    
+    def _on_close(self):
+        """Close the window, letting running jobs finish their office first."""
+        active = self.job_runner.active_jobs()
+        if active and not messagebox.askyesno(
+            "Jobs Running",
+            f"{len(active)} job(s) are queued or running. Queued jobs will be cancelled and running jobs "
+            "will finish before the program exits. Close anyway?"
+        ):
+            return
+        self.job_runner.shutdown(wait=False)
+        self.root.destroy()
     
     def _run_command(self, cmd):
         """Run a command in a new process and capture output."""
-        self.output_text.delete(1.0, tk.END)
-        self.output_text.insert(tk.END, f"Running command: {cmd}\n\n")
+        self._detach_job_output()
+        self.output_view.clear(f"Running command: {cmd}\n\n")
         self.status_bar.config(text=f"Running: {cmd}")
         
         try:
@@ -465,18 +676,18 @@ class UnifiedAdmin:
                 )
             
             # Start reading output
-            ProcessOutputReader(self.current_process, self.output_text)
-            
+            ProcessOutputReader(self.current_process, self.output_view, self._output_spill_path("command"))
+        
         except Exception as e:
             logger.error(f"Error running command: {str(e)}")
-            self.output_text.insert(tk.END, f"Error: {str(e)}")
+            self.output_view.append([f"Error: {str(e)}"])
             self.status_bar.config(text="Error running command")
     
     def _run_script(self, script_name, *args):
         """Run a Python script with given arguments."""
         cmd = [sys.executable, script_name] + list(args)
-        self.output_text.delete(1.0, tk.END)
-        self.output_text.insert(tk.END, f"Running: {' '.join(cmd)}\n\n")
+        self._detach_job_output()
+        self.output_view.clear(f"Running: {' '.join(cmd)}\n\n")
         self.status_bar.config(text=f"Running: {script_name}")
         
         try:
@@ -489,40 +700,79 @@ class UnifiedAdmin:
             )
             
             # Start reading output
-            ProcessOutputReader(self.current_process, self.output_text)
-            
+            ProcessOutputReader(self.current_process, self.output_view,
+                                self._output_spill_path(os.path.splitext(os.path.basename(script_name))[0]))
+        
         except Exception as e:
             logger.error(f"Error running script: {str(e)}")
-            self.output_text.insert(tk.END, f"Error: {str(e)}")
+            self.output_view.append([f"Error: {str(e)}"])
             self.status_bar.config(text="Error running script")
     
+    def _report_filters(self):
+        """Return the Reports tab filters as RunHistory query arguments."""
+        office = self.report_office.get()
+        processor = self.report_processor.get()
+        try:
+            days = max(1, int(self.report_days.get()))
+        except (tk.TclError, ValueError):
+            days = 7
+        return {
+            "office_id": None if office in ("", "All") else office,
+            "processor": None if processor in ("", "All") else processor,
+            "start": datetime.datetime.now() - datetime.timedelta(days=days)
+        }
+    
+    def _run_history(self):
+        if self.run_history is None:
+            self.run_history = RunHistory()
+        return self.run_history
+    
     def _refresh_reports(self):
-        """Refresh the list of available reports."""
-        self.report_listbox.delete(0, tk.END)
+        """Refresh the list of runs from the run history."""
+        self.report_tree.delete(*self.report_tree.get_children())
+        self.report_runs = {}
         
-        reports_dir = "logs/reports"
-        if not os.path.exists(reports_dir):
+        try:
+            history = self._run_history()
+            filters = self._report_filters()
+            runs = history.runs(limit=1000, **filters)
+            totals = history.summary(**filters)
+        except Exception as e:
+            logger.error(f"Error loading run history: {str(e)}")
+            messagebox.showerror("Error", f"Failed to load run history: {str(e)}")
             return
         
-        # List HTML reports
-        reports = [f for f in os.listdir(reports_dir) if f.endswith(".html")]
-        reports.sort(reverse=True)  # Most recent first
-        
-        for report in reports:
-            self.report_listbox.insert(tk.END, report)
+        for run in runs:
+            duration = f"{run['ended_at'] - run['started_at']:.0f}s" if run["ended_at"] else ""
+            result = "OK" if run["success"] else f"Failed: {run['error'] or 'unknown error'}"
+            if run["dry_run"]:
+                result += " (dry run)"
+            item = self.report_tree.insert("", tk.END, values=(
+                datetime.datetime.fromtimestamp(run["started_at"]).strftime("%Y-%m-%d %H:%M"),
+                run["office_id"],
+                run["processor"],
+                result,
+                run["calls_processed"],
+                run["leads_created"],
+                run["leads_updated"],
+                run["errors"],
+                duration
+            ))
+            self.report_runs[item] = run
+        
+        self.report_totals.config(text=(
+            f"{sum(row['runs'] for row in totals)} runs, {sum(row['failed_runs'] for row in totals)} failed, "
+            f"{sum(row['calls_processed'] for row in totals)} calls, {sum(row['leads_created'] for row in totals)} leads created "
+            "(dry runs excluded)"
+        ))
     
     def _view_report(self):
-        """View the selected report."""
-        selected = self.report_listbox.curselection()
-        if not selected:
-            messagebox.showinfo("No Selection", "Please select a report to view")
-            return
-        
-        report_name = self.report_listbox.get(selected[0])
-        report_path = os.path.join("logs/reports", report_name)
-        
-        if not os.path.exists(report_path):
-            messagebox.showerror("Error", f"Report file not found: {report_path}")
+        """Generate an HTML report of the filtered runs and open it."""
+        try:
+            report_path = write_html_report(self._run_history(), **self._report_filters())
+        except Exception as e:
+            logger.error(f"Error generating report: {str(e)}")
+            messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
             return
         
         # Open the report in the default browser
@@ -532,6 +782,25 @@ class UnifiedAdmin:
         except Exception as e:
             logger.error(f"Error opening report: {str(e)}")
             messagebox.showerror("Error", f"Failed to open report: {str(e)}")
+    
+    def _open_run_stats(self):
+        """Open the statistics file of the selected run."""
+        selected = self.report_tree.selection()
+        if not selected:
+            messagebox.showinfo("No Selection", "Please select a run")
+            return
+        
+        stats_path = self.report_runs[selected[0]].get("stats_path")
+        if not stats_path or not os.path.exists(stats_path):
+            messagebox.showerror("Error", f"Statistics file not found: {stats_path or 'none was written'}")
+            return
+        
+        try:
+            import webbrowser
+            webbrowser.open_new_tab(f"file://{os.path.abspath(stats_path)}")
+        except Exception as e:
+            logger.error(f"Error opening statistics: {str(e)}")
+            messagebox.showerror("Error", f"Failed to open statistics: {str(e)}")
 
 def main():
     """Main function."""
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RingCentral-Zoho CRM Integration - Webhook Receiver
+This script subscribes to RingCentral telephony and voicemail notifications,
+receives them on a local HTTP endpoint and processes each call once it has
+finished, with a periodic reconciliation poll as a backstop for missed events.
+"""
+
+import sys
+import json
+import time
+import queue
+import heapq
+import signal
+import logging
+import argparse
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from common import (
+    RingCentralClient,
+    ZohoClient,
+    SecureStorage,
+    RunInstrumentation,
+    bind_instrumentation,
+    setup_logging
+)
+from outbox import ZohoOutbox
+from coordination import state_db_path
+from lead_assignment import LeadOwnerAllocator
+from metrics import MetricsCollector, MetricsServer
+import missed_calls
+import accepted_calls
+
+TELEPHONY_FILTER = "/restapi/v1.0/account/~/extension/{extension_id}/telephony/sessions"
+VOICEMAIL_FILTER = "/restapi/v1.0/account/~/extension/{extension_id}/voicemail"
+
+# Notifications are a few KB; larger bodies are refused before they are read
+MAX_BODY_BYTES = 1024 * 1024
+
+class WebhookReceiver:
+    """Small HTTP server that validates RingCentral notifications and queues them."""
+    
+    def __init__(self, host="0.0.0.0", port=8080, path="/webhook", verification_token=None):
+        """
+        Initialize the receiver.
+        
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on
+            path (str): URL path notifications are posted to
+            verification_token (str): Token RingCentral must send with each notification
+        """
+        self.path = path
+        self.verification_token = verification_token
+        self.events = queue.Queue()
+        self.logger = logging.getLogger("WebhookReceiver")
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+    
+    @property
+    def port(self):
+        return self.server.server_address[1]
+    
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="webhook-receiver", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Listening for notifications on port {self.port}{self.path}")
+    
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _make_handler(self):
+        receiver = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?")[0] != receiver.path:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                
+                # RingCentral validates a new webhook by expecting its token echoed back
+                validation_token = self.headers.get("Validation-Token")
+                if validation_token:
+                    self.send_response(200)
+                    self.send_header("Validation-Token", validation_token)
+                    self.end_headers()
+                    return
+                
+                if receiver.verification_token and self.headers.get("Verification-Token") != receiver.verification_token:
+                    receiver.logger.warning("Rejected notification with a bad verification token")
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+                
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                if length > MAX_BODY_BYTES:
+                    receiver.logger.warning(f"Rejected notification of {length} bytes")
+                    # The unread body would be parsed as the next request
+                    self.close_connection = True
+                    self.send_response(413)
+                    self.end_headers()
+                    return
+                
+                try:
+                    event = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                
+                receiver.events.put(event)
+                self.send_response(200)
+                self.end_headers()
+            
+            def log_message(self, format, *args):
+                receiver.logger.debug(format % args)
+        
+        return Handler
+
+class CallEventProcessor:
+    """Turns queued notifications into calls processed by the missed and accepted call processors."""
+    
+    def __init__(self, events, rc_client, zoho_client, offices, settle_seconds=60, max_lookups=5,
+                 reconcile_minutes=60, reconcile_hours=2, dry_run=False, debug=False, collector=None,
+                 outbox_path="data/outbox.db"):
+        """
+        Initialize the processor.
+        
+        Args:
+            events (queue.Queue): Notifications from the receiver
+            rc_client (RingCentralClient): RingCentral client
+            zoho_client (ZohoClient): Zoho client
+            offices (dict): Office ID to {"extensions": [...], "lead_owners": [...], "assignment_rules": {...}}
+            settle_seconds (int): Wait after a call ends before looking it up, so voicemail is attached
+            max_lookups (int): Call log lookups before giving up on a session
+            reconcile_minutes (int): Minutes between reconciliation polls, 0 to disable
+            reconcile_hours (int): Hours each reconciliation poll looks back
+            dry_run (bool): Run without making changes to Zoho
+            debug (bool): Enable debug logging
+            collector (MetricsCollector): Optional metrics collector for processed calls and polls
+            outbox_path (str): Outbox database, shared with the polling processors
+        """
+        self.events = events
+        self.rc_client = rc_client
+        self.zoho_client = zoho_client
+        self.settle_seconds = settle_seconds
+        self.max_lookups = max_lookups
+        self.reconcile_interval = reconcile_minutes * 60
+        self.reconcile_hours = reconcile_hours
+        self.dry_run = dry_run
+        self.debug = debug
+        self.collector = collector
+        self.logger = logging.getLogger("CallEventProcessor")
+        
+        self.outbox = ZohoOutbox(outbox_path, debug=debug)
+        self.offices = {}
+        self.extension_offices = {}
+        for office_id, config in offices.items():
+            self.offices[office_id] = {
+                # Events arrive one call at a time, so each pick is reserved on its own
+                "lead_owner_cycle": LeadOwnerAllocator(office_id, config["lead_owners"], config.get("assignment_rules"),
+                                                       persist=not dry_run, block_size=1),
+                "qualifier": accepted_calls.CallQualifier(config["lead_owners"], debug),
+                "missed_stats": collections.defaultdict(int),
+                "accepted_stats": collections.defaultdict(int)
+            }
+            for extension in config["extensions"]:
+                self.extension_offices[str(extension["id"])] = office_id
+        
+        self.pending = []  # Heap of (due_time, telephony_session_id, extension_id, attempt)
+        self.scheduled_sessions = set()
+        self.processed_sessions = collections.OrderedDict()
+        self.next_reconcile = time.time() + self.reconcile_interval if self.reconcile_interval else None
+    
+    def run(self, stop_event):
+        """
+        Process events until stop_event is set.
+        
+        All Zoho writes happen on this thread, so a call is never processed by an
+        event and a reconciliation poll at the same time.
+        """
+        while not stop_event.is_set():
+            try:
+                self.handle_event(self.events.get(timeout=1))
+            except queue.Empty:
+                pass
+            
+            self._process_due_sessions()
+            
+            if self.next_reconcile and time.time() >= self.next_reconcile:
+                self.reconcile()
+                self.next_reconcile = time.time() + self.reconcile_interval
+    
+    def handle_event(self, event):
+        """
+        Handle one RingCentral notification.
+        
+        Args:
+            event (dict): Notification payload
+        """
+        event_filter = event.get("event", "")
+        body = event.get("body", {})
+        
+        if "/telephony/sessions" in event_filter:
+            session_id = body.get("telephonySessionId")
+            for party in body.get("parties", []):
+                extension_id = str(party.get("extensionId", ""))
+                if extension_id not in self.extension_offices:
+                    continue
+                if party.get("status", {}).get("code") == "Disconnected":
+                    self._schedule_session(session_id, extension_id, self.settle_seconds, 1)
+        elif "/voicemail" in event_filter:
+            # Covers sessions whose hang-up notification never arrived
+            extension_id = str(body.get("extensionId", ""))
+            if extension_id in self.extension_offices:
+                self._schedule_session(body.get("telephonySessionId"), extension_id, self.settle_seconds, 1)
+        else:
+            self.logger.debug(f"Ignoring notification for {event_filter}")
+    
+    def reconcile(self):
+        """Run a short polling pass for every office to pick up calls whose events were lost."""
+        self.logger.info(f"Running reconciliation poll for the last {self.reconcile_hours} hours")
+        try:
+            for office_id in self.offices:
+                missed_stats = missed_calls.process_office(office_id, self.reconcile_hours, self.debug, self.dry_run,
+                                                           rc_client=self.rc_client, zoho_client=self.zoho_client)
+                accepted_stats = accepted_calls.process_office(office_id, self.reconcile_hours, self.debug, self.dry_run,
+                                                               rc_client=self.rc_client, zoho_client=self.zoho_client)
+                if self.collector:
+                    self.collector.observe_run("missed_calls", office_id, missed_stats)
+                    self.collector.observe_run("accepted_calls", office_id, accepted_stats)
+        finally:
+            # The processors point this thread's module log records at their own files
+            setup_logging("webhooks", self.debug)
+    
+    def _schedule_session(self, session_id, extension_id, delay, attempt):
+        if not session_id or session_id in self.processed_sessions or session_id in self.scheduled_sessions:
+            return
+        self.scheduled_sessions.add(session_id)
+        heapq.heappush(self.pending, (time.time() + delay, session_id, extension_id, attempt))
+    
+    def _process_due_sessions(self):
+        now = time.time()
+        while self.pending and self.pending[0][0] <= now:
+            _, session_id, extension_id, attempt = heapq.heappop(self.pending)
+            self.scheduled_sessions.discard(session_id)
+            
+            try:
+                records = self.rc_client.get_call_log_for_session(extension_id, session_id)
+            except Exception as e:
+                # e.g. a failed token refresh or an open token circuit; the session is looked up again later
+                self.logger.error(f"Error looking up call log for session {session_id}: {str(e)}")
+                records = None
+            
+            if not records:
+                # Call log records can trail the hang-up notification
+                if attempt < self.max_lookups:
+                    self._schedule_session(session_id, extension_id, self.settle_seconds * attempt, attempt + 1)
+                else:
+                    self.logger.warning(f"No call log for session {session_id}; leaving it to reconciliation")
+                continue
+            
+            office_id = self.extension_offices[extension_id]
+            for call in records:
+                self._process_call(office_id, call)
+            
+            self.processed_sessions[session_id] = True
+            while len(self.processed_sessions) > 10000:
+                self.processed_sessions.popitem(last=False)
+    
+    def _process_call(self, office_id, call):
+        if call.get("direction") != "Inbound" or call.get("type") != "Voice":
+            return
+        
+        office = self.offices[office_id]
+        if call.get("result") == "Missed":
+            processor = "missed_calls"
+        elif call.get("result") == "Accepted":
+            processor = "accepted_calls"
+        else:
+            return
+        
+        # Each call gets its own stats and instrumentation so it can be folded into the metrics
+        call_stats = collections.defaultdict(int)
+        instrumentation = RunInstrumentation()
+        try:
+            with bind_instrumentation(instrumentation):
+                if processor == "missed_calls":
+                    missed_calls.process_call(
+                        call, self.rc_client, self.zoho_client, self.outbox, office_id,
+                        office["lead_owner_cycle"], call_stats, self.dry_run
+                    )
+                else:
+                    accepted_calls.process_call(
+                        call, self.rc_client, self.zoho_client, self.outbox, office["qualifier"], office_id,
+                        office["lead_owner_cycle"], call_stats, self.dry_run
+                    )
+        except Exception as e:
+            self.logger.error(f"Error processing call {call.get('id')}: {str(e)}", exc_info=True)
+            call_stats["errors"] += 1
+        
+        office_stats = office["missed_stats" if processor == "missed_calls" else "accepted_stats"]
+        for key, value in call_stats.items():
+            office_stats[key] += value
+        
+        if self.collector:
+            self.collector.observe_calls(processor, office_id, dict(
+                call_stats,
+                instrumentation=instrumentation.snapshot(),
+                outbox_depth=self.outbox.depth(office_id),
+                rate_limits=dict(self.rc_client.rate_limit_status(), **self.zoho_client.rate_limit_status()),
+                concurrency=dict(self.rc_client.concurrency_status(), **self.zoho_client.concurrency_status()),
+                cache=self.zoho_client.cache.stats()
+            ))
+
+class SubscriptionManager:
+    """Creates and renews the RingCentral webhook subscription for a set of extensions."""
+    
+    def __init__(self, rc_client, address, extension_ids, verification_token=None, expires_in=604800):
+        self.rc_client = rc_client
+        self.address = address
+        self.event_filters = []
+        for extension_id in extension_ids:
+            self.event_filters.append(TELEPHONY_FILTER.format(extension_id=extension_id))
+            self.event_filters.append(VOICEMAIL_FILTER.format(extension_id=extension_id))
+        self.verification_token = verification_token
+        self.expires_in = expires_in
+        self.subscription_id = None
+        self.renew_at = None
+        self.logger = logging.getLogger("SubscriptionManager")
+    
+    def subscribe(self):
+        """Create the subscription."""
+        subscription = self.rc_client.create_subscription(
+            self.event_filters, self.address, self.verification_token, self.expires_in
+        )
+        if not subscription:
+            raise RuntimeError("Failed to create RingCentral webhook subscription")
+        self._track(subscription)
+        self.logger.info(f"Created subscription {self.subscription_id} for {len(self.event_filters)} event filters")
+    
+    def renew_if_due(self):
+        """Renew the subscription once most of its lifetime has passed."""
+        if self.subscription_id and time.time() >= self.renew_at:
+            subscription = self.rc_client.renew_subscription(self.subscription_id)
+            if subscription:
+                self._track(subscription)
+                self.logger.info(f"Renewed subscription {self.subscription_id}")
+            else:
+                self.logger.warning("Subscription renewal failed, creating a new subscription")
+                self.subscribe()
+    
+    def unsubscribe(self):
+        """Delete the subscription."""
+        if self.subscription_id:
+            self.rc_client.delete_subscription(self.subscription_id)
+            self.subscription_id = None
+    
+    def _track(self, subscription):
+        self.subscription_id = subscription["id"]
+        expires_in = subscription.get("expiresIn", self.expires_in)
+        self.renew_at = time.time() + expires_in * 0.8
+
+class LocalEventPublisher:
+    """Stand-in for RingCentral that posts notifications to a local receiver, for testing."""
+    
+    def __init__(self, url, verification_token=None):
+        """
+        Initialize the publisher.
+        
+        Args:
+            url (str): Receiver URL, e.g. http://localhost:8080/webhook
+            verification_token (str): Token to send with each notification
+        """
+        self.url = url
+        self.verification_token = verification_token
+        self.subscription_id = "local-subscription"
+    
+    def validate(self):
+        """
+        Perform the webhook validation handshake.
+        
+        Returns:
+            bool: True if the receiver echoed the validation token
+        """
+        import requests
+        
+        token = f"validation-{time.time()}"
+        response = requests.post(self.url, headers={"Validation-Token": token}, timeout=10)
+        return response.status_code == 200 and response.headers.get("Validation-Token") == token
+    
+    def publish(self, event_filter, body):
+        """
+        Post one notification.
+        
+        Returns:
+            int: HTTP status returned by the receiver
+        """
+        import requests
+        
+        headers = {"Content-Type": "application/json"}
+        if self.verification_token:
+            headers["Verification-Token"] = self.verification_token
+        event = {
+            "uuid": f"{time.time()}",
+            "event": event_filter,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "subscriptionId": self.subscription_id,
+            "body": body
+        }
+        return requests.post(self.url, data=json.dumps(event), headers=headers, timeout=10).status_code
+    
+    def publish_call_ended(self, extension_id, telephony_session_id, missed=True):
+        """Post a telephony session event for a call that has just ended."""
+        return self.publish(TELEPHONY_FILTER.format(extension_id=extension_id), {
+            "telephonySessionId": telephony_session_id,
+            "parties": [{
+                "extensionId": str(extension_id),
+                "direction": "Inbound",
+                "missedCall": missed,
+                "status": {"code": "Disconnected"}
+            }]
+        })
+    
+    def publish_voicemail(self, extension_id, telephony_session_id, message_id):
+        """Post a voicemail event."""
+        return self.publish(VOICEMAIL_FILTER.format(extension_id=extension_id), {
+            "extensionId": str(extension_id),
+            "telephonySessionId": telephony_session_id,
+            "id": message_id
+        })
+
+def parse_webhook_arguments():
+    """Parse command line arguments for the webhook receiver."""
+    parser = argparse.ArgumentParser(description="RingCentral-Zoho CRM Integration Webhook Receiver")
+    parser.add_argument("--public-url", help="Public HTTPS URL RingCentral should post notifications to")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument("--path", default="/webhook", help="URL path for notifications (default: /webhook)")
+    parser.add_argument("--verification-token", help="Token RingCentral must send with notifications")
+    parser.add_argument("--no-subscribe", action="store_true", help="Do not create a RingCentral subscription")
+    parser.add_argument("--office", action="append", help="Only handle this office (may be repeated)")
+    parser.add_argument("--settle-seconds", type=int, default=60, help="Wait after a call ends before processing it")
+    parser.add_argument("--reconcile-minutes", type=int, default=60, help="Minutes between reconciliation polls, 0 to disable")
+    parser.add_argument("--reconcile-hours", type=int, default=2, help="Hours each reconciliation poll looks back")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port at /metrics (default: global metrics.port, off if unset)")
+    parser.add_argument("--dry-run", action="store_true", help="Run without making changes to Zoho")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_webhook_arguments()
+    logger = setup_logging("webhooks", args.debug)
+    
+    if not args.public_url and not args.no_subscribe:
+        print("Error: --public-url is required unless --no-subscribe is given")
+        sys.exit(1)
+    
+    storage = SecureStorage(args.debug)
+    credentials = storage.load_credentials()
+    offices = {}
+    for office in storage.load_office_list():
+        if args.office and office["id"] not in args.office:
+            continue
+        offices[office["id"]] = {
+            "extensions": storage.load_extensions(office["id"]),
+            "lead_owners": storage.load_lead_owners(office["id"]),
+            "assignment_rules": storage.load_assignment_rules(office["id"])
+        }
+    
+    rc_client = RingCentralClient(credentials["ringcentral"], args.debug)
+    global_config = storage.load_global_config()
+    zoho_client = ZohoClient(credentials["zoho"], args.debug,
+                             seed_attachments=global_config.get("attachments", {}).get("seed_existing", False))
+    
+    collector = MetricsCollector()
+    metrics_config = global_config.get("metrics", {})
+    metrics_port = args.metrics_port or metrics_config.get("port")
+    metrics_server = None
+    if metrics_port:
+        metrics_server = MetricsServer(collector, metrics_config.get("host", args.host), int(metrics_port)).start()
+    
+    receiver = WebhookReceiver(args.host, args.port, args.path, args.verification_token)
+    processor = CallEventProcessor(
+        receiver.events, rc_client, zoho_client, offices,
+        settle_seconds=args.settle_seconds,
+        reconcile_minutes=args.reconcile_minutes,
+        reconcile_hours=args.reconcile_hours,
+        dry_run=args.dry_run,
+        debug=args.debug,
+        outbox_path=state_db_path("outbox.db", global_config.get("coordination")),
+        collector=collector
+    )
+    receiver.start()
+    
+    subscriptions = None
+    if not args.no_subscribe:
+        subscriptions = SubscriptionManager(rc_client, args.public_url, processor.extension_offices, args.verification_token)
+        subscriptions.subscribe()
+    
+    stop_event = threading.Event()
+    
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down")
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    
+    if subscriptions:
+        def renew_loop():
+            while not stop_event.wait(60):
+                subscriptions.renew_if_due()
+        threading.Thread(target=renew_loop, name="subscription-renewal", daemon=True).start()
+    
+    # Catch up on anything that happened while the receiver was down
+    if processor.next_reconcile:
+        processor.reconcile()
+    
+    try:
+        processor.run(stop_event)
+    finally:
+        if subscriptions:
+            subscriptions.unsubscribe()
+        receiver.stop()
+        if metrics_server:
+            metrics_server.stop()
+        for office_id, office in processor.offices.items():
+            logger.info(f"Office {office_id} missed call stats: {dict(office['missed_stats'])}")
+            logger.info(f"Office {office_id} accepted call stats: {dict(office['accepted_stats'])}")
+
+if __name__ == "__main__":
+    main()